@@ -22,7 +22,7 @@ setup(
         "Programming Language :: Python :: 3"
     ],
     packages=["talon"],
-    package_data={'': ['*.lark']},
+    package_data={'': ['*.lark'], 'talon': ['benchmarks/*.tal', 'benchmarks/lib/*.tal']},
     install_requires=["lark", "tinted"],
     include_package_data=True,
     entry_points={
@@ -0,0 +1,213 @@
+"""
+Runs many Talon programs on a pool of worker processes.
+
+Workers are started once and keep the parser (and the programs they have
+loaded) warm, so a job only costs running the program. Every job runs in a
+fresh `Interpreter` with its output captured and no input, and gets a
+`Result`. A job that runs for longer than the timeout has its worker killed
+and replaced.
+
+From Python:
+
+    results = batch.run(['scripts/'], jobs=8, timeout=10)
+    print(json.dumps(batch.summary(results)))
+
+From the command line: `tal --batch scripts/ -j 8 --timeout 10`, which
+prints the summary as JSON.
+"""
+import contextlib, io, multiprocessing, os, time, traceback
+from multiprocessing.connection import wait
+from lark import UnexpectedInput
+from . import cache, compiler, talon
+from .interpreter import Interpreter
+
+
+class Result:
+    """What happened when a program was run by `run`."""
+    __slots__ = ('path', 'status', 'exit_code', 'stdout', 'stderr', 'time')
+
+    # Statuses
+    OK = 'ok'
+    ERROR = 'error'
+    TIMEOUT = 'timeout'
+    CRASHED = 'crashed'
+
+    def __init__(self, path, status, exit_code, stdout='', stderr='', time=0.0):
+        self.path = path
+        self.status = status
+        # 0 if the program ran without errors, 1 if it failed and None if
+        # it didn't finish.
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        # Seconds
+        self.time = time
+
+    def __repr__(self):
+        return f'<Result {self.path!r} status={self.status!r} time={self.time:.3f}>'
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def find(paths):
+    """List the Talon programs in files and directories (searched recursively)."""
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(('.tal', '.talc')):
+                    found.append(os.path.join(root, name))
+    return found
+
+
+def error_message(e):
+    if isinstance(e, UnexpectedInput):
+        return f'Syntax error at line {e.line}, column {e.column}'
+    if isinstance(e, SyntaxError):
+        return f'Syntax error: {e}'
+    return f'{e.__class__.__name__}: {e}'
+
+
+def run_job(path, optimize=True):
+    """Run one program in the current process, and get its `Result`."""
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    start = time.perf_counter()
+
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            Interpreter(optimize=optimize, stdout=stdout, stdin=io.StringIO()).run_file(path)
+        except Exception as e:
+            status, exit_code = Result.ERROR, 1
+            print(error_message(e), file=stderr)
+        else:
+            status, exit_code = Result.OK, 0
+
+    return Result(path, status, exit_code, stdout.getvalue(), stderr.getvalue(), time.perf_counter() - start)
+
+
+def worker(connection, optimize, max_depth, cache_settings):
+    compiler.set_max_depth(max_depth)
+    cache.configure(*cache_settings)
+    talon.get_parser()
+
+    while True:
+        path = connection.recv()
+        if path is None:
+            break
+        try:
+            result = run_job(path, optimize)
+        except BaseException:
+            result = Result(path, Result.CRASHED, None, stderr=traceback.format_exc())
+        connection.send(result.to_dict())
+
+
+class Worker:
+    def __init__(self, context, optimize, max_depth):
+        self.connection, child = context.Pipe()
+        cache_settings = (cache.enabled, cache.directory, cache.max_size)
+        self.process = context.Process(target=worker, args=(child, optimize, max_depth, cache_settings), daemon=True)
+        self.process.start()
+        child.close()
+        # (index of the job, path, time it started) while running a job
+        self.job = None
+
+    def start(self, index, path):
+        self.job = (index, path, time.perf_counter())
+        self.connection.send(path)
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+def run(paths, jobs=None, timeout=None, optimize=True, max_depth=None):
+    """
+    Run the Talon programs in `paths` (files or directories) on `jobs`
+    worker processes (by default, one per CPU), stopping any that takes
+    longer than `timeout` seconds. Returns a `Result` for every program, in
+    the order of `find(paths)`.
+    """
+    files = find(paths)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs < 1:
+        raise ValueError('At least one job has to run at a time')
+    if max_depth is None:
+        max_depth = compiler.max_depth
+
+    context = multiprocessing.get_context()
+    results = [None] * len(files)
+    pending = list(enumerate(files))
+    pending.reverse()
+    workers = [Worker(context, optimize, max_depth) for _ in range(min(jobs, len(files)))]
+
+    try:
+        while pending or any(w.job is not None for w in workers):
+            for w in workers:
+                if w.job is None and pending:
+                    w.start(*pending.pop())
+
+            busy = [w for w in workers if w.job is not None]
+            wait_for = None
+            if timeout is not None:
+                now = time.perf_counter()
+                wait_for = max(0, min(w.job[2] + timeout - now for w in busy))
+            ready = wait([w.connection for w in busy], wait_for)
+
+            for i, w in enumerate(workers):
+                if w.job is None:
+                    continue
+                index, path, started = w.job
+
+                if w.connection in ready:
+                    try:
+                        results[index] = Result(**w.connection.recv())
+                        w.job = None
+                        continue
+                    except EOFError:
+                        result = Result(path, Result.CRASHED, None, stderr='The worker process died')
+                elif timeout is not None and time.perf_counter() - started >= timeout:
+                    result = Result(path, Result.TIMEOUT, None, stderr=f'Timed out after {timeout} seconds')
+                else:
+                    continue
+
+                result.time = time.perf_counter() - started
+                results[index] = result
+                w.kill()
+                w.job = None
+                if pending:
+                    workers[i] = Worker(context, optimize, max_depth)
+    finally:
+        for w in workers:
+            w.stop()
+
+    return results
+
+
+def summary(results):
+    """Sum up the results of `run` as a dict that can be turned into JSON."""
+    counts = {status: 0 for status in (Result.OK, Result.ERROR, Result.TIMEOUT, Result.CRASHED)}
+    for result in results:
+        counts[result.status] += 1
+    return {
+        'total': len(results),
+        **counts,
+        'time': sum(result.time for result in results),
+        'results': [result.to_dict() for result in results]
+    }
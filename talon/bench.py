@@ -0,0 +1,241 @@
+"""
+Times the Talon programs in the benchmark suite, to catch changes that make
+the interpreter slower.
+
+Each benchmark is parsed, transformed (and optimized) and run from scratch
+`warmup + repeat` times, and the time of every phase is measured separately.
+The first `warmup` runs aren't counted. A benchmark runs in a fresh
+`Interpreter`, in the directory it is in (so that it can import files next
+to it), with its output thrown away.
+
+    tal bench                          # the whole suite
+    tal bench fib loop -r 20           # some of it
+    tal bench -o new.json              # save the results...
+    tal bench --baseline new.json      # ...and compare against them later
+
+The results saved with `-o` are JSON:
+
+    {
+      "version": "1.2.0",
+      "python": "3.11.4",
+      "warmup": 1,
+      "repeat": 5,
+      "optimize": true,
+      "benchmarks": {
+        "fib": {
+          "parse": {"min": ..., "median": ..., "mean": ...},
+          "transform": {...},
+          "execute": {...},
+          "total": {...}
+        },
+        ...
+      }
+    }
+
+Times are in seconds. Comparisons use the fastest run of each phase, which is
+the least affected by whatever else the machine is doing.
+"""
+import argparse, contextlib, io, json, os, platform, statistics, sys, time
+from . import talon, optimizer
+from .__init__ import __version__
+from .interpreter import Interpreter
+from .profiler import milliseconds
+from .transformer import Transformer
+
+SUITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+PHASES = ('parse', 'transform', 'execute', 'total')
+
+# The times of phases that take a fraction of a millisecond are mostly
+# noise, so a phase only counts as slower than the baseline if it also got
+# slower by at least this many seconds.
+MIN_DIFFERENCE = 0.0005
+
+
+def suite():
+    """The names of the benchmarks in the suite."""
+    return sorted(name[:-4] for name in os.listdir(SUITE) if name.endswith('.tal'))
+
+
+def find(name):
+    """Get the path of a benchmark, from its name in the suite or its path."""
+    if os.path.isfile(name):
+        return name
+    path = os.path.join(SUITE, name if name.endswith('.tal') else name + '.tal')
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'No benchmark named "{name}"')
+    return path
+
+
+@contextlib.contextmanager
+def directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def measure(code, path, optimize=True):
+    """Run a program once, and get the time each phase took."""
+    output = io.StringIO()
+    parser = talon.get_parser()
+
+    start = time.perf_counter()
+    tree = parser.parse(code)
+    parsed = time.perf_counter()
+    program = Transformer().transform(tree)
+    if optimize:
+        program = optimizer.optimize(program)
+    transformed = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        Interpreter(optimize=optimize, stdout=output, stdin=io.StringIO()).execute(program, path)
+    executed = time.perf_counter()
+
+    return {
+        'parse': parsed - start,
+        'transform': transformed - parsed,
+        'execute': executed - transformed,
+        'total': executed - start
+    }
+
+
+def stats(times):
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times)}
+
+
+def run(path, warmup=1, repeat=5, optimize=True):
+    """
+    Time a benchmark. Returns the `min`, `median` and `mean` time of each
+    phase over `repeat` runs.
+    """
+    if repeat < 1:
+        raise ValueError('A benchmark has to be repeated at least once')
+    with open(path, 'r') as f:
+        code = f.read()
+    path = os.path.abspath(path)
+
+    runs = []
+    with directory(os.path.dirname(path)):
+        for i in range(warmup + repeat):
+            times = measure(code, path, optimize)
+            if i >= warmup:
+                runs.append(times)
+
+    return {phase: stats([times[phase] for times in runs]) for phase in PHASES}
+
+
+def run_all(names=None, warmup=1, repeat=5, optimize=True, progress=None):
+    """
+    Time benchmarks (by default, the whole suite), and get the results in
+    the format saved by `tal bench -o`. `progress` is called with the name
+    and results of each benchmark as it finishes.
+    """
+    # The first parse also sets up the parser (compiling the regular
+    # expressions of the lexer...), which would otherwise count as part of
+    # the first benchmark when there are no warmup runs.
+    talon.get_parser().parse('this a = 1\n')
+    results = {}
+    for name in names or suite():
+        path = find(name)
+        key = os.path.splitext(os.path.basename(path))[0]
+        results[key] = run(path, warmup, repeat, optimize)
+        if progress is not None:
+            progress(key, results[key])
+
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'warmup': warmup,
+        'repeat': repeat,
+        'optimize': optimize,
+        'benchmarks': results
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare results against a baseline. Returns a list of
+    `(benchmark, phase, old time, new time, change)`, where `change` is the
+    ratio of the new time to the old one, minus one, and a list of the ones
+    that got slower by more than `threshold` (and `MIN_DIFFERENCE`).
+    """
+    changes = []
+    for name, phases in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            continue
+        for phase in PHASES:
+            if phase not in old:
+                continue
+            before, after = old[phase]['min'], phases[phase]['min']
+            change = after / before - 1 if before else 0.0
+            changes.append((name, phase, before, after, change))
+
+    slower = [change for change in changes if slower_than(change, threshold)]
+    return changes, slower
+
+
+def slower_than(change, threshold):
+    name, phase, before, after, ratio = change
+    return ratio > threshold and after - before > MIN_DIFFERENCE
+
+
+def print_result(name, result):
+    print(f'{name:<12}' + ''.join(milliseconds(result[phase]['min'], 10, 2) for phase in PHASES))
+
+
+def print_comparison(changes, threshold):
+    print(f'\n{"benchmark":<12}{"phase":<10}{"before":>10}{"after":>10}{"change":>9}')
+    for name, phase, before, after, change in changes:
+        mark = '  slower' if slower_than((name, phase, before, after, change), threshold) else ''
+        print(f'{name:<12}{phase:<10}{milliseconds(before, 10, 2)}{milliseconds(after, 10, 2)}{change:+9.1%}{mark}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tal bench', description='Time the Talon benchmark suite.')
+    parser.add_argument(
+        'benchmarks', nargs='*', metavar='benchmark',
+        help=f'names of benchmarks in the suite ({", ".join(suite())}) or paths of .tal files (default: the whole suite)'
+    )
+    parser.add_argument('-w', '--warmup', type=int, default=1, metavar='N', help='runs not counted, before the timed ones (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, metavar='N', help='timed runs of each benchmark (default: %(default)s)')
+    parser.add_argument('-o', '--output', metavar='results.json', help='save the results as JSON')
+    parser.add_argument('--baseline', metavar='results.json', help='compare against results saved with -o')
+    parser.add_argument(
+        '--threshold', type=float, default=10, metavar='PERCENT',
+        help='how much slower than the baseline a phase can get before it counts as a regression (default: %(default)s)'
+    )
+    parser.add_argument('--no-optimize', action='store_true', help="don't run the optimizer")
+    args = parser.parse_args(argv)
+
+    if args.warmup < 0:
+        parser.error('--warmup can\'t be negative')
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    try:
+        paths = [find(name) for name in args.benchmarks]
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    print(f'{"(ms, fastest)":<12}' + ''.join(f'{phase:>10}' for phase in PHASES))
+    results = run_all(paths, args.warmup, args.repeat, not args.no_optimize, print_result)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        threshold = args.threshold / 100
+        changes, slower = compare(results, baseline, threshold)
+        print_comparison(changes, threshold)
+        if slower:
+            print(f'\n{len(slower)} of {len(changes)} timings are more than {args.threshold:g}% slower than the baseline')
+            sys.exit(1)
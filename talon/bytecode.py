@@ -0,0 +1,482 @@
+"""
+Compiles the tree made by the transformer into bytecode, which is what
+`.talc` files hold (see `talc.py`) and what the VM runs (see `vm.py`).
+
+A `Code` object is a function, or the top level of a program, compiled to a
+flat array of instructions, each one being an opcode followed by a single
+integer argument. The arguments refer to the constants of the code (its
+constant pool), the names of the global variables it uses, the variables of
+enclosing functions it uses ("cells"), or slots of its frame, which are laid
+out by the resolver (see `resolver.py`). Functions are compiled to code
+objects of their own, kept in the constants of the code that makes them.
+
+Instructions work on a stack of values. Jumps only ever come from an `if`, a
+loop, a `break`, `&&` or `||`, and each of these has opcodes of its own
+(`IF` and `ELSE`, `LOOP`, `WHILE` and `CONTINUE`...), so the blocks of the
+source code can be found again in the instructions.
+"""
+from array import array
+from . import nodes, resolver
+from .compiler import STATEMENTS
+from .operators import BINARY_OPS, UNARY_OPS, ASSIGN_OPS
+from .symbols import UNDEFINED
+
+# Operators are referred to by their position in these tables.
+BINARY_NAMES = tuple(BINARY_OPS)
+UNARY_NAMES = tuple(UNARY_OPS)
+ASSIGN_NAMES = tuple(ASSIGN_OPS)
+
+# Opcodes
+LOAD_CONST = 0          # push constants[arg]
+LOAD_GLOBAL = 1         # push the value of the global variable names[arg]
+LOAD_FAST = 2           # push the value of slot arg of the frame
+LOAD_DEREF = 3          # push the value of the variable of an enclosing function described by cells[arg]
+STORE_GLOBAL = 4        # pop a value into the existing global variable names[arg]
+DECLARE_GLOBAL = 5      # pop a value into the new global variable names[arg]
+STORE_FAST = 6          # pop a value into the existing variable in slot arg of the frame
+DECLARE_FAST = 7        # pop a value into the new variable in slot arg of the frame
+STORE_DEREF = 8         # pop a value into the variable of an enclosing function described by cells[arg]
+LOAD_ATTR = 9           # replace the top (a module) with its variable named constants[arg]
+BINARY = 10             # pop b, pop a, push a op b, where op is BINARY_NAMES[arg]
+UNARY = 11              # replace the top with op top, where op is UNARY_NAMES[arg]
+INPLACE = 12            # pop b, pop a, push a op b, where op is ASSIGN_NAMES[arg]
+INDEX = 13              # pop index, pop list, push list[index]
+PEEK_INDEX = 14         # push list[index], for the list and index on top
+STORE_INDEX = 15        # pop value, pop index, pop list, set list[index] = value
+INPLACE_INDEX = 16      # pop value, pop old, pop index, pop list, set list[index] = old op value (op is ASSIGN_NAMES[arg])
+SLICE = 17              # pop end if arg & 2, pop start if arg & 1, replace the top (a list) with the slice
+BUILD_LIST = 18         # pop arg values and push them as a list
+BUILD_DICT = 19         # pop arg keys and values (key first) and push them as a dict
+BUILD_SET = 20          # pop arg values and push them as a set
+BUILD_RANGE = 21        # pop end, pop start, push a range (inclusive if arg is 1)
+MAKE_FUNCTION = 22      # push a function running the code in constants[arg]
+CALL = 23               # pop arg arguments, pop a function, push its result
+TAIL_CALL = 24          # pop arg arguments, pop a function, return its result (reusing the current call)
+RETURN = 25             # pop a value and return it
+POP = 26                # pop a value
+IF = 27                 # pop a value and jump to arg if it is falsy
+ELSE = 28               # jump to arg, the end of the `else` that follows
+LOOP = 29               # nothing: the start of a `while` loop ending at arg
+WHILE = 30              # pop a value and jump to arg (leaving the loop) if it is falsy
+GET_ITER = 31           # replace the top with an iterator over it
+FOR_ITER = 32           # push the next value of the iterator on top, or pop it and jump to arg (leaving the loop)
+CONTINUE = 33           # jump back to arg, the `LOOP` or `FOR_ITER` of the loop
+BREAK = 34              # jump to arg, the end of the loop (a `for` pops its iterator first)
+AND = 35                # jump to arg if the top is falsy, otherwise pop it
+OR = 36                 # jump to arg if the top is truthy, otherwise pop it
+
+OPNAMES = (
+    'LOAD_CONST', 'LOAD_GLOBAL', 'LOAD_FAST', 'LOAD_DEREF', 'STORE_GLOBAL', 'DECLARE_GLOBAL',
+    'STORE_FAST', 'DECLARE_FAST', 'STORE_DEREF', 'LOAD_ATTR', 'BINARY', 'UNARY', 'INPLACE', 'INDEX',
+    'PEEK_INDEX', 'STORE_INDEX', 'INPLACE_INDEX', 'SLICE', 'BUILD_LIST', 'BUILD_DICT', 'BUILD_SET',
+    'BUILD_RANGE', 'MAKE_FUNCTION', 'CALL', 'TAIL_CALL', 'RETURN', 'POP', 'IF', 'ELSE', 'LOOP', 'WHILE',
+    'GET_ITER', 'FOR_ITER', 'CONTINUE', 'BREAK', 'AND', 'OR'
+)
+
+
+class Position:
+    """Where an operator is in the source code, for the type errors it raises."""
+    __slots__ = ('line', 'column')
+
+    def __init__(self, line, column):
+        self.line = line
+        self.column = column
+
+
+class Code:
+    """
+    Compiled code. The code objects of functions loaded from a `.talc` file
+    are decoded lazily: until one of them is first used, it only knows how
+    many parameters and other local variables the function has.
+    """
+
+    def __init__(self, name, params, size, varnames, instructions, constants, names, cells, positions):
+        self.name = name
+        self.params = params
+        # The size of the frames of the function (without the call depth at
+        # the end) and the names of their slots. The top level of a program
+        # has no slots.
+        self.size = size
+        self.varnames = varnames
+        self.instructions = instructions
+        self.constants = constants
+        self.names = names
+        # (depth, slot, name) of the variables of enclosing functions.
+        self.cells = cells
+        # pc -> `Position` of the operators that have one.
+        self.positions = positions
+
+        self.arity = len(params)
+        self.padding = (UNDEFINED,) * (size - 1 - self.arity)
+        # Made by the VM the first time the code runs, see `vm.link`.
+        self.factory = None
+
+    @classmethod
+    def lazy(cls, image, index, arity, padding):
+        """
+        The code object of a function at `index` in a `talc.Image`, with
+        `arity` parameters and `padding` other local variables, decoded
+        when it is first used.
+        """
+        self = cls.__new__(cls)
+        self._image = image
+        self._index = index
+        self.arity = arity
+        self.padding = (UNDEFINED,) * padding
+        return self
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, so decoded code objects are
+        # as fast as any other.
+        image = self.__dict__.get('_image')
+        if image is None:
+            try:
+                # Decoded in the meantime by another thread
+                return self.__dict__[name]
+            except KeyError:
+                raise AttributeError(name) from None
+
+        self.__dict__.update(vars(image.code(self.__dict__['_index'])))
+        self._image = None
+        return getattr(self, name)
+
+    def __repr__(self):
+        return f'<Code {self.name} params={self.arity!r} instructions={len(self.instructions) // 2!r}>'
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.instructions), 2):
+            op, arg = self.instructions[pc], self.instructions[pc + 1]
+            lines.append(f'{pc:>6} {OPNAMES[op]:<16}{arg}')
+        return '\n'.join(lines)
+
+    def to_record(self, index):
+        """
+        The attributes of the code object as values that can be marshalled:
+        the instructions and positions as bytes, and the code objects of
+        functions in the constants as `(index, arity, padding)`, where
+        `index(code)` gives their index.
+        """
+        positions = array('i')
+        for pc, position in self.positions.items():
+            positions.extend((pc, position.line, position.column))
+        return (
+            self.name,
+            tuple(self.params),
+            self.size,
+            tuple(self.varnames),
+            array('i', self.instructions).tobytes(),
+            tuple(
+                (index(constant), constant.arity, len(constant.padding)) if isinstance(constant, Code) else constant
+                for constant in self.constants
+            ),
+            tuple(self.names),
+            tuple(self.cells),
+            positions.tobytes()
+        )
+
+    @classmethod
+    def from_record(cls, record, code):
+        """
+        Make a code object from the values made by `to_record`, where
+        `code(index, arity, padding)` makes the code objects of functions.
+        """
+        name, params, size, varnames, instructions, constants, names, cells, positions = record
+        positions = array('i', positions)
+        return cls(
+            name,
+            params,
+            size,
+            varnames,
+            array('i', instructions).tolist(),
+            # Talon has no tuple values, so a tuple in the constants is
+            # always a code object.
+            [code(*constant) if isinstance(constant, tuple) else constant for constant in constants],
+            names,
+            cells,
+            {positions[i]: Position(positions[i + 1], positions[i + 2]) for i in range(0, len(positions), 3)}
+        )
+
+
+class Loop:
+    def __init__(self, start, iterates):
+        self.start = start
+        # `for` loops keep their iterator on the stack, which has to be
+        # popped when breaking out of them.
+        self.iterates = iterates
+        self.breaks = []
+
+
+class Compiler:
+    def __init__(self, name='<main>', params=(), size=0, varnames=(), function=False):
+        self.name = name
+        # Tail calls are only made inside functions.
+        self.function = function
+        self.params = params
+        self.size = size
+        self.varnames = varnames
+        self.instructions = []
+        self.constants = []
+        self.names = []
+        self.cells = []
+        self.positions = {}
+        self.loops = []
+        self.__constant_index = {}
+        self.__name_index = {}
+        self.__cell_index = {}
+
+    # Helpers
+
+    def emit(self, op, arg=0):
+        self.instructions.extend((op, arg))
+        return len(self.instructions) - 1
+
+    def label(self):
+        return len(self.instructions)
+
+    def patch(self, position, target=None):
+        self.instructions[position] = self.label() if target is None else target
+
+    def position(self, node):
+        # Of the instruction just emitted
+        if node.line is not None:
+            self.positions[len(self.instructions) - 2] = Position(node.line, node.column)
+
+    def constant(self, value):
+        # Keep 1 and True (and 1.0) apart, they are equal as dict keys.
+        key = (value.__class__, value)
+        if isinstance(value, Code) or key not in self.__constant_index:
+            self.constants.append(value)
+            if not isinstance(value, Code):
+                self.__constant_index[key] = len(self.constants) - 1
+            return len(self.constants) - 1
+        return self.__constant_index[key]
+
+    def name_index(self, name):
+        if name not in self.__name_index:
+            self.names.append(name)
+            self.__name_index[name] = len(self.names) - 1
+        return self.__name_index[name]
+
+    def cell_index(self, identifier):
+        key = (identifier.depth, identifier.slot)
+        if key not in self.__cell_index:
+            self.cells.append((identifier.depth, identifier.slot, identifier.name))
+            self.__cell_index[key] = len(self.cells) - 1
+        return self.__cell_index[key]
+
+    def load(self, identifier):
+        if identifier.depth is None:
+            self.emit(LOAD_GLOBAL, self.name_index(identifier.name))
+        elif identifier.depth == 0:
+            self.emit(LOAD_FAST, identifier.slot)
+        else:
+            self.emit(LOAD_DEREF, self.cell_index(identifier))
+
+    def store(self, identifier, new=False):
+        if identifier.depth is None:
+            self.emit(DECLARE_GLOBAL if new else STORE_GLOBAL, self.name_index(identifier.name))
+        elif identifier.depth == 0:
+            self.emit(DECLARE_FAST if new else STORE_FAST, identifier.slot)
+        else:
+            # Only variables of the current function can be declared.
+            self.emit(STORE_DEREF, self.cell_index(identifier))
+
+    def code(self):
+        return Code(
+            self.name, tuple(self.params), self.size, tuple(self.varnames), self.instructions,
+            self.constants, tuple(self.names), tuple(self.cells), self.positions
+        )
+
+    # Statements
+
+    def block(self, instructions):
+        for node in nodes.branch(instructions):
+            self.statement(node)
+
+    def statement(self, node):
+        self.compile(node)
+        if not isinstance(node, STATEMENTS):
+            self.emit(POP)
+
+    def compile(self, node):
+        getattr(self, 'compile_' + node.__class__.__name__)(node)
+
+    def compile_Assignment(self, node):
+        if isinstance(node.value, nodes.Function) and node.value.name is None:
+            node.value.name = node.identifier.name
+        self.compile(node.value)
+        self.store(node.identifier, node.new)
+
+    def compile_CompOp(self, node):
+        self.load(node.identifier)
+        self.compile(node.value)
+        self.emit(INPLACE, ASSIGN_NAMES.index(node.op))
+        self.position(node)
+        self.store(node.identifier)
+
+    def compile_ListAssign(self, node):
+        self.compile(node.list)
+        self.compile(node.index)
+        if node.op == '=':
+            self.compile(node.value)
+            self.emit(STORE_INDEX)
+        else:
+            # The item is read before the value is worked out.
+            self.emit(PEEK_INDEX)
+            self.compile(node.value)
+            self.emit(INPLACE_INDEX, ASSIGN_NAMES.index(node.op))
+
+    def compile_If(self, node):
+        self.compile(node.condition)
+        jump_false = self.emit(IF)
+        self.block(node.true_branch)
+
+        if node.false_branch is None:
+            self.patch(jump_false)
+        else:
+            jump_end = self.emit(ELSE)
+            self.patch(jump_false)
+            self.block(node.false_branch)
+            self.patch(jump_end)
+
+    def compile_While(self, node):
+        start = self.label()
+        loop_end = self.emit(LOOP)
+        self.compile(node.condition)
+        jump_end = self.emit(WHILE)
+
+        self.loops.append(Loop(start, False))
+        self.block(node.body)
+        self.emit(CONTINUE, start)
+        loop = self.loops.pop()
+
+        for position in (loop_end, jump_end, *loop.breaks):
+            self.patch(position)
+
+    def compile_For(self, node):
+        self.compile(node.sequence)
+        self.emit(GET_ITER)
+        start = self.label()
+        jump_end = self.emit(FOR_ITER)
+        self.store(node.var)
+
+        self.loops.append(Loop(start, True))
+        self.block(node.body)
+        self.emit(CONTINUE, start)
+        loop = self.loops.pop()
+
+        for position in (jump_end, *loop.breaks):
+            self.patch(position)
+
+    def compile_BreakInstruction(self, node):
+        if not self.loops:
+            # Breaking outside of a loop leaves the function (or the program).
+            self.emit(LOAD_CONST, self.constant(None))
+            self.emit(RETURN)
+            return
+
+        loop = self.loops[-1]
+        if loop.iterates:
+            self.emit(POP)
+        loop.breaks.append(self.emit(BREAK))
+
+    def compile_ReturnInstruction(self, node):
+        if node.expression is None:
+            self.emit(LOAD_CONST, self.constant(None))
+        elif self.function and isinstance(node.expression, nodes.FunctionCall):
+            self.compile_FunctionCall(node.expression, TAIL_CALL)
+            return
+        else:
+            self.compile(node.expression)
+        self.emit(RETURN)
+
+    # Expressions
+
+    def compile_Primitive(self, node):
+        self.emit(LOAD_CONST, self.constant(node.value))
+
+    def compile_Identifier(self, node):
+        self.load(node)
+
+    def compile_List(self, node):
+        for value in node.values:
+            self.compile(value)
+        self.emit(BUILD_LIST, len(node.values))
+
+    def compile_Dict(self, node):
+        for key, value in zip(node.keys, node.values):
+            self.compile(key)
+            self.compile(value)
+        self.emit(BUILD_DICT, len(node.keys))
+
+    def compile_Set(self, node):
+        for value in node.values:
+            self.compile(value)
+        self.emit(BUILD_SET, len(node.values))
+
+    def compile_Attribute(self, node):
+        self.compile(node.value)
+        self.emit(LOAD_ATTR, self.constant(node.name))
+
+    def compile_ListAccess(self, node):
+        self.compile(node.list)
+        self.compile(node.index)
+        self.emit(INDEX)
+
+    def compile_ListSlice(self, node):
+        self.compile(node.list)
+        flags = 0
+        if node.start is not None:
+            self.compile(node.start)
+            flags |= 1
+        if node.end is not None:
+            self.compile(node.end)
+            flags |= 2
+        self.emit(SLICE, flags)
+
+    def compile_Range(self, node):
+        self.compile(node.start)
+        self.compile(node.end)
+        self.emit(BUILD_RANGE, int(node.inclusive))
+
+    def compile_Logical(self, node):
+        self.compile(node.left)
+        jump = self.emit(AND if node.op == '&&' else OR)
+        self.compile(node.right)
+        self.patch(jump)
+
+    def compile_BinOp(self, node):
+        self.compile(node.left)
+        self.compile(node.right)
+        self.emit(BINARY, BINARY_NAMES.index(node.op))
+        self.position(node)
+
+    compile_Arithmetic = compile_Comparison = compile_BinOp
+
+    def compile_UnaryOp(self, node):
+        self.compile(node.value)
+        self.emit(UNARY, UNARY_NAMES.index(node.op))
+
+    def compile_Function(self, node):
+        params = [param.name for param in node.params]
+        compiler = Compiler(node.name or '<lambda>', params, node.size, node.names, function=True)
+        compiler.block(node.body)
+        compiler.emit(LOAD_CONST, compiler.constant(None))
+        compiler.emit(RETURN)
+        self.emit(MAKE_FUNCTION, self.constant(compiler.code()))
+
+    def compile_FunctionCall(self, node, op=CALL):
+        self.compile(node.value)
+        for param in node.params:
+            self.compile(param)
+        self.emit(op, len(node.params))
+
+
+def compile(instructions):
+    """Compile a program (a tree made by `talon.load`) into a `Code` object."""
+    compiler = Compiler()
+    compiler.block(resolver.resolve(instructions))
+    compiler.emit(LOAD_CONST, compiler.constant(None))
+    compiler.emit(RETURN)
+    return compiler.code()
@@ -0,0 +1,132 @@
+"""
+Keeps the programs made from `.tal` files on disk, so that running an
+unchanged file again doesn't parse it again.
+
+The program is compiled to bytecode (see `bytecode.py`) and stored as a
+`.talc` file (see `talc.py`) named after a hash of the source code, the
+grammar, the version of Talon, the version of the `.talc` format and whether
+it was optimized, so a file that changed, or one used with another version
+of Talon, is simply not found. A file in the cache that can't be loaded
+anyway (damaged, or of another format version) is made again.
+
+When the cache gets bigger than its maximum size, the files used the
+longest time ago are deleted. The cache lives in `$TALON_CACHE_DIR`,
+`$XDG_CACHE_HOME/talon` or `~/.cache/talon`, see `configure`. Anything going
+wrong with it (a directory that can't be written to, a damaged file...) just
+makes Talon parse the file as if there was no cache.
+"""
+import hashlib, os, threading
+from . import bytecode, talc, talon
+from .__init__ import __version__
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+enabled = True
+directory = None
+max_size = DEFAULT_MAX_SIZE
+
+_grammar_hash = None
+_lock = threading.Lock()
+
+
+def default_directory():
+    if os.environ.get('TALON_CACHE_DIR'):
+        return os.environ['TALON_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'talon')
+
+
+def configure(enable=True, path=None, size=None):
+    """
+    Turn the cache on or off, and set its directory and maximum size in
+    bytes (by default, see the top of this file and `DEFAULT_MAX_SIZE`).
+    """
+    global enabled, directory, max_size
+    if size is not None and size < 0:
+        raise ValueError('The maximum size of the cache can\'t be negative')
+    enabled = enable
+    directory = path
+    max_size = DEFAULT_MAX_SIZE if size is None else size
+
+
+def grammar_hash():
+    global _grammar_hash
+    if _grammar_hash is None:
+        with open(talon.GRAMMAR, 'rb') as f:
+            _grammar_hash = hashlib.sha256(f.read()).hexdigest()
+    return _grammar_hash
+
+
+def key(code, optimize):
+    """The name of the file of a program in the cache."""
+    digest = hashlib.sha256()
+    for part in (__version__, str(talc.VERSION), grammar_hash(), str(optimize)):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(code.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest() + '.talc'
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        program = talc.load(f)
+    try:
+        # Used just now, as far as eviction goes
+        os.utime(path)
+    except OSError:
+        pass
+    return program
+
+
+def evict(path):
+    """Delete the files used the longest time ago until the cache fits in `max_size`."""
+    files = []
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.talc'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+
+    files.sort()
+    for _, size, file in files:
+        if total <= max_size:
+            break
+        try:
+            os.remove(file)
+        except OSError:
+            continue
+        total -= size
+
+
+def load(code, optimize=True):
+    """
+    Get the bytecode of Talon source code (see `talon.load` and
+    `bytecode.compile`), from the cache if it is there. Programs that
+    aren't are added to it.
+    """
+    if not enabled:
+        return bytecode.compile(talon.load(code, optimize))
+
+    path = directory or default_directory()
+    file = os.path.join(path, key(code, optimize))
+    try:
+        return read(file)
+    except (OSError, ValueError):
+        # Not in the cache, or damaged
+        pass
+
+    program = bytecode.compile(talon.load(code, optimize))
+    try:
+        os.makedirs(path, exist_ok=True)
+        talc.write(program, file)
+        with _lock:
+            evict(path)
+    except OSError:
+        pass
+    return program
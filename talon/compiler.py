@@ -0,0 +1,1021 @@
+"""
+Compiles the tree made by the transformer into a tree of Python closures.
+
+Everything that can be worked out before running the code (which operator a
+`BinOp` uses, which branch of an `If` exists, the name of an identifier...)
+is resolved once here, so running a closure only does the work that actually
+depends on runtime values.
+
+Every closure takes the frame of the function call it runs in; see
+`resolver.py`. After the slots, the last item of a frame is how deeply the
+call is nested. The top level of a program runs in a frame that only holds
+that depth. Expressions compile to closures that return their value.
+Statements compile to closures that return None to keep going, `BREAK` to
+leave the enclosing loop, or a 1-tuple holding the value of a `ret`.
+
+A `ret` of a function call inside a function is a tail call: instead of
+making the call, it returns a `TailCall` for the caller to run once the
+returning function is gone, in a frame of the same depth. Other calls nest,
+up to `max_depth` of them, including the calls made by builtins (`memo`,
+`pmap`...): before calling anything else than a compiled function, the
+depth of the caller is kept in `calls`, where `Closure.__call__` carries on
+from. Programs run on a thread whose stack is big enough for all of them,
+see `run`.
+"""
+import contextvars, sys, threading
+from . import nodes, resolver
+from .errors import SymbolNotFound, SymbolExists, CallDepthExceeded
+from .operators import BINARY_OPS, UNARY_OPS, ASSIGN_OPS, operand_error
+from .symbols import UNDEFINED
+from .values import Range, Module
+
+BREAK = object()
+
+# How deeply calls of Talon functions can be nested, see `set_max_depth`.
+# Tail calls don't count.
+max_depth = 5000
+# The most `set_max_depth` allows, which keeps the stacks of the threads
+# running Talon code (see `start`) under 257 MB.
+MAX_DEPTH = 65536
+# A generous guess of how many Python frames a nested Talon call takes, so
+# that Python's recursion limit can be kept above `max_depth`.
+PYTHON_FRAMES_PER_CALL = 20
+# A generous guess of how much of the C stack a nested Talon call can take,
+# in bytes. Only calls made through builtins (`memo`, `pmap`...) take any,
+# about 2 KB each.
+STACK_PER_CALL = 4 * 1024
+# The stack the threads running Talon code need besides their nested calls
+STACK_BASE = 1024 * 1024
+
+# Statements whose closures never return a value. Any other statement is an
+# expression whose value has to be thrown away.
+STATEMENTS = (
+    nodes.Assignment, nodes.CompOp, nodes.ListAssign, nodes.If,
+    nodes.For, nodes.While, nodes.ExitInstruction
+)
+
+
+def exits(instructions, breaks=True):
+    """Whether running the instructions can leave the enclosing block early."""
+    for node in instructions:
+        if isinstance(node, nodes.ReturnInstruction):
+            return True
+        elif isinstance(node, nodes.BreakInstruction):
+            if breaks:
+                return True
+        elif isinstance(node, nodes.If):
+            if exits(nodes.branch(node.true_branch), breaks) or exits(nodes.branch(node.false_branch), breaks):
+                return True
+        elif isinstance(node, (nodes.For, nodes.While)):
+            # Loops stop a `break`, but not a `ret`.
+            if exits(node.body, False):
+                return True
+    return False
+
+
+def not_found(name):
+    return SymbolNotFound(f'Symbol "{name}" not found')
+
+
+def exists(name):
+    return SymbolExists(f'Cannot recreate variable "{name}"')
+
+
+def too_deep():
+    return CallDepthExceeded(f'Maximum call depth of {max_depth} exceeded')
+
+
+def get_attribute(value, name):
+    if value.__class__ is not Module:
+        raise TypeError(f'{value!r} has no attribute "{name}"')
+    return value.get(name)
+
+
+def set_max_depth(limit):
+    """Set how deeply calls of Talon functions can be nested."""
+    global max_depth
+    if limit < 1:
+        raise ValueError('The maximum call depth must be at least 1')
+    if limit > MAX_DEPTH:
+        raise ValueError(f'The maximum call depth can be at most {MAX_DEPTH}')
+    max_depth = limit
+
+
+class TailCall:
+    """A call that the body of a function leaves for its caller to make."""
+    __slots__ = ('body', 'frame')
+
+    def __init__(self, body, frame):
+        self.body = body
+        self.frame = frame
+
+
+class Calls(threading.local):
+    # How deeply the innermost call of a Talon function running in the
+    # thread is nested, as far as calls made from Python go.
+    depth = 0
+    # Whether the thread was started by `start`, with a stack big enough
+    # for Talon code.
+    sized = False
+
+
+calls = Calls()
+
+_threads_lock = threading.Lock()
+# How many threads started by `start` are running, and the recursion limit
+# from before the first one started
+_threads = 0
+_recursion_limit = None
+
+
+def recursion_limit():
+    return max_depth * PYTHON_FRAMES_PER_CALL
+
+
+def stack_size():
+    return STACK_BASE + max_depth * STACK_PER_CALL
+
+
+def start(function, *args, name=None, daemon=False):
+    """
+    Start a thread calling `function(*args)` (in a copy of the current
+    context), with a stack big enough for `max_depth` nested calls: about
+    20 MB at the default depth, and at most 257 MB. Calls in the thread
+    nest in the call starting it.
+
+    Python's recursion limit is the same for every thread, so it is raised
+    for the whole process (to `PYTHON_FRAMES_PER_CALL` frames per nested
+    call) while such threads run, and put back once they are all done.
+    The stack size of new threads is also set for the whole process while
+    the thread starts, so a thread that another one starts at the same
+    moment can get a stack that big too.
+    """
+    global _threads, _recursion_limit
+    context = contextvars.copy_context()
+    limit = recursion_limit()
+    depth = calls.depth
+
+    def run():
+        global _threads
+        calls.sized = True
+        calls.depth = depth
+        try:
+            context.run(function, *args)
+        finally:
+            with _threads_lock:
+                _threads -= 1
+                if _threads == 0:
+                    sys.setrecursionlimit(_recursion_limit)
+
+    thread = threading.Thread(target=run, name=name, daemon=daemon)
+    with _threads_lock:
+        if _threads == 0:
+            _recursion_limit = sys.getrecursionlimit()
+        _threads += 1
+        if sys.getrecursionlimit() < limit:
+            sys.setrecursionlimit(limit)
+        previous = threading.stack_size(stack_size())
+        try:
+            thread.start()
+        except BaseException as e:
+            _threads -= 1
+            if _threads == 0:
+                sys.setrecursionlimit(_recursion_limit)
+            if isinstance(e, RuntimeError):
+                raise RuntimeError(f'Can\'t make a stack big enough for a maximum call depth of {max_depth}') from None
+            raise
+        finally:
+            threading.stack_size(previous)
+    return thread
+
+
+def run(function):
+    """
+    Call `function`, which runs Talon code, on a thread made by `start`
+    (unless it is called from one already), and return its result.
+    """
+    if calls.sized:
+        return function()
+
+    outcome = []
+
+    def call():
+        try:
+            outcome.append((True, function()))
+        except BaseException as e:
+            outcome.append((False, e))
+
+    # A daemon, so that stopping the process (with Ctrl+C...) doesn't wait
+    # for the program.
+    start(call, name='talon', daemon=True).join()
+    ok, value = outcome[0]
+    if not ok:
+        raise value
+    return value
+
+
+class Closure(nodes.CallableExpr):
+    """A compiled Talon function, along with the frame it was created in."""
+    __slots__ = ('arity', 'padding', 'body', 'env')
+
+    def __init__(self, arity, padding, body, env):
+        self.arity = arity
+        # The initial values of the local variables that aren't parameters.
+        self.padding = padding
+        # Unlike a block, the body returns the return value of the function.
+        self.body = body
+        self.env = env
+
+    def __repr__(self):
+        return f'<Function params={self.arity!r}>'
+
+    def __call__(self, *args):
+        if len(args) != self.arity:
+            raise NameError(f'Invalid amount of args for "{self!r}". Got {len(args)}, expected {self.arity}')
+        if not calls.sized:
+            # Called from Python code of its own (not a builtin called by
+            # Talon code), on a thread whose stack is too small for it
+            return run(lambda: self(*args))
+        # Calls from Python nest in the call that made them, if any.
+        outer = calls.depth
+        if outer >= max_depth:
+            raise too_deep()
+        try:
+            result = self.body([self.env, *args, *self.padding, outer + 1])
+            while result.__class__ is TailCall:
+                result = result.body(result.frame)
+            return result
+        finally:
+            calls.depth = outer
+
+
+class LazyClosure(Closure):
+    """
+    A function whose body isn't compiled yet: `body` compiles it. The first
+    call compiles it and turns the function into a plain `Closure`.
+    """
+    __slots__ = ()
+    lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            # Unless another thread got there first
+            if self.__class__ is LazyClosure:
+                self.body = self.body()
+                self.__class__ = Closure
+        return Closure.__call__(self, *args)
+
+
+class Compiler:
+    def __init__(self, symbols, profiler=None):
+        # The global variables of the code.
+        self.symbols = symbols
+        # A `profiler.Profiler` timing the statements and functions of the
+        # code, if any.
+        self.profiler = profiler
+        # Whether the code being compiled is inside a function, where `ret`
+        # can make tail calls.
+        self.function = False
+
+    def compile(self, node):
+        return getattr(self, 'compile_' + node.__class__.__name__)(node)
+
+    def statement(self, node, discard=False):
+        compiled = self.compile(node)
+
+        if discard and not isinstance(node, STATEMENTS):
+            def statement(frame):
+                compiled(frame)
+        else:
+            statement = compiled
+
+        if self.profiler is not None:
+            return self.profiler.statement(statement, node)
+        return statement
+
+    def block(self, instructions):
+        if not isinstance(instructions, nodes.Instructions):
+            # `else if`
+            return self.compile(instructions)
+
+        exiting = exits(instructions)
+        statements = tuple(self.statement(node, discard=exiting) for node in instructions)
+
+        if len(statements) == 0:
+            def empty(frame):
+                return None
+            return empty
+
+        if len(statements) == 1 and (exiting or isinstance(instructions.children[0], STATEMENTS)):
+            return statements[0]
+
+        if exiting:
+            def block(frame):
+                for statement in statements:
+                    result = statement(frame)
+                    if result is not None:
+                        return result
+        else:
+            def block(frame):
+                for statement in statements:
+                    statement(frame)
+
+        return block
+
+    def function_body(self, instructions):
+        """
+        Compile the body of a function into a closure that returns the
+        function's return value. A `ret` at the very end of the body (the
+        whole body, for lambdas) doesn't go through a return signal.
+        """
+        outer = self.function
+        self.function = True
+        try:
+            return self.compile_body(list(instructions))
+        finally:
+            self.function = outer
+
+    def compile_body(self, children):
+        tail = None
+        if children and isinstance(children[-1], nodes.ReturnInstruction):
+            ret = children.pop()
+            if ret.expression is not None:
+                tail = self.returned(ret.expression)
+                if self.profiler is not None:
+                    tail = self.profiler.statement(tail, ret)
+
+        if not children:
+            if tail is None:
+                def body(frame):
+                    return None
+                return body
+            return tail
+
+        block = self.block(nodes.Instructions(children))
+
+        if not exits(children):
+            if tail is None:
+                def body(frame):
+                    block(frame)
+            else:
+                def body(frame):
+                    block(frame)
+                    return tail(frame)
+        elif tail is None:
+            def body(frame):
+                result = block(frame)
+                if result is not None and result is not BREAK:
+                    return result[0]
+        else:
+            def body(frame):
+                result = block(frame)
+                if result is None:
+                    return tail(frame)
+                if result is not BREAK:
+                    return result[0]
+
+        return body
+
+    # Variables
+
+    def getter(self, node):
+        name = node.name
+
+        if node.depth is None:
+            values = self.symbols.values
+            index = self.symbols.index(name)
+
+            def get_global(frame):
+                value = values[index]
+                if value is UNDEFINED:
+                    raise not_found(name)
+                return value
+            return get_global
+
+        slot = node.slot
+        depth = node.depth
+
+        if depth == 0:
+            def get_local(frame):
+                value = frame[slot]
+                if value is UNDEFINED:
+                    raise not_found(name)
+                return value
+            return get_local
+
+        def get_outer(frame):
+            for _ in range(depth):
+                frame = frame[0]
+            value = frame[slot]
+            if value is UNDEFINED:
+                raise not_found(name)
+            return value
+        return get_outer
+
+    def setter(self, node, new=False):
+        name = node.name
+
+        if node.depth is None:
+            symbols = self.symbols
+            values = symbols.values
+            index = symbols.index(name)
+
+            if new:
+                def set_global(frame, value):
+                    # Builtins can be replaced by variables of the program.
+                    if values[index] is not UNDEFINED and not symbols.is_builtin(index):
+                        raise exists(name)
+                    values[index] = value
+            else:
+                def set_global(frame, value):
+                    if values[index] is UNDEFINED:
+                        raise not_found(name)
+                    values[index] = value
+            return set_global
+
+        slot = node.slot
+        depth = node.depth
+
+        # Only variables of the current function can be declared.
+        if new:
+            def set_local(frame, value):
+                if frame[slot] is not UNDEFINED:
+                    raise exists(name)
+                frame[slot] = value
+            return set_local
+
+        def set_outer(frame, value):
+            for _ in range(depth):
+                frame = frame[0]
+            if frame[slot] is UNDEFINED:
+                raise not_found(name)
+            frame[slot] = value
+        return set_outer
+
+    # Expressions
+
+    def compile_Primitive(self, node):
+        value = node.value
+
+        def primitive(frame):
+            return value
+        return primitive
+
+    def compile_Identifier(self, node):
+        return self.getter(node)
+
+    def compile_List(self, node):
+        values = tuple(self.compile(value) for value in node.values)
+
+        def list_(frame):
+            return [value(frame) for value in values]
+        return list_
+
+    def compile_Dict(self, node):
+        pairs = tuple((self.compile(key), self.compile(value)) for key, value in zip(node.keys, node.values))
+
+        def dict_(frame):
+            return {key(frame): value(frame) for key, value in pairs}
+        return dict_
+
+    def compile_Set(self, node):
+        values = tuple(self.compile(value) for value in node.values)
+
+        def set_(frame):
+            return {value(frame) for value in values}
+        return set_
+
+    def compile_Attribute(self, node):
+        value = self.compile(node.value)
+        name = node.name
+
+        def attribute(frame):
+            return get_attribute(value(frame), name)
+        return attribute
+
+    def compile_ListAccess(self, node):
+        list = self.compile(node.list)
+
+        if isinstance(node.index, nodes.Primitive):
+            const = node.index.value
+
+            def list_access(frame):
+                return list(frame)[const]
+        else:
+            index = self.compile(node.index)
+
+            def list_access(frame):
+                return list(frame)[index(frame)]
+        return list_access
+
+    def compile_ListAssign(self, node):
+        list = self.compile(node.list)
+        index = self.compile(node.index)
+        value = self.compile(node.value)
+
+        if node.op == '=':
+            def list_assign(frame):
+                l = list(frame)
+                i = index(frame)
+                l[i] = value(frame)
+        else:
+            op = ASSIGN_OPS[node.op]
+
+            def list_assign(frame):
+                l = list(frame)
+                i = index(frame)
+                l[i] = op(l[i], value(frame))
+        return list_assign
+
+    def compile_ListSlice(self, node):
+        list = self.compile(node.list)
+        start = None if node.start is None else self.compile(node.start)
+        end = None if node.end is None else self.compile(node.end)
+
+        if start is not None and end is not None:
+            def list_slice(frame):
+                return list(frame)[start(frame):end(frame)]
+        elif start is None and end is not None:
+            def list_slice(frame):
+                return list(frame)[:end(frame)]
+        elif start is not None and end is None:
+            def list_slice(frame):
+                return list(frame)[start(frame):]
+        else:
+            list_slice = list
+        return list_slice
+
+    def compile_Range(self, node):
+        start = self.compile(node.start)
+        end = self.compile(node.end)
+
+        inclusive = node.inclusive
+
+        def range_(frame):
+            return Range(start(frame), end(frame), inclusive)
+        return range_
+
+    def compile_Logical(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        if node.op == '&&':
+            def and_(frame):
+                return left(frame) and right(frame)
+            return and_
+
+        def or_(frame):
+            return left(frame) or right(frame)
+        return or_
+
+    def compile_Arithmetic(self, node):
+        left = self.compile(node.left)
+        op_name = node.op
+        op = BINARY_OPS[op_name]
+
+        if isinstance(node.right, nodes.Primitive):
+            const = node.right.value
+
+            def arithmetic(frame):
+                a = left(frame)
+                try:
+                    return op(a, const)
+                except TypeError as e:
+                    raise operand_error(e, a, op_name, const, node)
+        else:
+            right = self.compile(node.right)
+
+            def arithmetic(frame):
+                a = left(frame)
+                b = right(frame)
+                try:
+                    return op(a, b)
+                except TypeError as e:
+                    raise operand_error(e, a, op_name, b, node)
+        return arithmetic
+
+    def compile_Comparison(self, node):
+        # Comparisons are mostly the conditions of loops and `if`s, so the
+        # operator is written out in each closure instead of being called.
+        left = self.compile(node.left)
+        op_name = node.op
+
+        if isinstance(node.right, nodes.Primitive):
+            b = node.right.value
+            right = None
+        else:
+            right = self.compile(node.right)
+
+        # `==` and `!=` work on values of any type.
+        if op_name == '==':
+            if right is None:
+                def equal(frame):
+                    return left(frame) == b
+            else:
+                def equal(frame):
+                    return left(frame) == right(frame)
+            return equal
+
+        if op_name == '!=':
+            if right is None:
+                def not_equal(frame):
+                    return left(frame) != b
+            else:
+                def not_equal(frame):
+                    return left(frame) != right(frame)
+            return not_equal
+
+        if op_name == 'in':
+            if right is None:
+                def in_(frame):
+                    a = left(frame)
+                    try:
+                        return a in b
+                    except TypeError as e:
+                        raise operand_error(e, a, 'in', b, node)
+            else:
+                def in_(frame):
+                    a = left(frame)
+                    c = right(frame)
+                    try:
+                        return a in c
+                    except TypeError as e:
+                        raise operand_error(e, a, 'in', c, node)
+            return in_
+
+        if right is None:
+            if op_name == '<':
+                def less(frame):
+                    a = left(frame)
+                    try:
+                        return a < b
+                    except TypeError as e:
+                        raise operand_error(e, a, '<', b, node)
+                return less
+
+            if op_name == '>':
+                def greater(frame):
+                    a = left(frame)
+                    try:
+                        return a > b
+                    except TypeError as e:
+                        raise operand_error(e, a, '>', b, node)
+                return greater
+
+            if op_name == '<=':
+                def less_equal(frame):
+                    a = left(frame)
+                    try:
+                        return a <= b
+                    except TypeError as e:
+                        raise operand_error(e, a, '<=', b, node)
+                return less_equal
+
+            def greater_equal(frame):
+                a = left(frame)
+                try:
+                    return a >= b
+                except TypeError as e:
+                    raise operand_error(e, a, '>=', b, node)
+            return greater_equal
+
+        if op_name == '<':
+            def less(frame):
+                a = left(frame)
+                c = right(frame)
+                try:
+                    return a < c
+                except TypeError as e:
+                    raise operand_error(e, a, '<', c, node)
+            return less
+
+        if op_name == '>':
+            def greater(frame):
+                a = left(frame)
+                c = right(frame)
+                try:
+                    return a > c
+                except TypeError as e:
+                    raise operand_error(e, a, '>', c, node)
+            return greater
+
+        if op_name == '<=':
+            def less_equal(frame):
+                a = left(frame)
+                c = right(frame)
+                try:
+                    return a <= c
+                except TypeError as e:
+                    raise operand_error(e, a, '<=', c, node)
+            return less_equal
+
+        def greater_equal(frame):
+            a = left(frame)
+            c = right(frame)
+            try:
+                return a >= c
+            except TypeError as e:
+                raise operand_error(e, a, '>=', c, node)
+        return greater_equal
+
+    def compile_UnaryOp(self, node):
+        op = UNARY_OPS[node.op]
+        value = self.compile(node.value)
+
+        def unary_op(frame):
+            return op(value(frame))
+        return unary_op
+
+    def compile_Function(self, node):
+        arity = len(node.params)
+        padding = (UNDEFINED,) * (node.size - 1 - arity)
+        body = self.function_body(node.body)
+        if self.profiler is not None:
+            body = self.profiler.function(body, node)
+
+        def function(frame):
+            return Closure(arity, padding, body, frame)
+        return function
+
+    def compile_FunctionCall(self, node, tail=False):
+        callee = self.compile(node.value)
+        args = tuple(self.compile(param) for param in node.params)
+        count = len(args)
+        value = node.value
+
+        def arity_error(func):
+            return NameError(f'Invalid amount of args for "{value}". Got {count}, expected {func.arity}')
+
+        def not_callable():
+            return TypeError(f'{value!r} is not a function')
+
+        if tail:
+            def tail_call(frame):
+                func = callee(frame)
+                if func.__class__ is Closure:
+                    if func.arity != count:
+                        raise arity_error(func)
+                    return TailCall(func.body, [func.env, *[arg(frame) for arg in args], *func.padding, frame[-1]])
+                if not isinstance(func, nodes.CallableExpr):
+                    raise not_callable()
+                values = [arg(frame) for arg in args]
+                calls.depth = frame[-1]
+                return func(*values)
+            return tail_call
+
+        # Compiled functions are called right here instead of through
+        # `Closure.__call__`, and calls with few arguments are by far the
+        # most common, so they get versions that don't build a list of them.
+        if count == 0:
+            def function_call(frame):
+                func = callee(frame)
+                if func.__class__ is Closure:
+                    if func.arity != 0:
+                        raise arity_error(func)
+                    depth = frame[-1] + 1
+                    if depth > max_depth:
+                        raise too_deep()
+                    result = func.body([func.env, *func.padding, depth])
+                    while result.__class__ is TailCall:
+                        result = result.body(result.frame)
+                    return result
+                if not isinstance(func, nodes.CallableExpr):
+                    raise not_callable()
+                calls.depth = frame[-1]
+                return func()
+        elif count == 1:
+            arg, = args
+
+            def function_call(frame):
+                func = callee(frame)
+                if func.__class__ is Closure:
+                    if func.arity != 1:
+                        raise arity_error(func)
+                    depth = frame[-1] + 1
+                    if depth > max_depth:
+                        raise too_deep()
+                    result = func.body([func.env, arg(frame), *func.padding, depth])
+                    while result.__class__ is TailCall:
+                        result = result.body(result.frame)
+                    return result
+                if not isinstance(func, nodes.CallableExpr):
+                    raise not_callable()
+                value = arg(frame)
+                calls.depth = frame[-1]
+                return func(value)
+        elif count == 2:
+            arg1, arg2 = args
+
+            def function_call(frame):
+                func = callee(frame)
+                if func.__class__ is Closure:
+                    if func.arity != 2:
+                        raise arity_error(func)
+                    depth = frame[-1] + 1
+                    if depth > max_depth:
+                        raise too_deep()
+                    result = func.body([func.env, arg1(frame), arg2(frame), *func.padding, depth])
+                    while result.__class__ is TailCall:
+                        result = result.body(result.frame)
+                    return result
+                if not isinstance(func, nodes.CallableExpr):
+                    raise not_callable()
+                value1 = arg1(frame)
+                value2 = arg2(frame)
+                calls.depth = frame[-1]
+                return func(value1, value2)
+        else:
+            def function_call(frame):
+                func = callee(frame)
+                if func.__class__ is Closure:
+                    if func.arity != count:
+                        raise arity_error(func)
+                    depth = frame[-1] + 1
+                    if depth > max_depth:
+                        raise too_deep()
+                    result = func.body([func.env, *[arg(frame) for arg in args], *func.padding, depth])
+                    while result.__class__ is TailCall:
+                        result = result.body(result.frame)
+                    return result
+                if not isinstance(func, nodes.CallableExpr):
+                    raise not_callable()
+                values = [arg(frame) for arg in args]
+                calls.depth = frame[-1]
+                return func(*values)
+        return function_call
+
+    # Statements
+
+    def compile_Assignment(self, node):
+        value = self.compile(node.value)
+        identifier = node.identifier
+
+        # Assignments to variables of the current function are the most
+        # common ones, so they don't go through a setter.
+        if identifier.depth == 0:
+            slot = identifier.slot
+            name = identifier.name
+
+            if node.new:
+                def assignment(frame):
+                    if frame[slot] is not UNDEFINED:
+                        raise exists(name)
+                    frame[slot] = value(frame)
+            else:
+                def assignment(frame):
+                    if frame[slot] is UNDEFINED:
+                        raise not_found(name)
+                    frame[slot] = value(frame)
+            return assignment
+
+        set = self.setter(identifier, node.new)
+
+        def assignment(frame):
+            set(frame, value(frame))
+        return assignment
+
+    def compile_CompOp(self, node):
+        op = ASSIGN_OPS[node.op]
+        op_name = node.op
+        value = self.compile(node.value)
+        identifier = node.identifier
+
+        if identifier.depth == 0:
+            slot = identifier.slot
+            name = identifier.name
+
+            def comp_op(frame):
+                left = frame[slot]
+                if left is UNDEFINED:
+                    raise not_found(name)
+                right = value(frame)
+                try:
+                    frame[slot] = op(left, right)
+                except TypeError as e:
+                    raise operand_error(e, left, op_name, right, node)
+            return comp_op
+
+        get = self.getter(identifier)
+        set = self.setter(identifier)
+
+        def comp_op(frame):
+            left = get(frame)
+            right = value(frame)
+            try:
+                result = op(left, right)
+            except TypeError as e:
+                raise operand_error(e, left, op_name, right, node)
+            set(frame, result)
+        return comp_op
+
+    def compile_If(self, node):
+        condition = self.compile(node.condition)
+        true_branch = self.block(node.true_branch)
+
+        if node.false_branch is None:
+            def if_(frame):
+                if condition(frame):
+                    return true_branch(frame)
+        else:
+            false_branch = self.block(node.false_branch)
+
+            def if_(frame):
+                if condition(frame):
+                    return true_branch(frame)
+                return false_branch(frame)
+        return if_
+
+    def compile_For(self, node):
+        set = self.setter(node.var)
+        body = self.block(node.body)
+
+        if isinstance(node.sequence, nodes.Range):
+            # Loop over the numbers directly, without making a `Range`.
+            start = self.compile(node.sequence.start)
+            end = self.compile(node.sequence.end)
+            extra = 1 if node.sequence.inclusive else 0
+
+            def sequence(frame):
+                return range(start(frame), end(frame) + extra)
+        else:
+            sequence = self.compile(node.sequence)
+
+        if exits(node.body):
+            def for_(frame):
+                for value in sequence(frame):
+                    set(frame, value)
+                    result = body(frame)
+                    if result is not None:
+                        if result is BREAK:
+                            break
+                        return result
+        else:
+            def for_(frame):
+                for value in sequence(frame):
+                    set(frame, value)
+                    body(frame)
+        return for_
+
+    def compile_While(self, node):
+        condition = self.compile(node.condition)
+        body = self.block(node.body)
+
+        if exits(node.body):
+            def while_(frame):
+                while condition(frame):
+                    result = body(frame)
+                    if result is not None:
+                        if result is BREAK:
+                            break
+                        return result
+        else:
+            def while_(frame):
+                while condition(frame):
+                    body(frame)
+        return while_
+
+    def returned(self, node):
+        if self.function and isinstance(node, nodes.FunctionCall):
+            return self.compile_FunctionCall(node, tail=True)
+        return self.compile(node)
+
+    def compile_ReturnInstruction(self, node):
+        if node.expression is None:
+            def return_(frame):
+                return (None,)
+        else:
+            expression = self.returned(node.expression)
+
+            def return_(frame):
+                return (expression(frame),)
+        return return_
+
+    def compile_BreakInstruction(self, node):
+        def break_(frame):
+            return BREAK
+        return break_
+
+
+def compile(instructions, symbols, profiler=None):
+    """
+    Compile a program into a closure that runs it with the global variables
+    in a symbol table, and returns the value of its top-level `ret`.
+    """
+    block = Compiler(symbols, profiler).block(resolver.resolve(instructions))
+
+    def main():
+        # Imported files nest in the call importing them.
+        outer = calls.depth
+        try:
+            result = block([outer])
+        except RecursionError:
+            raise too_deep() from None
+        finally:
+            calls.depth = outer
+        if result is None or result is BREAK:
+            return None
+        return result[0]
+
+    def program():
+        return run(main)
+    return program
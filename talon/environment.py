@@ -1,78 +1,278 @@
-import math, random, re, tinted
-from . import nodes, talon
+import array, functools, math, random, re, sys, tinted
+from . import nodes, modules, parallel, tasks
+from .values import Array, StringBuilder, Memo
 
+# `%0`, `%1`... are replaced by the items of the list with those indexes
+# (`%-1` by the last one), and `%%0` is a plain `%0`.
+FORMAT_PATTERN = re.compile(r'%?%(-?\d+)')
 
-def format(string, list):
-    def repl(match):
+# How many format strings are kept parsed, see `template`.
+FORMAT_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def template(string):
+    """
+    Parse a format string, once, into a Python `%` format and the indexes of
+    the items that go in it. Recently used format strings are kept parsed.
+    """
+    parts = []
+    indexes = []
+    start = 0
+    for match in FORMAT_PATTERN.finditer(string):
+        parts.append(string[start:match.start()].replace('%', '%%'))
         if match[0][0:2] == '%%':
-            return match[0][1:]
-        return str(list[int(match[1])])
+            parts.append(match[0][1:].replace('%', '%%'))
+        else:
+            parts.append('%s')
+            indexes.append(int(match[1]))
+        start = match.end()
+    parts.append(string[start:].replace('%', '%%'))
+    pattern = ''.join(parts)
+    if not indexes:
+        # Nothing to put in it, so the format is the result already.
+        return pattern % (), ()
+    return pattern, tuple(indexes)
 
-    string = re.sub(r'%?%(-?\d+)', repl, string)
-    return string
+
+def format(string, list):
+    pattern, indexes = template(string)
+    if not indexes:
+        return pattern
+    return pattern % tuple([list[i] for i in indexes])
 
 
 def colored(string):
     return tinted.tint(string)
 
 
-def printf(string, list):
-    print(format(string, list))
+def printf(string, list, file=None):
+    print(format(string, list), file=file)
+
+
+def printc(string, file=None):
+    print(colored(string), file=file)
+
+
+def join(values, separator=''):
+    return separator.join([value if value.__class__ is str else str(value) for value in values])
+
+
+def dict_(keys=(), values=None):
+    """A dict with the given keys, and values (by default, all None)."""
+    if values is None:
+        return dict.fromkeys(keys)
+    if len(keys) != len(values):
+        raise ValueError(f'{len(keys)} keys but {len(values)} values')
+    return dict(zip(keys, values))
+
+
+def delete(collection, key):
+    """Delete a key from a dict, an item from a set or the item at an index of a list."""
+    if isinstance(collection, (set, frozenset)):
+        collection.remove(key)
+    else:
+        del collection[key]
+
+
+def zeros(length):
+    return Array(array.array('d', bytes(8 * length)))
+
+
+# The reductions work on lists (and ranges) too, but are faster on arrays.
+
+def sum_(values):
+    if isinstance(values, Array):
+        return values.sum()
+    return sum(values)
+
+
+def min_(*values):
+    if len(values) == 1 and isinstance(values[0], Array):
+        return values[0].min()
+    return min(*values)
+
+
+def max_(*values):
+    if len(values) == 1 and isinstance(values[0], Array):
+        return values[0].max()
+    return max(*values)
+
 
+def mean(values):
+    if not isinstance(values, Array):
+        values = Array(values)
+    return values.mean()
 
-def printc(string):
-    print(colored(string))
 
+def dot(a, b):
+    if not isinstance(a, Array):
+        a = Array(a)
+    return a.dot(b)
 
-def import_(name):
-    with open(name, 'r') as f:
-        talon.transform(talon.parse(f.read())).eval()
 
+def getstr(prompt='', file=None, input=None):
+    if input is None:
+        input = sys.stdin
+    print(prompt, end='', file=file, flush=True)
+    line = input.readline()
+    if not line:
+        raise EOFError('EOF when reading a line')
+    return line.rstrip('\n')
 
-def define_builtins():
-    table = nodes.symbols
+
+# Files are Python text files. Reading and writing go through Python's
+# buffers, and `lines` and `chunks` read a file bit by bit, so files of any
+# size can be processed in constant memory.
+
+def open_(path, mode='r'):
+    if 'b' in mode:
+        raise ValueError('Files can only be opened as text')
+    return open(path, mode, encoding='utf-8')
+
+
+def lines(file):
+    """The lines of a file (or of the file with a name), without their line endings."""
+    if isinstance(file, str):
+        with open(file, 'r', encoding='utf-8') as f:
+            yield from lines(f)
+        return
+    for line in file:
+        yield line[:-1] if line.endswith('\n') else line
+
+
+def chunks(file, size):
+    """The contents of a file (or of the file with a name), `size` characters at a time."""
+    if size < 1:
+        raise ValueError('Chunks must be at least 1 character long')
+    if isinstance(file, str):
+        with open(file, 'r', encoding='utf-8') as f:
+            yield from chunks(f, size)
+        return
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def write(file, string):
+    file.write(string)
+
+
+def writeline(file, string):
+    file.write(string)
+    file.write('\n')
+
+
+def define_builtins(interpreter, table):
+    """Define the builtins of the programs run by an interpreter in a symbol table."""
     b = nodes.BuiltinFunc
 
-    table.set_global('print', b(print))
-    table.set_global('printf', b(printf))
-    table.set_global('printc', b(printc))
-    table.set_global('getstr', b(input))
-    table.set_global('format', b(format))
-    table.set_global('colored', b(colored))
-    table.set_global('import', b(import_))
+    def output(func):
+        if interpreter.stdout is None:
+            return func
+        return functools.partial(func, file=interpreter.stdout)
+
+    if interpreter.stdout is None and interpreter.stdin is None:
+        input_ = input
+    else:
+        input_ = functools.partial(getstr, file=interpreter.stdout, input=interpreter.stdin)
+
+    def import_(name, namespace=None):
+        modules.import_(interpreter, table, name, namespace)
+
+    def pmap(function, items, workers=None, chunk_size=None):
+        return parallel.map_(function, items, workers, chunk_size, interpreter.stdout)
+
+    def pfor(items, function, workers=None, chunk_size=None):
+        parallel.for_(items, function, workers, chunk_size, interpreter.stdout)
+
+    table.set_builtin('print', b(output(print)))
+    table.set_builtin('printf', b(output(printf)))
+    table.set_builtin('printc', b(output(printc)))
+    table.set_builtin('getstr', b(input_))
+    table.set_builtin('format', b(format))
+    table.set_builtin('colored', b(colored))
+    table.set_builtin('import', b(import_))
+
+    # Files
+    table.set_builtin('open', b(open_))
+    table.set_builtin('close', b(lambda f: f.close()))
+    table.set_builtin('lines', b(lines))
+    table.set_builtin('chunks', b(chunks))
+    table.set_builtin('read', b(lambda f, size=-1: f.read(size)))
+    table.set_builtin('readline', b(lambda f: f.readline()))
+    table.set_builtin('write', b(write))
+    table.set_builtin('writeline', b(writeline))
+    table.set_builtin('flush', b(lambda f: f.flush()))
+
+    # Memoisation
+    table.set_builtin('memo', b(Memo))
+    table.set_builtin('memostats', b(lambda f: f.stats()))
+    table.set_builtin('memoclear', b(lambda f: f.clear()))
+
+    # Parallelism
+    table.set_builtin('pmap', b(pmap))
+    table.set_builtin('pfor', b(pfor))
+
+    # Tasks
+    table.set_builtin('spawn', b(tasks.spawn))
+    table.set_builtin('await', b(tasks.await_))
+    table.set_builtin('sleep', b(tasks.sleep))
 
     # Math
-    table.set_global('int', b(int))
-    table.set_global('float', b(float))
-    table.set_global('round', b(round))
-    table.set_global('log', b(math.log))
-    table.set_global('sqrt', b(math.sqrt))
-    table.set_global('sin', b(math.sin))
-    table.set_global('cos', b(math.cos))
-    table.set_global('tan', b(math.tan))
-    table.set_global('asin', b(math.asin))
-    table.set_global('acos', b(math.acos))
-    table.set_global('atan', b(math.atan))
-    table.set_global('atan2', b(math.atan2))
-    table.set_global('random', b(random.random))
-    table.set_global('randomint', b(random.randint))
+    table.set_builtin('int', b(int))
+    table.set_builtin('float', b(float))
+    table.set_builtin('round', b(round))
+    table.set_builtin('log', b(math.log))
+    table.set_builtin('sqrt', b(math.sqrt))
+    table.set_builtin('sin', b(math.sin))
+    table.set_builtin('cos', b(math.cos))
+    table.set_builtin('tan', b(math.tan))
+    table.set_builtin('asin', b(math.asin))
+    table.set_builtin('acos', b(math.acos))
+    table.set_builtin('atan', b(math.atan))
+    table.set_builtin('atan2', b(math.atan2))
+    table.set_builtin('random', b(random.random))
+    table.set_builtin('randomint', b(random.randint))
 
     # Strings
-    table.set_global('str', b(str))
-    table.set_global('len', b(len))
-    table.set_global('ord', b(ord))
-    table.set_global('chr', b(chr))
-    table.set_global('lower', b(str.lower))
-    table.set_global('upper', b(str.upper))
-    table.set_global('startswith', b(str.startswith))
-    table.set_global('endswith', b(str.endswith))
-    table.set_global('replace', b(str.replace))
-    table.set_global('split', b(lambda s, d: s.split(d)))
+    table.set_builtin('str', b(str))
+    table.set_builtin('len', b(len))
+    table.set_builtin('ord', b(ord))
+    table.set_builtin('chr', b(chr))
+    table.set_builtin('lower', b(str.lower))
+    table.set_builtin('upper', b(str.upper))
+    table.set_builtin('startswith', b(str.startswith))
+    table.set_builtin('endswith', b(str.endswith))
+    table.set_builtin('replace', b(str.replace))
+    table.set_builtin('split', b(lambda s, d: s.split(d)))
+    table.set_builtin('join', b(join))
+    table.set_builtin('builder', b(StringBuilder))
 
     # Lists
-    table.set_global('list', b(list))
-    table.set_global('append', b(lambda l, e: l.append(e)))
-    table.set_global('pop', b(lambda l: l.pop()))
-    table.set_global('remove', b(lambda l, e: l.remove(e)))
-    table.set_global('reverse', b(lambda l: l.reverse()))
-    table.set_global('sort', b(lambda l: l.sort()))
+    table.set_builtin('list', b(list))
+    table.set_builtin('append', b(lambda l, e: l.append(e)))
+    table.set_builtin('pop', b(lambda l: l.pop()))
+    table.set_builtin('remove', b(lambda l, e: l.remove(e)))
+    table.set_builtin('reverse', b(lambda l: l.reverse()))
+    table.set_builtin('sort', b(lambda l: l.sort()))
+
+    # Dicts and sets
+    table.set_builtin('dict', b(dict_))
+    table.set_builtin('set', b(set))
+    table.set_builtin('keys', b(lambda d: list(d)))
+    table.set_builtin('values', b(lambda d: list(d.values())))
+    table.set_builtin('get', b(lambda d, key, default=None: d.get(key, default)))
+    table.set_builtin('add', b(lambda s, e: s.add(e)))
+    table.set_builtin('delete', b(delete))
+
+    # Arrays
+    table.set_builtin('array', b(Array))
+    table.set_builtin('zeros', b(zeros))
+    table.set_builtin('sum', b(sum_))
+    table.set_builtin('min', b(min_))
+    table.set_builtin('max', b(max_))
+    table.set_builtin('mean', b(mean))
+    table.set_builtin('dot', b(dot))
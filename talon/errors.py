@@ -23,4 +23,8 @@ class FunctionExists(VMError):
 
 
 class WrongParamCount(VMError):
-    pass
\ No newline at end of file
+    pass
+
+
+class CallDepthExceeded(VMError):
+    pass
@@ -0,0 +1,98 @@
+"""
+The interpreter: what a Talon program needs to run, besides its code.
+"""
+import asyncio, contextvars, os, threading
+from . import talon, environment, modules, tasks
+from .symbols import SymbolTable
+
+
+class Interpreter:
+    """
+    Runs Talon programs with global variables of its own.
+
+    Each interpreter has its own globals, its own builtins (writing to
+    `stdout` and reading from `stdin` if they are given, instead of the
+    ones of the process) and its own modules imported with a name. The
+    frames of function calls live on the stack of the thread running the
+    program, so interpreters are cheap to create and independent of each
+    other, and any number of them can run at the same time in different
+    threads.
+
+    Programs run by the same interpreter share its globals, the way the
+    files imported by a program do. The maximum call depth is the same for
+    the whole process, see `compiler.set_max_depth`. Each program runs on
+    a thread with a stack big enough for it (see `compiler.run`), which the
+    calling thread waits for.
+    """
+
+    def __init__(self, optimize=True, stdout=None, stdin=None):
+        # Whether programs, and the files they import, go through the
+        # optimizer before they run.
+        self.optimize = optimize
+        self.stdout = stdout
+        self.stdin = stdin
+        # path -> (mtime, module), for the files imported with a name
+        self.modules = {}
+        # Held while importing, so that threads sharing the interpreter
+        # don't run a file twice.
+        self.lock = threading.RLock()
+        self.symbols = self.globals()
+
+    def __repr__(self):
+        return f'<Interpreter modules={len(self.modules)!r}>'
+
+    def globals(self):
+        """Make a symbol table holding the builtins."""
+        symbols = SymbolTable()
+        environment.define_builtins(self, symbols)
+        return symbols
+
+    def get(self, name):
+        """Get the value of a global variable."""
+        return self.symbols.get_sym(name)
+
+    def set(self, name, value):
+        """Set a global variable, creating it if needed."""
+        self.symbols.set_global(name, value)
+
+    def load(self, code):
+        """Turn Talon source code into a tree that `execute` can run."""
+        return talon.load(code, self.optimize)
+
+    def run(self, code):
+        """Run Talon source code, and return the value of its top-level `ret`."""
+        return self.execute(self.load(code))
+
+    def run_file(self, path):
+        """Run a `.tal` or `.talc` file, and return the value of its top-level `ret`."""
+        return self.execute(modules.load(path, self.optimize), path)
+
+    def execute(self, program, path=None):
+        """
+        Run a tree made by `load` or a `bytecode.Code`. If the program comes
+        from a file, giving its path stops the program from importing itself.
+        """
+        if path is not None:
+            self.symbols.imported.add(os.path.realpath(path))
+        return modules.run(program, self.symbols)
+
+    async def execute_async(self, program, path=None):
+        """
+        Run a program like `execute`, from asyncio code. The program runs in
+        a thread, and the async builtins it calls run on the running loop.
+        """
+        return await self.in_thread(self.execute, program, path)
+
+    async def run_async(self, code):
+        """Run Talon source code like `run`, from asyncio code."""
+        return await self.in_thread(self.run, code)
+
+    async def run_file_async(self, path):
+        """Run a `.tal` or `.talc` file like `run_file`, from asyncio code."""
+        return await self.in_thread(self.run_file, path)
+
+    async def in_thread(self, function, *args):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        context.run(tasks.running_loop.set, loop)
+        return await loop.run_in_executor(None, context.run, function, *args)
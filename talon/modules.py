@@ -0,0 +1,113 @@
+"""
+Loads the Talon files used with `import()`.
+
+The program in a file is cached for the whole process by the file's
+absolute path and modification time, so a file is only read, parsed and
+compiled again once it changes. Only the `MAX_PROGRAMS` files used last are
+kept, so a process running many programs doesn't keep growing. A `.tal` file
+with an up-to-date `.talc` file next to it (made by `tal -c`) is loaded from
+the bytecode instead, and other `.tal` files go through the cache on disk
+(see `cache.py`), so other processes don't parse them again either.
+
+`import('b.tal')` runs the file with the global variables of the importer,
+once: importing it into the same globals again does nothing.
+
+`import('b.tal', 'b')` runs the file with global variables of its own, once
+per interpreter (or again if the file changed), and makes them available to
+the importer as `b.name`.
+
+Files are marked as imported before they run, so an import cycle doesn't run
+a file again: the importer gets the variables defined so far.
+"""
+import os, threading
+from collections import OrderedDict
+from . import bytecode, cache, compiler, talc, vm
+from .values import Module
+
+# How many programs are cached
+MAX_PROGRAMS = 256
+
+# (path, optimized) -> (mtime, program), where the program is a
+# `bytecode.Code` or a tree, the one used last at the end
+_programs = OrderedDict()
+_programs_lock = threading.Lock()
+
+
+def mtime(path):
+    return os.stat(path).st_mtime_ns
+
+
+def load(path, optimize=True):
+    """Get the program in a file, from the cache if the file hasn't changed."""
+    path = os.path.realpath(path)
+    modified = mtime(path)
+    with _programs_lock:
+        cached = _programs.get((path, optimize))
+        if cached is not None and cached[0] == modified:
+            _programs.move_to_end((path, optimize))
+            return cached[1]
+
+    program = read(path, optimize)
+    with _programs_lock:
+        _programs[path, optimize] = (modified, program)
+        _programs.move_to_end((path, optimize))
+        while len(_programs) > MAX_PROGRAMS:
+            _programs.popitem(last=False)
+    return program
+
+
+def read(path, optimize):
+    if path.endswith('.talc'):
+        with open(path, 'rb') as f:
+            return talc.load(f)
+
+    compiled = path + 'c'
+    try:
+        if mtime(compiled) >= mtime(path):
+            with open(compiled, 'rb') as f:
+                return talc.load(f)
+    except (OSError, ValueError):
+        # No compiled file, or one made by another version of Talon.
+        pass
+
+    with open(path, 'r') as f:
+        return cache.load(f.read(), optimize)
+
+
+def run(program, symbols):
+    """Run a program with the global variables in a symbol table."""
+    if isinstance(program, bytecode.Code):
+        return vm.run(program, symbols)
+    return compiler.compile(program, symbols)()
+
+
+def import_(interpreter, symbols, name, namespace=None):
+    """Import the Talon file `name` into the global variables in `symbols`."""
+    path = os.path.realpath(name)
+
+    with interpreter.lock:
+        if namespace is None:
+            if path not in symbols.imported:
+                symbols.imported.add(path)
+                try:
+                    run(load(path, interpreter.optimize), symbols)
+                except BaseException:
+                    symbols.imported.discard(path)
+                    raise
+            return
+
+        cached = interpreter.modules.get(path)
+        if cached is not None and cached[0] == mtime(path):
+            module = cached[1]
+        else:
+            module = Module(path, interpreter.globals())
+            module.symbols.imported.add(path)
+
+            interpreter.modules[path] = (mtime(path), module)
+            try:
+                run(load(path, interpreter.optimize), module.symbols)
+            except BaseException:
+                del interpreter.modules[path]
+                raise
+
+        symbols.set_global(namespace, module)
@@ -1,11 +1,14 @@
-from types import LambdaType
-from . import symbols as s
-import operator
-
-symbols = s.SymbolTable()
+import inspect
 
 
 class Instructions:
+    """
+    A codeblock: statements that are run one after the other for their
+    effects. Expressions that give several values (the items of a list, the
+    arguments of a call, the parameters of a function) are plain lists
+    instead.
+    """
+
     def __init__(self, children):
         if children is None or children == [None]:
             children = []
@@ -20,38 +23,21 @@ class Instructions:
     def __repr__(self):
         return f'<Instructions {self.children!r}>'
 
-    def eval(self):
-        ret = []
-        for node in self:
-            if isinstance(node, ExitInstruction):
-                return node
-
-            result = node.eval()
-
-            if isinstance(result, ExitInstruction):
-                return result
-            elif result is not None:
-                ret.append(result)
-
-        return ret
-
 
 class BaseExpr:
-    def eval(self):
-        return NotImplementedError()
+    # Where the node starts in the source code, set by the transformer.
+    # Nodes made later on (by the optimizer...) don't have a position.
+    line = None
+    column = None
 
 
 class CallableExpr:
-    def eval(self):
-        return NotImplementedError()
+    """Base class of the values that can be called from Talon code."""
+    __slots__ = ()
 
 
 class ExitInstruction(BaseExpr):
-    def __iter__(self):
-        return []
-
-    def eval(self):
-        pass
+    pass
 
 
 class ReturnInstruction(ExitInstruction):
@@ -61,24 +47,11 @@ class ReturnInstruction(ExitInstruction):
     def __repr__(self):
         return f'<ReturnInstruction expression={self.expression!r}>'
 
-    def eval(self):
-        return full_eval(self.expression)
-
 
 class BreakInstruction(ExitInstruction):
     def __repr__(self):
         return f'<BreakInstruction>'
 
-    def eval(self):
-        return None
-
-
-def full_eval(expression: BaseExpr):
-    while isinstance(expression, BaseExpr):
-        expression = expression.eval()
-
-    return expression
-
 
 class Primitive(BaseExpr):
     def __init__(self, value):
@@ -87,33 +60,41 @@ class Primitive(BaseExpr):
     def __repr__(self):
         return f'<Primitive {self.value!r} ({self.value.__class__.__name__})>'
 
-    def eval(self):
-        return self.value
-
 
 class Identifier(BaseExpr):
     def __init__(self, name):
         self.name = name
+        # Set by the resolver for local variables.
+        self.depth = None
+        self.slot = None
 
     def __repr__(self):
         return f'<Identifier {self.name}>'
 
-    def assign(self, value, new=False):
-        symbols.set_sym(self.name, value, new=new)
-
-    def eval(self):
-        return symbols.get_sym(self.name)
-
 
 class List(BaseExpr):
-    def __init__(self, values: Instructions):
+    def __init__(self, values: list):
         self.values = values
 
     def __repr__(self):
         return f'<List length={len(self.values)} items={self.values!r}>'
 
-    def eval(self):
-        return self.values.eval()
+
+class Dict(BaseExpr):
+    def __init__(self, keys: list, values: list):
+        self.keys = keys
+        self.values = values
+
+    def __repr__(self):
+        return f'<Dict length={len(self.keys)} keys={self.keys!r} values={self.values!r}>'
+
+
+class Set(BaseExpr):
+    def __init__(self, values: list):
+        self.values = values
+
+    def __repr__(self):
+        return f'<Set length={len(self.values)} items={self.values!r}>'
 
 
 class ListAccess(BaseExpr):
@@ -124,20 +105,8 @@ class ListAccess(BaseExpr):
     def __repr__(self):
         return f'<List list={self.list!r} index={self.index!r}>'
 
-    def eval(self):
-        return self.list.eval()[self.index.eval()]
-
 
 class ListAssign(BaseExpr):
-    __ops = {
-        '+=': operator.iadd,
-        '-=': operator.isub,
-        '*=': operator.imul,
-        '/=': operator.itruediv,
-        '%=': operator.imod,
-        '^=': operator.ipow
-    }
-
     def __init__(self, list: BaseExpr, index: BaseExpr, op: BaseExpr, value: BaseExpr):
         self.list = list
         self.index = index
@@ -147,15 +116,6 @@ class ListAssign(BaseExpr):
     def __repr__(self):
         return f'<List list={self.list!r} index={self.index!r} op={self.op!r} value={self.value!r}>'
 
-    def eval(self):
-        list = self.list.eval()
-        index = self.index.eval()
-        value = self.value.eval()
-        if self.op == '=':
-            list[index] = value
-        else:
-            list[index] = self.__ops[self.op](list[index], value)
-
 
 class ListSlice(BaseExpr):
     def __init__(self, list: BaseExpr, start: BaseExpr, end: BaseExpr):
@@ -166,15 +126,14 @@ class ListSlice(BaseExpr):
     def __repr__(self):
         return f'<ListSlice list={self.list!r} start={self.start!r} end={self.end!r}>'
 
-    def eval(self):
-        if self.start is not None and self.end is not None:
-            return self.list.eval()[self.start.eval():self.end.eval()]
-        elif self.start is None and self.end is not None:
-            return self.list.eval()[:self.end.eval()]
-        elif self.start is not None and self.end is None:
-            return self.list.eval()[self.start.eval():]
-        else:
-            return self.list.eval()
+
+class Attribute(BaseExpr):
+    def __init__(self, value: BaseExpr, name: str):
+        self.value = value
+        self.name = name
+
+    def __repr__(self):
+        return f'<Attribute value={self.value!r} name={self.name!r}>'
 
 
 class Range(BaseExpr):
@@ -186,12 +145,6 @@ class Range(BaseExpr):
     def __repr__(self):
         return f'<Range start={self.start!r} end={self.end!r} inclusive={self.inclusive}>'
 
-    def eval(self):
-        if self.inclusive:
-            return list(range(self.start.eval(), self.end.eval() + 1))
-        else:
-            return list(range(self.start.eval(), self.end.eval()))
-
 
 class Assignment(BaseExpr):
     def __init__(self, identifier: Identifier, value: BaseExpr, new=False):
@@ -202,20 +155,8 @@ class Assignment(BaseExpr):
     def __repr__(self):
         return f'<Assignment new={self.new} identifier={self.identifier!r} value={self.value!r}>'
 
-    def eval(self):
-        self.identifier.assign(self.value.eval(), new=self.new)
-
 
 class CompOp(BaseExpr):
-    __ops = {
-        '+=': operator.iadd,
-        '-=': operator.isub,
-        '*=': operator.imul,
-        '/=': operator.itruediv,
-        '%=': operator.imod,
-        '^=': operator.ipow
-    }
-
     def __init__(self, identifier: Identifier, op: str, value: BaseExpr):
         self.identifier = identifier
         self.op = op
@@ -224,33 +165,13 @@ class CompOp(BaseExpr):
     def __repr__(self):
         return f'<CompOp identifier={self.identifier!r} op={self.op!r} value={self.value!r}>'
 
-    def eval(self):
-        left = self.identifier.eval()
-        right = self.value.eval()
-
-        try:
-            self.identifier.assign(self.__ops[self.op](left, right))
-        except TypeError:
-            raise TypeError(f'Type error: ({left}: {left.__class__.__name__}) {self.op} ({right}: {right.__class__.__name__}) is not allowed')
-
 
 class BinOp(BaseExpr):
-    __ops = {
-        '+': operator.add,
-        '-': operator.sub,
-        '*': operator.mul,
-        '/': operator.truediv,
-        '^': operator.pow,
-        '%': operator.mod,
-        '==': operator.eq,
-        '!=': operator.ne,
-        '<': operator.lt,
-        '>': operator.gt,
-        '<=': operator.le,
-        '>=': operator.ge,
-        '&&': lambda a, b: a.eval() and b.eval(),
-        '||': lambda a, b: a.eval() or b.eval()
-    }
+    """
+    Base class of the binary operators. The transformer makes one of the
+    subclasses, depending on the operator, so that each kind is compiled on
+    its own.
+    """
 
     def __init__(self, op, left, right):
         self.op = op
@@ -258,34 +179,22 @@ class BinOp(BaseExpr):
         self.right = right
 
     def __repr__(self):
-        return f'<BinOp op={self.op!r} left={self.left!r} right={self.right!r}>'
+        return f'<{self.__class__.__name__} op={self.op!r} left={self.left!r} right={self.right!r}>'
 
-    def eval(self):
-        left = None
-        right = None
 
-        try:
-            op = self.__ops[self.op]
+class Arithmetic(BinOp):
+    """`+`, `-`, `*`, `/`, `%` and `^`"""
 
-            if isinstance(op, LambdaType):
-                return op(self.left, self.right)
 
-            left = self.left.eval()
-            right = self.right.eval()
+class Comparison(BinOp):
+    """`==`, `!=`, `<`, `>`, `<=`, `>=` and `in`"""
 
-            return op(left, right)
-        except TypeError:
-            # TODO: custom error
-            raise TypeError(f'Type error: ({left}: {left.__class__.__name__}) {self.op} ({right}: {right.__class__.__name__}) is not allowed')
 
+class Logical(BinOp):
+    """`&&` and `||`, which only evaluate their right side when needed"""
 
-class UnaryOp(BaseExpr):
-    __ops = {
-        '-': operator.neg,
-        '+': operator.abs,
-        '!': operator.not_
-    }
 
+class UnaryOp(BaseExpr):
     def __init__(self, op, value: BaseExpr):
         self.op = op
         self.value = value
@@ -293,9 +202,6 @@ class UnaryOp(BaseExpr):
     def __repr__(self):
         return f'<UnaryOp op={self.op!r} value={self.value!r}>'
 
-    def eval(self):
-        return self.__ops[self.op](self.value.eval())
-
 
 class If(BaseExpr):
     def __init__(self, condition: BaseExpr, true_branch: Instructions, false_branch: Instructions = None):
@@ -306,11 +212,17 @@ class If(BaseExpr):
     def __repr__(self):
         return f'<If condition={self.condition!r} true_branch={self.true_branch!r} false_branch={self.false_branch!r}>'
 
-    def eval(self):
-        if self.condition.eval():
-            return self.true_branch.eval()
-        elif self.false_branch is not None:
-            return self.false_branch.eval()
+
+def branch(node):
+    """
+    The statements of a branch of an `If`. The false branch is either a
+    codeblock, another `If` (`else if`) or None.
+    """
+    if node is None:
+        return []
+    if isinstance(node, If):
+        return [node]
+    return node
 
 
 class For(BaseExpr):
@@ -322,15 +234,6 @@ class For(BaseExpr):
     def __repr__(self):
         return f'<For var={self.var!r} sequence={self.sequence!r} body={self.body!r}>'
 
-    def eval(self):
-        for value in self.sequence.eval():
-            self.var.assign(value)
-            val = self.body.eval()
-            if isinstance(val, ReturnInstruction):
-                return val
-            elif isinstance(val, BreakInstruction):
-                break
-
 
 class While(BaseExpr):
     def __init__(self, condition: BaseExpr, body: Instructions):
@@ -340,97 +243,44 @@ class While(BaseExpr):
     def __repr__(self):
         return f'<While condition={self.condition!r} body={self.body!r}>'
 
-    def eval(self):
-        while self.condition.eval():
-            val = self.body.eval()
-            if isinstance(val, ReturnInstruction):
-                return val
-            elif isinstance(val, BreakInstruction):
-                break
 
-
-class Function(CallableExpr):
-    def __init__(self, params: Instructions, body: Instructions):
+class Function(BaseExpr):
+    def __init__(self, params: list, body: Instructions, name=None):
         self.params = params
         self.body = body
+        # The name given with `fun name(...)` or `this name = ...`, if any.
+        self.name = name
+        # Set by the resolver: the size of the function's frames and the
+        # names of their slots.
+        self.size = None
+        self.names = None
 
     def __repr__(self):
         # TODO: Improve string representation
         return f'<Function params={len(self.params)!r}>'
 
-    def eval(self, args=None):
-        if args is None:
-            return self
-
-        symbols.set_local(True)
-
-        for key, value in args.items():
-            symbols.set_sym(key, value, new=True)
-
-        try:
-            result = self.body.eval()
-
-            if isinstance(result, ReturnInstruction):
-                return result.eval()
-        finally:
-            symbols.set_local(False)
-
-        return None
-
 
 class FunctionCall(BaseExpr):
-    def __init__(self, value, params: Instructions):
+    def __init__(self, value, params: list):
         self.value = value
         self.params = params
 
     def __repr__(self):
         return f'<Function call value={self.value!r} called_with_params={len(self.params)!r}>'
 
-    def __builtin_func(self):
-        func = self.value.eval()
-        args = []
-
-        for param in self.params:
-            args.append(full_eval(param))
-
-        return func.eval(args)
-
-    def __user_func(self):
-        func = self.value.eval()
-        args = {}
-
-        length1 = len(func.params)
-        length2 = len(self.params)
-
-        if length1 != length2:
-            raise NameError(f'Invalid amount of args for "{self.value}". Got {length2}, expected {length1}')
-
-        for param, value in zip(func.params, self.params):
-            args[param.name] = full_eval(value)
-
-        return func.eval(args)
-
-    def eval(self):
-        func = self.value.eval()
-
-        if not isinstance(func, CallableExpr):
-            raise TypeError(f'{self.value!r} is not a function')
-
-        if isinstance(func, BuiltinFunc):
-            return self.__builtin_func()
-
-        return self.__user_func()
-
 
 class BuiltinFunc(CallableExpr):
+    __slots__ = ('func',)
+
     def __init__(self, func):
+        if inspect.iscoroutinefunction(func):
+            # Async builtins run on an event loop, see `tasks.py`.
+            from .tasks import blocking
+            func = blocking(func)
         self.func = func
 
     def __repr__(self):
         return f'<Builtin func {self.func!r}>'
 
-    def eval(self, args=None):
-        if args is None:
-            return self
-
-        return self.func(*args)
\ No newline at end of file
+    def __call__(self, *args):
+        return self.func(*args)
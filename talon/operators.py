@@ -0,0 +1,52 @@
+import operator
+
+BINARY_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '^': operator.pow,
+    '%': operator.mod,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    'in': lambda item, collection: item in collection
+}
+
+UNARY_OPS = {
+    '-': operator.neg,
+    '+': operator.abs,
+    '!': operator.not_
+}
+
+ASSIGN_OPS = {
+    '+=': operator.iadd,
+    '-=': operator.isub,
+    '*=': operator.imul,
+    '/=': operator.itruediv,
+    '%=': operator.imod,
+    '^=': operator.ipow
+}
+
+
+def type_error(left, op, right, node=None):
+    # TODO: custom error
+    message = f'Type error: ({left}: {left.__class__.__name__}) {op} ({right}: {right.__class__.__name__}) is not allowed'
+    if node is not None and node.line is not None:
+        message += f' (line {node.line}, column {node.column})'
+    return TypeError(message)
+
+
+def operand_error(error, left, op, right, node=None):
+    """
+    The error to raise instead of a TypeError caught around an operator. Only
+    errors raised by the operator itself, because it doesn't work on the
+    types of its operands, become type errors; errors raised by code the
+    operator ran (a method of an array...) are raised as they are.
+    """
+    if error.__traceback__.tb_next is not None:
+        return error
+    return type_error(left, op, right, node)
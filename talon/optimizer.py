@@ -0,0 +1,208 @@
+"""
+Simplifies the tree made by the transformer before it is compiled.
+
+Operators whose operands are all literals are worked out once here
+(`1 + 2`, `'a' + 'b'`, `-1`, `3 > 2`...), `if`s and `while`s with literal
+conditions lose the branches that can never run, and statements after a
+`ret` or `break` are dropped. Anything that would fail at runtime, like
+`1 / 0`, is left alone so that it fails at the same point as before.
+"""
+from . import nodes, resolver
+from .operators import BINARY_OPS, UNARY_OPS
+
+# Operators that would make huge values out of small literals, like
+# `'a' * 1000000000` or `9 ^ 9 ^ 9`, are left to runtime.
+MAX_FOLDED_SIZE = 4096
+
+
+def too_big(op, left, right):
+    if op == '*':
+        for count, value in ((left, right), (right, left)):
+            if isinstance(count, int) and isinstance(value, (str, list)):
+                return count * len(value) > MAX_FOLDED_SIZE
+    elif op == '^':
+        if isinstance(left, int) and isinstance(right, int):
+            return abs(right) * left.bit_length() > MAX_FOLDED_SIZE
+    return False
+
+
+def constant(node):
+    return isinstance(node, nodes.Primitive)
+
+
+def declares(instructions):
+    return any(True for _ in resolver.declarations(instructions))
+
+
+class Optimizer:
+    def optimize(self, node):
+        if node is None:
+            return None
+        method = getattr(self, 'optimize_' + node.__class__.__name__, None)
+        if method is None:
+            return node
+        return method(node)
+
+    def block(self, instructions):
+        children = []
+        self.extend(children, instructions)
+        return nodes.Instructions(children)
+
+    def extend(self, children, instructions):
+        """
+        Add the optimized instructions to a block. Returns True if the block
+        can't go on past them.
+        """
+        instructions = iter(instructions)
+
+        for node in instructions:
+            node = self.optimize(node)
+
+            if isinstance(node, nodes.If) and self.known(node):
+                taken = node.true_branch if node.condition.value else node.false_branch
+                exits = self.extend(children, nodes.branch(taken))
+            elif isinstance(node, nodes.While) and self.known(node):
+                continue
+            else:
+                children.append(node)
+                exits = isinstance(node, nodes.ExitInstruction)
+
+            if exits:
+                # The rest can't run, but the variables declared there
+                # still belong to the function.
+                children.extend(rest for rest in instructions if declares([rest]))
+                return True
+        return False
+
+    def known(self, node):
+        """
+        Whether it is known which branch of an `if` runs, or that a `while`
+        never runs, and the code that doesn't run declares no variables.
+        """
+        if not constant(node.condition):
+            return False
+        if isinstance(node, nodes.While):
+            return not node.condition.value and not declares(node.body)
+        skipped = node.false_branch if node.condition.value else node.true_branch
+        return not declares(nodes.branch(skipped))
+
+    def optimize_Instructions(self, node):
+        return self.block(node)
+
+    def optimize_List(self, node):
+        node.values = [self.optimize(value) for value in node.values]
+        return node
+
+    optimize_Set = optimize_List
+
+    def optimize_Dict(self, node):
+        node.keys = [self.optimize(key) for key in node.keys]
+        node.values = [self.optimize(value) for value in node.values]
+        return node
+
+    def optimize_ListAccess(self, node):
+        node.list = self.optimize(node.list)
+        node.index = self.optimize(node.index)
+        return node
+
+    def optimize_ListAssign(self, node):
+        node.list = self.optimize(node.list)
+        node.index = self.optimize(node.index)
+        node.value = self.optimize(node.value)
+        return node
+
+    def optimize_ListSlice(self, node):
+        node.list = self.optimize(node.list)
+        node.start = self.optimize(node.start)
+        node.end = self.optimize(node.end)
+        return node
+
+    def optimize_Attribute(self, node):
+        node.value = self.optimize(node.value)
+        return node
+
+    def optimize_Range(self, node):
+        node.start = self.optimize(node.start)
+        node.end = self.optimize(node.end)
+        return node
+
+    def optimize_Assignment(self, node):
+        node.value = self.optimize(node.value)
+        return node
+
+    def optimize_CompOp(self, node):
+        node.value = self.optimize(node.value)
+        return node
+
+    def optimize_Logical(self, node):
+        left = node.left = self.optimize(node.left)
+        node.right = self.optimize(node.right)
+
+        # Only the left side needs to be known.
+        if not constant(left):
+            return node
+        if node.op == '&&':
+            return node.right if left.value else left
+        return left if left.value else node.right
+
+    def optimize_BinOp(self, node):
+        left = node.left = self.optimize(node.left)
+        right = node.right = self.optimize(node.right)
+
+        if not constant(left) or not constant(right) or too_big(node.op, left.value, right.value):
+            return node
+        try:
+            return nodes.Primitive(BINARY_OPS[node.op](left.value, right.value))
+        except Exception:
+            return node
+
+    optimize_Arithmetic = optimize_Comparison = optimize_BinOp
+
+    def optimize_UnaryOp(self, node):
+        value = node.value = self.optimize(node.value)
+
+        if not constant(value):
+            return node
+        try:
+            return nodes.Primitive(UNARY_OPS[node.op](value.value))
+        except Exception:
+            return node
+
+    def optimize_If(self, node):
+        node.condition = self.optimize(node.condition)
+        node.true_branch = self.block(node.true_branch)
+
+        false_branch = self.optimize(node.false_branch)
+        if isinstance(false_branch, nodes.If) and constant(false_branch.condition):
+            # `else if` with a literal condition
+            false_branch = self.block([false_branch])
+        node.false_branch = false_branch
+        return node
+
+    def optimize_For(self, node):
+        node.sequence = self.optimize(node.sequence)
+        node.body = self.block(node.body)
+        return node
+
+    def optimize_While(self, node):
+        node.condition = self.optimize(node.condition)
+        node.body = self.block(node.body)
+        return node
+
+    def optimize_ReturnInstruction(self, node):
+        node.expression = self.optimize(node.expression)
+        return node
+
+    def optimize_Function(self, node):
+        node.body = self.block(node.body)
+        return node
+
+    def optimize_FunctionCall(self, node):
+        node.value = self.optimize(node.value)
+        node.params = [self.optimize(param) for param in node.params]
+        return node
+
+
+def optimize(instructions):
+    """Optimize a program in place, and return it."""
+    return Optimizer().block(instructions)
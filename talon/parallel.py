@@ -0,0 +1,126 @@
+"""
+Runs a Talon function on the items of a list in parallel, on a pool of
+processes: `pmap(f, list)` and `pfor(list, f)`.
+
+Talon functions are compiled to Python closures, which can't be sent to
+another process, so the workers are forked from the process calling `pmap`
+and get the function (and everything it uses) from their copy of its memory.
+Only the items and the results are pickled, and they are sent a chunk of
+items at a time. The results come back in the order of the items.
+
+The function runs in the workers, so any change it makes to variables or
+lists stays there, and what it prints goes straight to the output of the
+process. If the function fails on any item, the error of the first item that
+failed is raised by `pmap` itself.
+
+Where processes can't be forked (on Windows), in processes that can't have
+children of their own (the workers of a pool, `tal --batch`...) and with a
+single worker, the function runs in the calling process instead, one item
+at a time.
+"""
+import math, multiprocessing, multiprocessing.pool, os, pickle, sys, threading
+
+# How many worker processes are used by default, see `configure`. None is
+# one per CPU.
+workers = None
+# How many times more chunks than workers the items are split into by
+# default, so that workers that finish early get more work.
+CHUNKS_PER_WORKER = 4
+
+# The function run by the workers, and the file they write to, set while
+# a pool is running
+_function = None
+_output = None
+_lock = threading.Lock()
+
+
+def configure(worker_count=None):
+    """Set how many worker processes are used by default (None for one per CPU)."""
+    global workers
+    if worker_count is not None and worker_count < 1:
+        raise ValueError('At least one worker is needed')
+    workers = worker_count
+
+
+def can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def flush(output):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if output is not None:
+        output.flush()
+
+
+def run_chunk(items):
+    """Run the function on some items, in a worker."""
+    try:
+        return True, [_function(item) for item in items]
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError(f'{e.__class__.__name__}: {e}')
+        return False, e
+    finally:
+        flush(_output)
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def map_(function, items, worker_count=None, chunk_size=None, output=None):
+    """
+    Call `function` with each item, on `worker_count` processes (by default,
+    see `configure`), `chunk_size` items at a time (by default, enough for
+    each worker to get a few chunks). Returns the results, in order.
+    `output` is a file the function writes to, besides stdout, which is
+    flushed before forking so that the workers don't write it again.
+    """
+    global _function, _output
+
+    items = list(items)
+    if worker_count is None:
+        worker_count = workers or os.cpu_count() or 1
+    if worker_count < 1:
+        raise ValueError('At least one worker is needed')
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(items) / (worker_count * CHUNKS_PER_WORKER)))
+    if chunk_size < 1:
+        raise ValueError('Chunks must hold at least one item')
+
+    worker_count = min(worker_count, math.ceil(len(items) / chunk_size))
+    if worker_count <= 1 or not can_fork() or multiprocessing.current_process().daemon:
+        return [function(item) for item in items]
+
+    context = multiprocessing.get_context('fork')
+    results = []
+    # The pool forks its workers again if one dies, so the function stays
+    # set until it is done.
+    with _lock:
+        flush(output)
+        _function, _output = function, output
+        try:
+            with context.Pool(worker_count) as pool:
+                try:
+                    for ok, value in pool.imap(run_chunk, chunks(items, chunk_size)):
+                        if not ok:
+                            raise value
+                        results.extend(value)
+                except multiprocessing.pool.MaybeEncodingError:
+                    raise TypeError(
+                        'Only values that can be sent to another process (not functions, files...) can be returned in parallel'
+                    ) from None
+        finally:
+            _function = _output = None
+    return results
+
+
+def for_(items, function, worker_count=None, chunk_size=None, output=None):
+    """Like `map_`, for functions run for what they do: the results are thrown away."""
+    def run(item):
+        function(item)
+
+    map_(run, items, worker_count, chunk_size, output)
@@ -0,0 +1,191 @@
+"""
+Finds out where the time goes when a Talon program runs.
+
+A `Profiler` times the phases of running a `.tal` file (parsing,
+transforming, optimizing, compiling and executing it). The program is
+compiled with every statement and function body wrapped in a closure that
+times it, so that the time spent executing it can be put down to the lines
+and functions of the Talon code, using the positions the transformer gives
+the nodes.
+
+Times are "self" times: the time of a line doesn't include the statements
+nested in it (the body of a loop...) or the functions it calls, which have
+times of their own. The self time of a function is the time spent calling it
+outside of its lines, so the self times of all the lines and functions add
+up to the time of the program. The total time of a function does include
+everything it calls, but only counts recursive calls once.
+
+`tal --profile` prints a report, and `tal --profile-output out.folded`
+writes the time spent in each stack of function calls (in microseconds) in
+the "collapsed stack" format read by flamegraph.pl, speedscope and other
+flamegraph tools.
+
+Files imported by the program aren't profiled: the time they take counts as
+the time of the line that imports them. Profiling makes programs several
+times slower, and a profiler is only meant to be used by one thread.
+"""
+import contextlib, os, time
+from . import talon, compiler, optimizer
+from .interpreter import Interpreter
+
+perf_counter = time.perf_counter
+
+
+class Profiler:
+    def __init__(self, name='<main>'):
+        # Name of the program, at the bottom of every stack
+        self.name = name
+        # phase -> seconds, in the order they ran
+        self.phases = {}
+        # line -> [times run, self time]
+        self.lines = {}
+        # (name, line) -> [calls, total time, self time, calls running]
+        self.functions = {}
+        # tuple of function names -> self time
+        self.stacks = {}
+        # The source code, to show the lines in the report
+        self.source = None
+
+        # [start time, time of the nested statements and calls] of the
+        # statements and calls running
+        self.running = []
+        # The names of the functions being called
+        self.path = (name,)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - start
+
+    def statement(self, compiled, node):
+        """Wrap a compiled statement to time it."""
+        if node.line is None:
+            return compiled
+        stats = self.lines.setdefault(node.line, [0, 0.0])
+        running = self.running
+        stacks = self.stacks
+
+        def timed(frame):
+            entry = [perf_counter(), 0.0]
+            running.append(entry)
+            try:
+                return compiled(frame)
+            finally:
+                elapsed = perf_counter() - entry[0]
+                running.pop()
+                running[-1][1] += elapsed
+                own = elapsed - entry[1]
+                stats[0] += 1
+                stats[1] += own
+                stacks[self.path] = stacks.get(self.path, 0.0) + own
+        return timed
+
+    def function(self, body, node):
+        """Wrap the compiled body of a function to time its calls."""
+        key = (node.name or '<anonymous>', node.line)
+        name = frame_name(*key)
+        stats = self.functions.setdefault(key, [0, 0.0, 0.0, 0])
+        running = self.running
+        stacks = self.stacks
+
+        def timed(frame):
+            path = self.path
+            self.path = path + (name,)
+            entry = [perf_counter(), 0.0]
+            running.append(entry)
+            stats[3] += 1
+            try:
+                return body(frame)
+            finally:
+                elapsed = perf_counter() - entry[0]
+                running.pop()
+                running[-1][1] += elapsed
+                own = elapsed - entry[1]
+                stats[0] += 1
+                stats[2] += own
+                stats[3] -= 1
+                if stats[3] == 0:
+                    stats[1] += elapsed
+                stacks[self.path] = stacks.get(self.path, 0.0) + own
+                self.path = path
+        return timed
+
+    def run_file(self, path, optimize=True):
+        """
+        Run a `.tal` file, timing each phase. Errors are raised like with
+        `talon.load` and `Interpreter.run_file`; what ran until then is
+        still in the profile.
+        """
+        with open(path, 'r') as f:
+            self.source = f.read()
+
+        with self.phase('load parser'):
+            parser = talon.get_parser()
+        with self.phase('parse'):
+            tree = parser.parse(self.source)
+        with self.phase('transform'):
+            program = talon.transform_tree(tree)
+        if optimize:
+            with self.phase('optimize'):
+                program = optimizer.optimize(program)
+
+        interpreter = Interpreter(optimize=optimize)
+        interpreter.symbols.imported.add(os.path.realpath(path))
+        with self.phase('compile'):
+            program = compiler.compile(program, interpreter.symbols, self)
+
+        with self.phase('execute'):
+            # The bottom of the stack, which the top level of the program
+            # runs in.
+            entry = [perf_counter(), 0.0]
+            self.running.append(entry)
+            self.path = (self.name,)
+            try:
+                return program()
+            finally:
+                self.running.pop()
+                own = perf_counter() - entry[0] - entry[1]
+                self.stacks[self.path] = self.stacks.get(self.path, 0.0) + own
+
+    def report(self, file=None, limit=20):
+        """Print the times of the phases, and the slowest functions and lines."""
+        print(f'Profile of {self.name}', file=file)
+
+        print('\n  phase          time (ms)', file=file)
+        for phase, seconds in self.phases.items():
+            print(f'  {phase:<13}{milliseconds(seconds)}', file=file)
+
+        total = sum(seconds for seconds in self.stacks.values()) or 1.0
+
+        if self.functions:
+            print('\n     calls   total (ms)    self (ms)  function', file=file)
+            functions = sorted(self.functions.items(), key=lambda item: item[1][1], reverse=True)
+            for (name, line), (calls, total_time, own, _) in functions[:limit]:
+                print(f'{calls:10}{milliseconds(total_time)}{milliseconds(own)}  {name} (line {line})', file=file)
+
+        if self.lines:
+            source = self.source.splitlines() if self.source is not None else []
+            print('\n      hits    self (ms)       %   line', file=file)
+            lines = sorted(self.lines.items(), key=lambda item: item[1][1], reverse=True)
+            for line, (hits, own) in lines[:limit]:
+                text = source[line - 1].strip() if line <= len(source) else ''
+                print(f'{hits:10}{milliseconds(own)}{own / total:8.1%}{line:7}  {text}', file=file)
+
+    def write_collapsed(self, file):
+        """Write the self time of each stack of calls, in microseconds."""
+        for path, seconds in sorted(self.stacks.items()):
+            microseconds = round(seconds * 1e6)
+            if microseconds > 0:
+                file.write(f'{";".join(path)} {microseconds}\n')
+
+
+def frame_name(name, line):
+    return f'{name}:{line}'
+
+
+def milliseconds(seconds, width=13, digits=3):
+    """Format a time in seconds as milliseconds, right-aligned in a column."""
+    return f'{seconds * 1000:{width}.{digits}f}'
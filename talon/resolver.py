@@ -0,0 +1,195 @@
+"""
+Works out where every variable lives before the code is run.
+
+Each function call gets a frame: a fixed-size list whose first item is the
+frame the function was created in and whose other items are the function's
+parameters and local variables. The resolver gives every `Identifier` that
+names a local variable a `depth` (how many frames up the variable is) and a
+`slot` (its index in that frame), and every `Function` the `size` of its
+frames. Identifiers that aren't local keep a `depth` of None; they are
+global variables and are looked up in the symbol table by index instead.
+
+A variable is local to a function from its `this` onwards. Before that, the
+same name refers to the variable of an enclosing function, or to a global.
+"""
+from . import nodes
+from .errors import SymbolExists
+
+
+class Scope:
+    def __init__(self, parent, params):
+        self.parent = parent
+        self.slots = {}
+        self.names = ['']
+        # Variables that can be used at the current point of the function.
+        self.visible = set()
+
+        for param in params:
+            if param in self.slots:
+                raise SymbolExists(f'Cannot recreate variable "{param}"')
+            self.declare(param)
+            self.visible.add(param)
+
+    def declare(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+
+
+def declarations(instructions):
+    """Yield the names declared with `this` in a codeblock, in order."""
+    if isinstance(instructions, nodes.If):
+        # `else if`
+        instructions = [instructions]
+
+    for node in instructions:
+        if isinstance(node, nodes.Assignment) and node.new:
+            yield node.identifier.name
+        elif isinstance(node, nodes.If):
+            yield from declarations(node.true_branch)
+            if node.false_branch is not None:
+                yield from declarations(node.false_branch)
+        elif isinstance(node, (nodes.For, nodes.While)):
+            yield from declarations(node.body)
+
+
+class Resolver:
+    def __init__(self):
+        self.scope = None
+
+    def lookup(self, node):
+        scope = self.scope
+        if scope is None:
+            return
+
+        if node.name in scope.visible:
+            node.depth = 0
+            node.slot = scope.slots[node.name]
+            return
+
+        depth = 1
+        scope = scope.parent
+        while scope is not None:
+            if node.name in scope.slots:
+                node.depth = depth
+                node.slot = scope.slots[node.name]
+                return
+            depth += 1
+            scope = scope.parent
+
+    def resolve(self, node):
+        if node is None:
+            return
+        getattr(self, 'resolve_' + node.__class__.__name__)(node)
+
+    def resolve_Instructions(self, node):
+        for child in node:
+            self.resolve(child)
+
+    def resolve_Primitive(self, node):
+        pass
+
+    def resolve_Identifier(self, node):
+        self.lookup(node)
+
+    def resolve_List(self, node):
+        for value in node.values:
+            self.resolve(value)
+
+    resolve_Set = resolve_List
+
+    def resolve_Dict(self, node):
+        for key, value in zip(node.keys, node.values):
+            self.resolve(key)
+            self.resolve(value)
+
+    def resolve_ListAccess(self, node):
+        self.resolve(node.list)
+        self.resolve(node.index)
+
+    def resolve_ListAssign(self, node):
+        self.resolve(node.list)
+        self.resolve(node.index)
+        self.resolve(node.value)
+
+    def resolve_ListSlice(self, node):
+        self.resolve(node.list)
+        self.resolve(node.start)
+        self.resolve(node.end)
+
+    def resolve_Attribute(self, node):
+        self.resolve(node.value)
+
+    def resolve_Range(self, node):
+        self.resolve(node.start)
+        self.resolve(node.end)
+
+    def resolve_Assignment(self, node):
+        # The value is worked out before the variable exists, so in
+        # `this x = x` the second `x` is an outer one.
+        self.resolve(node.value)
+        if node.new and self.scope is not None:
+            self.scope.visible.add(node.identifier.name)
+        self.lookup(node.identifier)
+
+    def resolve_CompOp(self, node):
+        self.lookup(node.identifier)
+        self.resolve(node.value)
+
+    def resolve_BinOp(self, node):
+        self.resolve(node.left)
+        self.resolve(node.right)
+
+    resolve_Arithmetic = resolve_Comparison = resolve_Logical = resolve_BinOp
+
+    def resolve_UnaryOp(self, node):
+        self.resolve(node.value)
+
+    def resolve_If(self, node):
+        self.resolve(node.condition)
+        self.resolve(node.true_branch)
+        self.resolve(node.false_branch)
+
+    def resolve_For(self, node):
+        self.lookup(node.var)
+        self.resolve(node.sequence)
+        self.resolve(node.body)
+
+    def resolve_While(self, node):
+        self.resolve(node.condition)
+        self.resolve(node.body)
+
+    def resolve_ReturnInstruction(self, node):
+        self.resolve(node.expression)
+
+    def resolve_BreakInstruction(self, node):
+        pass
+
+    def resolve_Function(self, node):
+        scope = Scope(self.scope, [param.name for param in node.params])
+        for name in declarations(node.body):
+            scope.declare(name)
+
+        for param in node.params:
+            param.depth = 0
+            param.slot = scope.slots[param.name]
+
+        self.scope = scope
+        try:
+            self.resolve(node.body)
+        finally:
+            self.scope = scope.parent
+
+        node.size = len(scope.names)
+        node.names = tuple(scope.names)
+
+    def resolve_FunctionCall(self, node):
+        self.resolve(node.value)
+        for param in node.params:
+            self.resolve(param)
+
+
+def resolve(instructions):
+    """Resolve the variables of a program in place, and return it."""
+    Resolver().resolve(instructions)
+    return instructions
@@ -1,64 +1,79 @@
+import threading
 from .errors import *
 
 
-class SymbolTable:
-    __func  = 'functions'
-    __sym   = 'symbols'
-    __local = 'locals'
+class Undefined:
+    def __repr__(self):
+        return '<undefined>'
 
-    __table = {__func: {}, __sym: {}, __local: []}
 
-    def __is_local(self):
-        return len(self.__table[self.__local]) > 0
+# The value of a variable that doesn't exist (yet).
+UNDEFINED = Undefined()
 
-    def table(self):
-        return self.__table
 
-    def get_local_table(self):
-        return self.__table[self.__local][-1]
+class SymbolTable:
+    """
+    The global variables. Every name gets an index the first time code
+    using it is compiled, so compiled code can get to a variable without
+    looking its name up. Local variables don't live here, they are kept in
+    the frames of function calls (see `resolver.py`).
+    """
 
-    def set_local(self, flag):
-        if flag:
-            self.__table[self.__local].append({})
-        else:
-            self.__table[self.__local].pop()
+    def __init__(self):
+        self.__index = {}
+        self.__names = []
+        # Compiled code keeps a reference to this list, so it is only ever
+        # appended to.
+        self.values = []
+        # The absolute paths of the files imported into these globals with
+        # `import('file.tal')`, see `modules.py`.
+        self.imported = set()
+        # index -> value of the builtins, see `set_builtin`.
+        self.builtins = {}
+        self.__lock = threading.Lock()
 
-    def get_sym(self, sym):
-        if self.__is_local():
-            for table in reversed(self.__table[self.__local]):
-                if sym in table:
-                    return table[sym]
+    def index(self, sym):
+        index = self.__index.get(sym)
+        if index is None:
+            with self.__lock:
+                index = self.__index.get(sym)
+                if index is None:
+                    self.__names.append(sym)
+                    self.values.append(UNDEFINED)
+                    index = self.__index[sym] = len(self.__names) - 1
+        return index
 
-        if sym in self.__table[self.__sym]:
-            return self.__table[self.__sym][sym]
+    def name(self, index):
+        return self.__names[index]
 
-        raise SymbolNotFound(f'Symbol "{sym}" not found')
+    def get_sym(self, sym):
+        value = self.values[self.index(sym)]
+        if value is UNDEFINED:
+            raise SymbolNotFound(f'Symbol "{sym}" not found')
+        return value
+
+    def is_builtin(self, index):
+        """Whether the variable at `index` still holds the builtin set with `set_builtin`."""
+        return index in self.builtins and self.values[index] is self.builtins[index]
 
     def set_sym(self, sym, val, new=False):
-        if new and self.__is_local() and sym in self.get_local_table():
-            raise SymbolExists(f'Cannot recreate variable "{sym}"')
-        elif new and sym in self.__table[self.__sym] and not self.__is_local():
+        index = self.index(sym)
+        if new and self.values[index] is not UNDEFINED and not self.is_builtin(index):
             raise SymbolExists(f'Cannot recreate variable "{sym}"')
-        elif new:
-            if self.__is_local():
-                self.get_local_table()[sym] = val
-            else:
-                self.__table[self.__sym][sym] = val
-        else:
-            if self.__is_local():
-                for table in reversed(self.__table[self.__local]):
-                    if sym in table:
-                        table[sym] = val
-                        return
-                if sym in self.__table[self.__sym]:
-                    self.__table[self.__sym][sym] = val
-                    return
-                raise SymbolNotFound(f'Symbol "{sym}" not found')
-            else:
-                if sym in self.__table[self.__sym]:
-                    self.__table[self.__sym][sym] = val
-                else:
-                    raise SymbolNotFound(f'Symbol "{sym}" not found')
+        elif not new and self.values[index] is UNDEFINED:
+            raise SymbolNotFound(f'Symbol "{sym}" not found')
+        self.values[index] = val
 
     def set_global(self, sym, val):
-        self.__table[self.__sym][sym] = val
\ No newline at end of file
+        self.values[self.index(sym)] = val
+
+    def set_builtin(self, sym, val):
+        """
+        Set a builtin. Unlike other global variables, Talon code can declare
+        a variable of its own with the same name (`this len = ...`, `fun
+        sum(...)`), which replaces the builtin for the code using these
+        globals.
+        """
+        index = self.index(sym)
+        self.values[index] = val
+        self.builtins[index] = val
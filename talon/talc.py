@@ -0,0 +1,118 @@
+"""
+Reads and writes compiled Talon programs: the `.talc` files made by `tal -c`,
+which hold the bytecode of a program (see `bytecode.py`) for the VM to run
+(see `vm.py`).
+
+The file is a magic number, a format version, a table of where each code
+object is in the file, and the code objects, marshalled one by one (see
+`bytecode.Code.to_record`), so loading a file doesn't run any code and
+doesn't unpickle anything. The code of the program itself comes first; the
+code object of a function is stored in the constants of the code making it
+as its index in the table.
+
+Loading a program maps the file into memory and only decodes the code of
+the program itself; the code of a function is decoded the first time it is
+used. Until then it takes no memory of its own, and processes running the
+same program share the pages of the file.
+
+Files are written to a temporary file which then replaces the old one, so
+a process using a mapped file never sees it change.
+"""
+import marshal, mmap, os, struct, threading
+from . import bytecode
+
+MAGIC = b'TALC'
+# The version of the format of the files, which changes along with the
+# bytecode.
+VERSION = 9
+HEADER = struct.Struct('<4sHI')
+# (offset, length) of each code object in the file
+ENTRY = struct.Struct('<II')
+
+
+class Image:
+    """The contents of a `.talc` file, mapped into memory if possible."""
+
+    def __init__(self, data):
+        self.data = data
+        if len(data) < HEADER.size:
+            raise ValueError('Not a compiled Talon file')
+
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('Not a compiled Talon file')
+        if version != VERSION:
+            raise ValueError(f'Compiled Talon file has format version {version}, expected {VERSION}; recompile it')
+
+        end = HEADER.size + count * ENTRY.size
+        if count == 0 or len(data) < end:
+            raise ValueError('Compiled Talon file is damaged')
+        self.entries = list(ENTRY.iter_unpack(data[HEADER.size:end]))
+        if any(offset + length > len(data) for offset, length in self.entries):
+            raise ValueError('Compiled Talon file is damaged')
+
+    @classmethod
+    def read(cls, file):
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # Not a real file, or an empty one
+            data = file.read()
+        return cls(data)
+
+    def code(self, index):
+        """Decode the code object at `index`, without decoding the functions it makes."""
+        def function(index, arity, padding):
+            if not 0 < index < len(self.entries):
+                raise ValueError
+            return bytecode.Code.lazy(self, index, arity, padding)
+
+        offset, length = self.entries[index]
+        try:
+            return bytecode.Code.from_record(marshal.loads(self.data[offset:offset + length]), function)
+        except (EOFError, TypeError, ValueError):
+            raise ValueError('Compiled Talon file is damaged') from None
+
+
+def dump(program, file):
+    """Write a program (a `bytecode.Code`, or a tree made by `talon.load`) in the `.talc` format."""
+    if not isinstance(program, bytecode.Code):
+        program = bytecode.compile(program)
+
+    records = []
+
+    def index(code):
+        position = len(records)
+        records.append(None)
+        records[position] = marshal.dumps(code.to_record(index))
+        return position
+
+    index(program)
+
+    offset = HEADER.size + len(records) * ENTRY.size
+    file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+    for record in records:
+        file.write(ENTRY.pack(offset, len(record)))
+        offset += len(record)
+    for record in records:
+        file.write(record)
+
+
+def load(file):
+    """Load the program in a `.talc` file, without decoding its functions yet."""
+    return Image.read(file).code(0)
+
+
+def write(program, path):
+    """Write a program to a `.talc` file, replacing it all at once."""
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            dump(program, f)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
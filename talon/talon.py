@@ -1,39 +1,161 @@
 from lark import Lark, UnexpectedInput
+from lark.exceptions import VisitError
 from .transformer import Transformer
 from .__init__ import __version__
-import pickle, os, tinted
-from . import environment
+import argparse, json, os, sys, threading, tinted
+from . import compiler, talc, interpreter, optimizer, cache, parallel
+
+
+GRAMMAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'syntax.lark')
+
+
+class Postlexer:
+    """
+    Drops the newlines that don't end an instruction: the ones inside
+    parentheses, brackets or the braces of a dict or set, and the ones right
+    after a binary operator. Braces right after `)`, `->` or `else` are a
+    codeblock, where newlines do end instructions.
+    """
+    always_accept = ('_NL',)
+
+    __continued = {
+        '+', '-', '*', '/', '%', '^', '==', '!=', '<', '>', '<=', '>=', '&&', '||',
+        '=', '+=', '-=', '*=', '/=', '%=', '^=', ',', '->', 'to', 'upto', 'else', 'in', ':'
+    }
+    __opening = {'LPAR': 'RPAR', 'LSQB': 'RSQB', 'LBRACE': 'RBRACE'}
+    __before_codeblock = {')', '->', 'else'}
+
+    def process(self, stream):
+        # The closing token of each open bracket, and whether newlines
+        # inside it are dropped
+        brackets = []
+        previous = None
+
+        for token in stream:
+            if token.type == '_NL':
+                if brackets and brackets[-1][1]:
+                    continue
+                if previous is not None and previous.type != 'STRING' and previous.value in self.__continued:
+                    continue
+            elif token.type in self.__opening:
+                codeblock = (
+                    token.type == 'LBRACE' and previous is not None
+                    and previous.type != 'STRING' and previous.value in self.__before_codeblock
+                )
+                brackets.append((self.__opening[token.type], not codeblock))
+            elif brackets and token.type == brackets[-1][0]:
+                brackets.pop()
+
+            previous = token
+            yield token
+
+
+_parser = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    # Building the LALR tables is by far the most expensive part of parsing,
+    # so there is one parser per process and Lark caches the tables on disk.
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                with open(GRAMMAR, 'r') as f:
+                    _parser = Lark(f.read(), parser='lalr', postlex=Postlexer(), cache=True)
+    return _parser
+
+
+def load(code, optimize=True):
+    """
+    Parse, transform and optimize Talon source code. Unlike `parse` and
+    `transform`, errors are raised (`lark.UnexpectedInput` or `SyntaxError`)
+    instead of printed.
+    """
+    transformed = transform_tree(get_parser().parse(code))
+    if optimize:
+        transformed = optimizer.optimize(transformed)
+    return transformed
+
+
+def transform_tree(tree):
+    """Transform a parse tree into nodes, raising `SyntaxError`s."""
+    try:
+        return Transformer().transform(tree)
+    except VisitError as e:
+        if isinstance(e.orig_exc, SyntaxError):
+            raise e.orig_exc from None
+        raise
+
+
+def print_syntax_error(e, code):
+    if isinstance(e, UnexpectedInput):
+        print(tinted.tint(f'[red][bold]Syntax error[/][/] at [blue][bold]line[/][/] {e.line}, [blue][bold]column[/][/] {e.column}\n\n{e.get_context(code)}'))
+    else:
+        print(tinted.tint(f'[red][bold]Syntax error[/][/]: {e}'))
 
 
 def parse(code):
-    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'syntax.lark'), 'r') as f:
-        syntax = f.read()
-    parser = Lark(syntax)
     try:
-        return parser.parse(code)
+        return get_parser().parse(code)
     except UnexpectedInput as e:
-        print(tinted.tint(f'[red][bold]Syntax error[/][/] at [blue][bold]line[/][/] {e.line}, [blue][bold]column[/][/] {e.column}\n\n{e.get_context(code)}'))
+        print_syntax_error(e, code)
         exit(1)
 
 
 def transform(tree):
     transformer = Transformer()
-    return transformer.transform(tree)
+    try:
+        return transformer.transform(tree)
+    except VisitError as e:
+        if not isinstance(e.orig_exc, SyntaxError):
+            raise
+        print_syntax_error(e.orig_exc, None)
+        exit(1)
 
 
 def execute(transformed):
-    environment.define_builtins()
-    return transformed.eval()
+    return interpreter.Interpreter().execute(transformed)
+
+
+# The size of the buffer of `buffered_stdout`
+STDOUT_BUFFER_SIZE = 1 << 16
+
+
+def buffered_stdout():
+    """
+    Get a file writing to stdout that is only flushed when its buffer is
+    full (or when a program asks for input), instead of after every line
+    when stdout is a terminal.
+    """
+    sys.stdout.flush()
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, OSError):
+        # Not a real file
+        return sys.stdout
+    return open(
+        fileno, 'w', buffering=STDOUT_BUFFER_SIZE, encoding=sys.stdout.encoding,
+        errors=sys.stdout.errors, closefd=False
+    )
 
 
-def talon(inputfile: str, compile=False, outputfile=None):
+def talon(inputfile: str, compile=False, outputfile=None, optimize=True, buffered=False):
     if inputfile.endswith('.tal'):
         with open(inputfile, 'r') as input:
             code = input.read()
-            temp = transform(parse(code))
+        try:
+            temp = cache.load(code, optimize)
+        except (UnexpectedInput, SyntaxError) as e:
+            print_syntax_error(e, code)
+            exit(1)
     elif inputfile.endswith('.talc'):
-        with open(inputfile, 'rb') as f:
-            temp = pickle.load(f)
+        try:
+            with open(inputfile, 'rb') as f:
+                temp = talc.load(f)
+        except ValueError as e:
+            print(tinted.tint(f'[red][bold]Error[/][/]: {e}'))
+            exit(1)
     else:
         print(tinted.tint('[red][bold]Error[/][/]: Invalid file extension'))
         exit(1)
@@ -44,29 +166,159 @@ def talon(inputfile: str, compile=False, outputfile=None):
             else:
                 if not outputfile.endswith('.talc'):
                     outputfile += '.talc'
-            with open(outputfile, 'wb') as f:
-                pickle.dump(temp, f)
+            talc.write(temp, outputfile)
+        elif buffered:
+            stdout = buffered_stdout()
+            try:
+                interpreter.Interpreter(optimize=optimize, stdout=stdout).execute(temp, inputfile)
+            finally:
+                stdout.flush()
         else:
-            execute(temp)
+            interpreter.Interpreter(optimize=optimize).execute(temp, inputfile)
+
+    except Exception as e:
+        print(tinted.tint(f'[red][bold]{str(e.__class__.__name__)}[/][/]: {str(e)}'))
+        exit(1)
+
 
+def profile(inputfile, optimize=True, outputfile=None):
+    from .profiler import Profiler
+
+    if not inputfile.endswith('.tal'):
+        print(tinted.tint('[red][bold]Error[/][/]: Only .tal files can be profiled'))
+        exit(1)
+
+    profiler = Profiler(os.path.basename(inputfile))
+    failed = False
+    try:
+        profiler.run_file(inputfile, optimize)
+    except (UnexpectedInput, SyntaxError) as e:
+        print_syntax_error(e, profiler.source)
+        exit(1)
     except Exception as e:
         print(tinted.tint(f'[red][bold]{str(e.__class__.__name__)}[/][/]: {str(e)}'))
+        failed = True
+
+    # The report goes to stderr, so that it doesn't get mixed up with the
+    # output of the program.
+    print(file=sys.stderr)
+    profiler.report(sys.stderr)
+    if outputfile is not None:
+        with open(outputfile, 'w') as f:
+            profiler.write_collapsed(f)
+    if failed:
         exit(1)
 
 
 def main():
-    import sys
-    if len(sys.argv) == 2 and (sys.argv[1] == '--version' or sys.argv[1] == '-v'):
-        print(__version__)
-    elif len(sys.argv) == 2:
-        talon(sys.argv[1])
-    elif len(sys.argv) == 3 and sys.argv[1] == '-c':
-        talon(sys.argv[2], compile=True)
-    elif len(sys.argv) == 5 and sys.argv[1] == '-c' and sys.argv[3] == '-o':
-        talon(sys.argv[2], compile=True, outputfile=sys.argv[4])
+    if sys.argv[1:2] == ['bench']:
+        from . import bench
+        bench.main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        prog='tal', description='Run or compile Talon programs.',
+        epilog='Use `tal bench` to time the benchmark suite (see `tal bench -h`).'
+    )
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    parser.add_argument('-c', '--compile', action='store_true', help='compile the input to bytecode instead of running it')
+    parser.add_argument('-o', '--output', metavar='output.talc', help='name of the compiled file (only with -c)')
+    parser.add_argument(
+        '--max-depth', type=int, default=compiler.max_depth, metavar='N',
+        help='how deeply function calls can be nested, not counting tail calls (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--no-optimize', action='store_true',
+        help="don't fold constants or drop unreachable code before running or compiling"
+    )
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='run the program again every time the file changes, only parsing the parts that changed'
+    )
+    parser.add_argument(
+        '--buffer-output', action='store_true',
+        help='write the output of the program in big blocks instead of line by line'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='time the phases of running the program, and the lines and functions of its code, and print a report to stderr'
+    )
+    parser.add_argument(
+        '--profile-output', metavar='output.folded',
+        help='also write the time spent in each stack of calls, for flamegraph tools (implies --profile)'
+    )
+    parser.add_argument(
+        '--batch', action='store_true',
+        help='run every program in the inputs (files or directories) on a pool of processes, and print a JSON summary'
+    )
+    parser.add_argument(
+        '--cache-dir', metavar='DIR',
+        help='where to keep the programs parsed from .tal files (default: $TALON_CACHE_DIR, or ~/.cache/talon)'
+    )
+    parser.add_argument(
+        '--cache-size', type=float, default=cache.DEFAULT_MAX_SIZE / (1024 * 1024), metavar='MB',
+        help='how big the cache can get before the programs used the longest time ago are deleted (default: %(default)g)'
+    )
+    parser.add_argument(
+        '--workers', type=int, metavar='N',
+        help='how many processes pmap and pfor use by default (default: one per CPU)'
+    )
+    parser.add_argument('--no-cache', action='store_true', help="parse .tal files every time instead of caching them")
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', help='how many programs to run at once with --batch (default: one per CPU)')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS', help='stop programs run with --batch after this long')
+    parser.add_argument('input', metavar='input.tal[c]', nargs='+')
+    args = parser.parse_args()
+
+    if args.output is not None and not args.compile:
+        parser.error('-o can only be used with -c')
+    if not 1 <= args.max_depth <= compiler.MAX_DEPTH:
+        parser.error(f'--max-depth must be between 1 and {compiler.MAX_DEPTH}')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.cache_size < 0:
+        parser.error('--cache-size can\'t be negative')
+    if args.profile_output is not None:
+        args.profile = True
+    if args.watch:
+        if args.compile or args.batch or args.profile or args.buffer_output:
+            parser.error('--watch can\'t be used with -c, --batch, --profile or --buffer-output')
+        if not args.input[0].endswith('.tal'):
+            parser.error('--watch only works with .tal files')
+    if args.buffer_output and (args.compile or args.batch or args.profile):
+        parser.error('--buffer-output can only be used when running a program')
+    if args.profile and (args.compile or args.batch):
+        parser.error('--profile can\'t be used with -c or --batch')
+    if args.batch:
+        if args.compile:
+            parser.error('-c can\'t be used with --batch')
+        if args.jobs is not None and args.jobs < 1:
+            parser.error('-j must be at least 1')
+    elif len(args.input) > 1 or args.jobs is not None or args.timeout is not None:
+        parser.error('several inputs, -j and --timeout can only be used with --batch')
+
+    compiler.set_max_depth(args.max_depth)
+    cache.configure(not args.no_cache, args.cache_dir, int(args.cache_size * 1024 * 1024))
+    parallel.configure(args.workers)
+
+    if args.batch:
+        from . import batch
+        results = batch.run(args.input, args.jobs, args.timeout, not args.no_optimize, args.max_depth)
+        print(json.dumps(batch.summary(results), indent=2))
+        if any(result.exit_code != 0 for result in results):
+            exit(1)
+    elif args.watch:
+        from .watch import watch
+        try:
+            watch(args.input[0], optimize=not args.no_optimize)
+        except KeyboardInterrupt:
+            pass
+    elif args.profile:
+        profile(args.input[0], optimize=not args.no_optimize, outputfile=args.profile_output)
     else:
-        print('Usage: tal [-c] <input.tal[c]> [-o <output.talc>]')
-        exit(1)
+        talon(
+            args.input[0], compile=args.compile, outputfile=args.output,
+            optimize=not args.no_optimize, buffered=args.buffer_output
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,77 @@
+"""
+Lets Talon code wait for several things at once.
+
+`spawn(f, args...)` starts a call of a function in a thread of its own and
+gives a task, and `await(task)` waits for the call to finish and gives its
+result (or raises its error). While a task is waiting (for `sleep`, a file,
+input...), the other tasks and the rest of the program keep running.
+
+Builtins can be Python coroutine functions (`async def`). They run on an
+asyncio event loop, while the Talon code calling them waits for the result
+without stopping other tasks. The loop is the one the program is run from
+with `Interpreter.execute_async` (or `run_async`, `run_file_async`), so
+Talon code can be used from asyncio programs, or otherwise a loop running in
+a background thread.
+"""
+import asyncio, contextvars, functools, threading
+from . import compiler
+from .values import Task
+
+# The loop of the `Interpreter.execute_async` running the code, if any
+running_loop = contextvars.ContextVar('running_loop', default=None)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop():
+    """The event loop, running in a thread of its own, used when there is no other."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='talon-event-loop', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def wait(coroutine):
+    """Run a coroutine on the event loop, and wait for its result."""
+    loop = running_loop.get() or background_loop()
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    if current is loop:
+        coroutine.close()
+        raise RuntimeError('Talon code called from a coroutine can\'t wait for async builtins')
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+def blocking(func):
+    """Turn a coroutine function into a function that waits for its result."""
+    @functools.wraps(func)
+    def call(*args):
+        return wait(func(*args))
+    return call
+
+
+def spawn(function, *args):
+    """Start calling a function in a new thread, and get the `Task` of the call."""
+    task = Task()
+    # The thread has a stack as big as the one running the program, and
+    # uses the same event loop as the code spawning it.
+    task._thread = compiler.start(task._run, function, args, name='talon-task')
+    return task
+
+
+def await_(tasks):
+    """Wait for a task, or a list of them, and get the result (or the list of results)."""
+    if isinstance(tasks, Task):
+        return tasks.result()
+    return [task.result() for task in tasks]
+
+
+async def sleep(seconds):
+    await asyncio.sleep(seconds)
@@ -3,6 +3,25 @@ from . import nodes
 
 
 class Transformer(lark.Transformer):
+    def _call_userfunc(self, tree, new_children=None):
+        node = super()._call_userfunc(tree, new_children)
+        if isinstance(node, nodes.BaseExpr) and node.line is None:
+            # A node starts where its first token or node with a position
+            # does. Keywords and punctuation aren't kept in the tree, so
+            # that can be a bit after the start of the rule (the name of
+            # `fun name(...)`, the condition of an `if`...). Asking Lark to
+            # track the positions of rules makes parsing much slower.
+            for child in tree.children if new_children is None else new_children:
+                if isinstance(child, (list, tuple, nodes.Instructions)):
+                    # Parameters, a codeblock or a pair of a dict
+                    child = next(iter(child), None)
+                line = getattr(child, 'line', None)
+                if line is not None:
+                    node.line = line
+                    node.column = child.column
+                    break
+        return node
+
     def start(self, args):
         return nodes.Instructions(args)
 
@@ -23,7 +42,7 @@ class Transformer(lark.Transformer):
         return nodes.Primitive(s)
 
     def var(self, args):
-        return nodes.Identifier(args[0])
+        return nodes.Identifier(str(args[0]))
 
     def true(self, args):
         return nodes.Primitive(True)
@@ -32,10 +51,17 @@ class Transformer(lark.Transformer):
         return nodes.Primitive(False)
 
     def list(self, args):
-        # Lists are simply an Instructions object. When evaled, an
-        # Instructions object will return a list of all of its
-        # evaluated values.
-        return nodes.List(nodes.Instructions(args))
+        return nodes.List(self.values(args))
+
+    def dict(self, args):
+        pairs = self.values(args)
+        return nodes.Dict([key for key, _ in pairs], [value for _, value in pairs])
+
+    def pair(self, args):
+        return (args[0], args[1])
+
+    def set(self, args):
+        return nodes.Set(self.values(args))
 
     def list_access(self, args):
         return nodes.ListAccess(args[0], args[1])
@@ -46,6 +72,9 @@ class Transformer(lark.Transformer):
     def list_assign(self, args):
         return nodes.ListAssign(args[0], args[1], args[2], args[3])
 
+    def attribute(self, args):
+        return nodes.Attribute(args[0], str(args[1]))
+
     def range_incl(self, args):
         return nodes.Range(args[0], args[1], True)
 
@@ -62,59 +91,65 @@ class Transformer(lark.Transformer):
         return nodes.UnaryOp('!', args[0])
 
     def add(self, args):
-        return nodes.BinOp('+', args[0], args[1])
+        return nodes.Arithmetic('+', args[0], args[1])
 
     def sub(self, args):
-        return nodes.BinOp('-', args[0], args[1])
+        return nodes.Arithmetic('-', args[0], args[1])
 
     def mul(self, args):
-        return nodes.BinOp('*', args[0], args[1])
+        return nodes.Arithmetic('*', args[0], args[1])
 
     def div(self, args):
-        return nodes.BinOp('/', args[0], args[1])
+        return nodes.Arithmetic('/', args[0], args[1])
 
     def mod(self, args):
-        return nodes.BinOp('%', args[0], args[1])
+        return nodes.Arithmetic('%', args[0], args[1])
 
     def pow(self, args):
-        return nodes.BinOp('^', args[0], args[1])
+        return nodes.Arithmetic('^', args[0], args[1])
 
     def eq(self, args):
-        return nodes.BinOp('==', args[0], args[1])
+        return nodes.Comparison('==', args[0], args[1])
 
     def neq(self, args):
-        return nodes.BinOp('!=', args[0], args[1])
+        return nodes.Comparison('!=', args[0], args[1])
 
     def lt(self, args):
-        return nodes.BinOp('<', args[0], args[1])
+        return nodes.Comparison('<', args[0], args[1])
 
     def gt(self, args):
-        return nodes.BinOp('>', args[0], args[1])
+        return nodes.Comparison('>', args[0], args[1])
 
     def lteq(self, args):
-        return nodes.BinOp('<=', args[0], args[1])
+        return nodes.Comparison('<=', args[0], args[1])
 
     def gteq(self, args):
-        return nodes.BinOp('>=', args[0], args[1])
+        return nodes.Comparison('>=', args[0], args[1])
+
+    def in_(self, args):
+        return nodes.Comparison('in', args[0], args[1])
 
     def and_(self, args):
-        return nodes.BinOp('&&', args[0], args[1])
+        return nodes.Logical('&&', args[0], args[1])
 
     def or_(self, args):
-        return nodes.BinOp('||', args[0], args[1])
+        return nodes.Logical('||', args[0], args[1])
 
     def assign_var(self, args):
         # Variable assignments don't have to have a value, like in `this x`.
         # If they don't, the value of the assignment is None.
         if args[1] is None:
             args[1] = nodes.Primitive(None)
-        return nodes.Assignment(nodes.Identifier(args[0]), args[1], new=True)
+        elif isinstance(args[1], nodes.Function) and args[1].name is None:
+            # `this name = (...) -> ...` names the function like `fun name(...)`.
+            args[1].name = str(args[0])
+        return nodes.Assignment(nodes.Identifier(str(args[0])), args[1], new=True)
 
     def assign_value(self, args):
         if args[1] == '=':
-            return nodes.Assignment(nodes.Identifier(args[0]), args[2])
+            return nodes.Assignment(nodes.Identifier(str(args[0])), args[2])
         else:
-            return nodes.CompOp(nodes.Identifier(args[0]), args[1].value, args[2])
+            return nodes.CompOp(nodes.Identifier(str(args[0])), args[1].value, args[2])
 
     def if_(self, args):
         return nodes.If(args[0], args[1])
@@ -136,25 +171,48 @@ class Transformer(lark.Transformer):
 
     def fun_def(self, args):
         # Create and assign a function to a variable.
-        return nodes.Assignment(nodes.Identifier(args[0].value), nodes.Function(args[1], args[2]), new=True)
+        function = nodes.Function(args[1], args[2], args[0].value)
+        function.line, function.column = args[0].line, args[0].column
+        return nodes.Assignment(nodes.Identifier(args[0].value), function, new=True)
 
     def anon_fun(self, args):
         return nodes.Function(args[0], args[1])
 
+    def arrow_fun(self, args):
+        return nodes.Function(self.arrow_args(args[:-1]), args[-1])
+
     def lambda_(self, args):
         # Lambdas are the almost same as anonymous functions, their one difference
         # being they have a single expression as their body instead of a codeblock.
         # This means that we have to create a 'mini codeblock' with a single
         # return instruction as the body.
-        return nodes.Function(args[0], nodes.Instructions([nodes.ReturnInstruction(args[1])]))
+        ret = nodes.ReturnInstruction(args[-1])
+        if args[-1] is not None:
+            # `() -> ()` has no expression, and returns nothing.
+            ret.line, ret.column = args[-1].line, args[-1].column
+        return nodes.Function(self.arrow_args(args[:-1]), nodes.Instructions([ret]))
+
+    def arrow_args(self, args):
+        # The grammar parses the parameters of arrow functions as expressions,
+        # so make sure that they are all plain names.
+        params = []
+        for arg in args:
+            if arg is None:
+                continue
+            if not isinstance(arg, nodes.Identifier):
+                raise SyntaxError(f'Invalid parameter {arg!r} in arrow function')
+            params.append(nodes.Identifier(arg.name))
+        return params
 
     def fun_args(self, args):
-        # args[0] can be None, meaning there are no arguments
-        if args[0] is None:
-            temp = None
-        else:
-            temp = [nodes.Identifier(arg.value) for arg in args]
-        return nodes.Instructions(temp)
+        return [nodes.Identifier(arg.value) for arg in self.values(args)]
 
     def fun_call(self, args):
-        return nodes.FunctionCall(args[0], nodes.Instructions(args[1:]))
\ No newline at end of file
+        return nodes.FunctionCall(args[0], self.values(args[1:]))
+
+    def values(self, args):
+        # Optional lists in the grammar give a single None when they are
+        # empty, like in `[]` or `f()`.
+        if args == [None]:
+            return []
+        return args
\ No newline at end of file
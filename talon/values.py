@@ -0,0 +1,503 @@
+"""Types of Talon values that aren't plain Python ones."""
+import array, operator, os, threading
+from collections import OrderedDict
+from itertools import repeat
+from .errors import SymbolNotFound
+from .nodes import CallableExpr
+from .symbols import UNDEFINED
+
+
+class Range:
+    """
+    The value of `a to b` and `a upto b`. It behaves like a list of the
+    numbers in the range, but doesn't store them: iterating, indexing,
+    slicing and taking the length work on a Python `range`. The list is only
+    built if the range is changed (with `append`, `sort`, `r[i] = x`...).
+    """
+    __slots__ = ('_range', '_list')
+
+    def __init__(self, start, end, inclusive=False):
+        self._range = range(start, end + 1 if inclusive else end)
+        self._list = None
+
+    @classmethod
+    def _from_range(cls, r):
+        self = cls.__new__(cls)
+        self._range = r
+        self._list = None
+        return self
+
+    def _items(self):
+        return self._range if self._list is None else self._list
+
+    def _materialize(self):
+        if self._list is None:
+            self._list = list(self._range)
+        return self._list
+
+    def __repr__(self):
+        return repr(list(self._items()))
+
+    def __len__(self):
+        return len(self._items())
+
+    def __iter__(self):
+        return iter(self._items())
+
+    def __reversed__(self):
+        return reversed(self._items())
+
+    def __contains__(self, value):
+        return value in self._items()
+
+    def __getitem__(self, index):
+        if self._list is None and isinstance(index, slice):
+            return Range._from_range(self._range[index])
+        return self._items()[index]
+
+    def __setitem__(self, index, value):
+        self._materialize()[index] = value
+
+    def __delitem__(self, index):
+        del self._materialize()[index]
+
+    def __eq__(self, other):
+        if isinstance(other, Range):
+            other = other._items()
+        if isinstance(other, (list, range)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if isinstance(other, (list, Range)):
+            return list(self._items()) + list(other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            return other + list(self._items())
+        return NotImplemented
+
+    def __iadd__(self, other):
+        self._materialize().extend(other)
+        return self
+
+    def __mul__(self, other):
+        return list(self._items()) * other
+
+    __rmul__ = __mul__
+
+    def __imul__(self, other):
+        items = self._materialize()
+        items *= other
+        return self
+
+    def index(self, value):
+        return self._items().index(value)
+
+    def count(self, value):
+        return self._items().count(value)
+
+    def copy(self):
+        return Range._from_range(self._range) if self._list is None else self._list.copy()
+
+    def append(self, value):
+        self._materialize().append(value)
+
+    def extend(self, values):
+        self._materialize().extend(values)
+
+    def insert(self, index, value):
+        self._materialize().insert(index, value)
+
+    def pop(self, index=-1):
+        return self._materialize().pop(index)
+
+    def remove(self, value):
+        self._materialize().remove(value)
+
+    def reverse(self):
+        self._materialize().reverse()
+
+    def sort(self, **kwargs):
+        self._materialize().sort(**kwargs)
+
+
+class Module:
+    """
+    The value of `import('b.tal', 'b')`: the global variables of a Talon file,
+    which are used as `b.name`.
+    """
+    __slots__ = ('path', 'symbols')
+
+    def __init__(self, path, symbols):
+        self.path = path
+        self.symbols = symbols
+
+    def __repr__(self):
+        return f'<Module {os.path.basename(self.path)}>'
+
+    def get(self, name):
+        value = self.symbols.values[self.symbols.index(name)]
+        if value is UNDEFINED:
+            raise SymbolNotFound(f'Symbol "{name}" not found in {self!r}')
+        return value
+
+
+def numbers(values):
+    """Store numbers in an `array.array` of floats."""
+    try:
+        return array.array('d', values)
+    except TypeError:
+        raise TypeError('Arrays can only hold numbers') from None
+
+
+class Array:
+    """
+    The value of `array(list)` and `zeros(n)`: a list of floats stored
+    side by side in an `array.array`. Arithmetic operators work on the items
+    one by one (`a + b`, `a * 2`, `-a`...), with the loop over the items
+    running in C instead of Talon. The other operand can be another array or
+    a list of the same length, or a number, which is used with every item.
+    Arrays can also be indexed, sliced and changed like lists.
+    """
+    __slots__ = ('_data',)
+
+    def __init__(self, values=()):
+        self._data = values if isinstance(values, array.array) else numbers(values)
+
+    def __repr__(self):
+        return f'array({self._data.tolist()!r})'
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __reversed__(self):
+        return reversed(self._data)
+
+    def __contains__(self, value):
+        return value in self._data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Array(self._data[index])
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        self._data[index] = value
+
+    def __delitem__(self, index):
+        del self._data[index]
+
+    def __eq__(self, other):
+        if isinstance(other, Array):
+            return self._data == other._data
+        if isinstance(other, (list, Range)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def _operand(self, other):
+        """The items to use with each item of the array, or None."""
+        if isinstance(other, (int, float)):
+            return repeat(other)
+        if isinstance(other, Array):
+            other = other._data
+        elif not isinstance(other, (list, Range)):
+            return None
+        if len(other) != len(self._data):
+            raise ValueError(f'Arrays of different lengths: {len(self._data)} and {len(other)}')
+        return other
+
+    def _map(self, op, other, reflected=False):
+        operand = self._operand(other)
+        if operand is None:
+            return NotImplemented
+        if reflected:
+            return Array(numbers(map(op, operand, self._data)))
+        return Array(numbers(map(op, self._data, operand)))
+
+    def _update(self, op, other):
+        result = self._map(op, other)
+        if result is not NotImplemented:
+            # In place, like `+=` on a list.
+            self._data = result._data
+            return self
+        return result
+
+    def __add__(self, other):
+        return self._map(operator.add, other)
+
+    def __radd__(self, other):
+        return self._map(operator.add, other, True)
+
+    def __iadd__(self, other):
+        return self._update(operator.add, other)
+
+    def __sub__(self, other):
+        return self._map(operator.sub, other)
+
+    def __rsub__(self, other):
+        return self._map(operator.sub, other, True)
+
+    def __isub__(self, other):
+        return self._update(operator.sub, other)
+
+    def __mul__(self, other):
+        return self._map(operator.mul, other)
+
+    def __rmul__(self, other):
+        return self._map(operator.mul, other, True)
+
+    def __imul__(self, other):
+        return self._update(operator.mul, other)
+
+    def __truediv__(self, other):
+        return self._map(operator.truediv, other)
+
+    def __rtruediv__(self, other):
+        return self._map(operator.truediv, other, True)
+
+    def __itruediv__(self, other):
+        return self._update(operator.truediv, other)
+
+    def __mod__(self, other):
+        return self._map(operator.mod, other)
+
+    def __rmod__(self, other):
+        return self._map(operator.mod, other, True)
+
+    def __imod__(self, other):
+        return self._update(operator.mod, other)
+
+    def __pow__(self, other):
+        return self._map(operator.pow, other)
+
+    def __rpow__(self, other):
+        return self._map(operator.pow, other, True)
+
+    def __ipow__(self, other):
+        return self._update(operator.pow, other)
+
+    def __neg__(self):
+        return Array(numbers(map(operator.neg, self._data)))
+
+    def __abs__(self):
+        return Array(numbers(map(abs, self._data)))
+
+    # Reductions
+
+    def sum(self):
+        return sum(self._data)
+
+    def min(self):
+        return min(self._data)
+
+    def max(self):
+        return max(self._data)
+
+    def mean(self):
+        if not self._data:
+            raise ValueError('mean of an empty array')
+        return sum(self._data) / len(self._data)
+
+    def dot(self, other):
+        operand = self._operand(other)
+        if operand is None:
+            raise TypeError(f'Can\'t take the dot product of an array and {other!r}')
+        return sum(map(operator.mul, self._data, operand))
+
+    # List methods
+
+    def copy(self):
+        return Array(array.array('d', self._data))
+
+    def append(self, value):
+        self._data.append(value)
+
+    def extend(self, values):
+        self._data.extend(numbers(values))
+
+    def insert(self, index, value):
+        self._data.insert(index, value)
+
+    def pop(self, index=-1):
+        return self._data.pop(index)
+
+    def remove(self, value):
+        self._data.remove(value)
+
+    def reverse(self):
+        self._data.reverse()
+
+    def sort(self):
+        self._data = numbers(sorted(self._data))
+
+
+class StringBuilder:
+    """
+    The value of `builder()`: a string that is built a piece at a time.
+    `append(b, x)` adds `x` (turned into a string) to the end in constant
+    time, where `s += x` copies the whole string every time. The pieces are
+    only joined when the string is used (`str(b)`, `print(b)`...).
+    """
+    __slots__ = ('_parts', '_length')
+
+    def __init__(self, string=''):
+        string = str(string)
+        self._parts = [string] if string else []
+        self._length = len(string)
+
+    def __repr__(self):
+        return f'builder({str(self)!r})'
+
+    def __str__(self):
+        parts = self._parts
+        if len(parts) > 1:
+            parts[:] = [''.join(parts)]
+        return parts[0] if parts else ''
+
+    def __len__(self):
+        return self._length
+
+    def __eq__(self, other):
+        if isinstance(other, StringBuilder):
+            other = str(other)
+        return str(self) == other
+
+    __hash__ = None
+
+    def append(self, value):
+        string = value if value.__class__ is str else str(value)
+        self._parts.append(string)
+        self._length += len(string)
+
+    def clear(self):
+        self._parts.clear()
+        self._length = 0
+
+
+class Task:
+    """
+    The value of `spawn(f, ...)`: a call of a function running in a thread
+    of its own, see `tasks.py`.
+    """
+    __slots__ = ('_thread', '_result', '_error')
+
+    def __init__(self):
+        self._thread = None
+        self._result = None
+        self._error = None
+
+    def __repr__(self):
+        return f'<Task {"running" if self._thread.is_alive() else "done"}>'
+
+    def _run(self, function, args):
+        try:
+            self._result = function(*args)
+        except BaseException as e:
+            self._error = e
+
+    def result(self):
+        """Wait for the call to finish, and get its result (or raise its error)."""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def key(value):
+    """
+    A hashable value standing for the contents of a value, for `Memo`. Lists,
+    dicts and the like are turned into tuples of their contents as they are
+    now, so changing one afterwards doesn't change what it was cached as.
+    """
+    cls = value.__class__
+    if cls is int or cls is str:
+        return value
+    if cls is bool or cls is float:
+        # `1`, `1.0` and `true` are equal, but not interchangeable.
+        return (cls, value)
+    if cls is list or cls is Range or cls is Array:
+        return (cls, tuple([key(item) for item in value]))
+    if cls is dict:
+        return (cls, frozenset([(key(k), key(v)) for k, v in value.items()]))
+    if cls is set or cls is frozenset:
+        return (set, frozenset(value))
+    if cls is StringBuilder:
+        return (cls, str(value))
+    # Functions, modules, files... are the same value only if they are the
+    # same object.
+    try:
+        hash(value)
+    except TypeError:
+        return (cls, id(value))
+    return (cls, value)
+
+
+class Memo(CallableExpr):
+    """
+    The value of `memo(f)`: a function that remembers its results. A call
+    with the same arguments as one of the last `size` calls gives the same
+    result, without calling the function again. Only functions that always
+    give the same result for the same arguments, and don't do anything else,
+    should be memoised.
+    """
+    __slots__ = ('function', 'size', 'hits', 'misses', '_results', '_lock')
+
+    def __init__(self, function, size=1024):
+        if not isinstance(function, CallableExpr):
+            raise TypeError(f'{function!r} is not a function')
+        if size < 1:
+            raise ValueError('A memoised function has to remember at least one result')
+        self.function = function
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        # key of the arguments -> result, the most recently used last
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'<Memo {self.function!r} size={self.size!r}>'
+
+    def __call__(self, *args):
+        k = tuple([key(arg) for arg in args])
+        results = self._results
+        with self._lock:
+            if k in results:
+                self.hits += 1
+                results.move_to_end(k)
+                return results[k]
+            self.misses += 1
+
+        # The lock isn't held during the call, which may well call this
+        # function again.
+        result = self.function(*args)
+        with self._lock:
+            results[k] = result
+            if len(results) > self.size:
+                results.popitem(last=False)
+        return result
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results), 'max_size': self.size}
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
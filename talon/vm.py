@@ -0,0 +1,689 @@
+"""
+The virtual machine that runs the bytecode made by `bytecode.py`.
+
+The first time a code object runs, it is translated into the source code of
+a Python function, which Python compiles once: the stack of the bytecode is
+worked out while translating, so each instruction becomes a line working on
+Python variables (temporaries, and the local variables of the function
+unless a function made by the code can see them), and the blocks of the
+bytecode become Python `if`s and loops. This makes the functions of a
+program much faster than the closures of `compiler.py`, which pay for a
+Python call for every node they run.
+
+The translated function works like the bodies of those closures: it takes a
+frame (see `resolver.py`), and returns the return value of the function or
+a `TailCall`. The functions it makes are `compiler.Closure`s, so functions
+compiled either way can call each other. The type errors of the operators
+are all caught by a single `try` around the function, which tells them
+apart by the line they were raised on.
+
+Code that Python can't compile (blocks nested too deeply for it...) is run by
+an interpreter loop instead, which works on the instructions themselves.
+"""
+import keyword, math
+from . import compiler
+from .bytecode import (
+    LOAD_CONST, LOAD_GLOBAL, LOAD_FAST, LOAD_DEREF, STORE_GLOBAL, DECLARE_GLOBAL, STORE_FAST,
+    DECLARE_FAST, STORE_DEREF, LOAD_ATTR, BINARY, UNARY, INPLACE, INDEX, PEEK_INDEX, STORE_INDEX,
+    INPLACE_INDEX, SLICE, BUILD_LIST, BUILD_DICT, BUILD_SET, BUILD_RANGE, MAKE_FUNCTION, CALL,
+    TAIL_CALL, RETURN, POP, IF, ELSE, LOOP, WHILE, GET_ITER, FOR_ITER, CONTINUE, BREAK, AND, OR,
+    BINARY_NAMES, UNARY_NAMES, ASSIGN_NAMES, Code
+)
+from .compiler import Closure, LazyClosure, TailCall, calls, not_found, exists, too_deep, get_attribute
+from .nodes import CallableExpr
+from .operators import BINARY_OPS, UNARY_OPS, ASSIGN_OPS, operand_error, type_error
+from .symbols import UNDEFINED
+from .values import Range
+
+# Whether code is translated to Python at all, instead of always running on
+# the interpreter loop.
+translating = True
+
+BINARY_FUNCS = tuple(BINARY_OPS.values())
+UNARY_FUNCS = tuple(UNARY_OPS.values())
+ASSIGN_FUNCS = tuple(ASSIGN_OPS.values())
+
+# The Python operators of the Talon ones
+PYTHON_BINARY = {'^': '**'}
+PYTHON_ASSIGN = {'^=': '**='}
+PYTHON_UNARY = {'-': '-{}', '+': 'abs({})', '!': 'not {}'}
+
+# Binary operators that work on values of any type, so that their errors
+# aren't type errors of Talon
+UNCHECKED = ('==', '!=')
+
+
+def arity_error(func, count):
+    return NameError(f'Invalid amount of args for "{func!r}". Got {count}, expected {func.arity}')
+
+
+def not_callable(value):
+    return TypeError(f'{value!r} is not a function')
+
+
+class Maker:
+    """
+    Makes the functions of a code object (see `MAKE_FUNCTION`) that use the
+    global variables in a symbol table. Their body is linked when the first
+    of them is called, so the code of functions that never run isn't even
+    decoded.
+    """
+    __slots__ = ('code', 'symbols', 'body')
+
+    def __init__(self, code, symbols):
+        self.code = code
+        self.symbols = symbols
+        self.body = None
+
+    def link(self):
+        if self.body is None:
+            self.body = link(self.code, self.symbols)
+        return self.body
+
+    def make(self, env):
+        code = self.code
+        if self.body is None:
+            return LazyClosure(code.arity, code.padding, self.link, env)
+        return Closure(code.arity, code.padding, self.body, env)
+
+
+def link(code, symbols):
+    """
+    Get the body of a code object using the global variables in a symbol
+    table: a function taking a frame, like the bodies of `compiler.Closure`s.
+    """
+    factory = code.factory
+    if factory is None:
+        factory = code.factory = translate(code)
+    return factory(symbols)
+
+
+def translate(code):
+    """Make the function that links a code object, see `link`."""
+    if translating:
+        try:
+            return Translator(code).factory()
+        except (SyntaxError, RecursionError):
+            # Nested too deeply for Python's compiler
+            pass
+    return interpreted(code)
+
+
+def run(code, symbols):
+    """Run the code of a program with the global variables in a symbol table, and return its result."""
+    def main():
+        # Imported files nest in the call importing them.
+        outer = calls.depth
+        try:
+            return link(code, symbols)([outer])
+        except RecursionError:
+            raise too_deep() from None
+        finally:
+            calls.depth = outer
+
+    return compiler.run(main)
+
+
+def literal(value):
+    """The Python source code of a constant, or None if it doesn't have one worth using."""
+    kind = value.__class__
+    if kind is float and not math.isfinite(value):
+        return None
+    if kind in (int, float):
+        source = repr(value)
+        return f'({source})' if source.startswith('-') else source
+    if kind in (str, bool) or value is None:
+        return repr(value)
+    return None
+
+
+class Translator:
+    """Translates a code object into the source code of a Python function."""
+
+    def __init__(self, code):
+        self.code = code
+        self.instructions = code.instructions
+        # Whether the local variables can live in Python variables, which
+        # they can unless the code makes functions that can see them.
+        self.leaf = MAKE_FUNCTION not in code.instructions[::2]
+        # [indent, text, error], where `error` is how to describe the type
+        # errors raised on that line: (left, operator, right, position).
+        self.lines = []
+        self.temporaries = 0
+        # The helpers, and the constants and positions used by the code.
+        self.namespace = {
+            'UNDEFINED': UNDEFINED, 'Closure': Closure, 'TailCall': TailCall,
+            'CallableExpr': CallableExpr, 'Range': Range, 'calls': calls, 'compiler': compiler,
+            'not_found': not_found, 'exists': exists, 'too_deep': too_deep,
+            'get_attribute': get_attribute, 'type_error': type_error, 'arity_error': arity_error,
+            'not_callable': not_callable
+        }
+        self.makers = [i for i, constant in enumerate(code.constants) if isinstance(constant, Code)]
+
+    def factory(self):
+        code = self.code
+        self.block(0, len(self.instructions), [], 3)
+
+        names = ['values', 'is_builtin']
+        names += [f'g{i}' for i in range(len(code.names))]
+        names += [f'm{i}' for i in self.makers]
+        head = [f'def factory({", ".join(names)}):', '    def body(frame):']
+        if code.size == 0:
+            head.append('        d = frame[0]')
+        elif self.leaf:
+            slots = ', '.join(['_', *(f'v{slot}' for slot in range(1, code.size)), 'd'])
+            head.append(f'        {slots} = frame')
+        else:
+            head.append('        d = frame[-1]')
+        head.append('        dn = d + 1')
+        head.append('        try:')
+
+        source = head[:]
+        errors = []
+        for indent, text, error in self.lines:
+            source.append('    ' * indent + text)
+            if error is not None:
+                errors.append((len(source), error))
+
+        source.append('        except TypeError as e:')
+        if errors:
+            source.append('            if e.__traceback__.tb_next is None:')
+            source.append('                line = e.__traceback__.tb_lineno')
+            for line, (left, op, right, position) in errors:
+                source.append(f'                if line == {line}:')
+                source.append(f'                    raise type_error({left}, {op!r}, {right}, {position})')
+        source.append('            raise')
+        source.append('    return body')
+
+        exec(compile('\n'.join(source), f'<talon {code.name}>', 'exec'), self.namespace)
+        factory = self.namespace['factory']
+        makers = [code.constants[i] for i in self.makers]
+
+        def link(symbols):
+            return factory(
+                symbols.values, symbols.is_builtin,
+                *[symbols.index(name) for name in code.names],
+                *[Maker(nested, symbols) for nested in makers]
+            )
+        return link
+
+    # Helpers
+
+    def emit(self, indent, text, error=None):
+        self.lines.append([indent, text, error])
+
+    def temporary(self):
+        self.temporaries += 1
+        return f't{self.temporaries}'
+
+    def value(self, indent, expression, error=None):
+        """Work out an expression into a new temporary, and return its name."""
+        name = self.temporary()
+        self.emit(indent, f'{name} = {expression}', error)
+        return name
+
+    def name(self, indent, value):
+        """Get a value as a variable, for the operations that Python doesn't expect on literals."""
+        return value if value.isidentifier() and not keyword.iskeyword(value) else self.value(indent, value)
+
+    def position(self, pc):
+        position = self.code.positions.get(pc)
+        if position is None:
+            return 'None'
+        self.namespace[f'p{pc}'] = position
+        return f'p{pc}'
+
+    def constant(self, index):
+        value = self.code.constants[index]
+        source = literal(value)
+        if source is None:
+            self.namespace[f'k{index}'] = value
+            return f'k{index}'
+        return source
+
+    def slot(self, arg):
+        return f'v{arg}' if self.leaf else f'frame[{arg}]'
+
+    def cell(self, arg):
+        depth, slot, name = self.code.cells[arg]
+        return 'frame' + '[0]' * depth, slot, name
+
+    def global_(self, arg):
+        return f'values[g{arg}]', self.code.names[arg]
+
+    # Blocks
+
+    def block(self, pc, end, stack, indent):
+        """
+        Translate the instructions from `pc` to `end`, with the values on
+        the stack before them. Returns the end of the `else` branch if the
+        instructions stop at the `ELSE` of their `if`, None otherwise.
+        """
+        instructions = self.instructions
+        push = stack.append
+        pop = stack.pop
+
+        while pc < end:
+            op = instructions[pc]
+            arg = instructions[pc + 1]
+
+            if op == LOAD_CONST:
+                push(self.constant(arg))
+            elif op == LOAD_FAST:
+                if self.leaf:
+                    name = f'v{arg}'
+                else:
+                    name = self.value(indent, f'frame[{arg}]')
+                if arg > self.code.arity:
+                    # Parameters always have a value.
+                    self.emit(indent, f'if {name} is UNDEFINED: raise not_found({self.code.varnames[arg]!r})')
+                push(name)
+            elif op == LOAD_DEREF:
+                frame, slot, name = self.cell(arg)
+                value = self.value(indent, f'{frame}[{slot}]')
+                self.emit(indent, f'if {value} is UNDEFINED: raise not_found({name!r})')
+                push(value)
+            elif op == LOAD_GLOBAL:
+                target, name = self.global_(arg)
+                value = self.value(indent, target)
+                self.emit(indent, f'if {value} is UNDEFINED: raise not_found({name!r})')
+                push(value)
+            elif op == STORE_FAST or op == DECLARE_FAST:
+                target = self.slot(arg)
+                name = self.code.varnames[arg]
+                if op == STORE_FAST:
+                    self.emit(indent, f'if {target} is UNDEFINED: raise not_found({name!r})')
+                else:
+                    self.emit(indent, f'if {target} is not UNDEFINED: raise exists({name!r})')
+                self.emit(indent, f'{target} = {pop()}')
+            elif op == STORE_DEREF:
+                frame, slot, name = self.cell(arg)
+                env = self.value(indent, frame)
+                self.emit(indent, f'if {env}[{slot}] is UNDEFINED: raise not_found({name!r})')
+                self.emit(indent, f'{env}[{slot}] = {pop()}')
+            elif op == STORE_GLOBAL:
+                target, name = self.global_(arg)
+                self.emit(indent, f'if {target} is UNDEFINED: raise not_found({name!r})')
+                self.emit(indent, f'{target} = {pop()}')
+            elif op == DECLARE_GLOBAL:
+                target, name = self.global_(arg)
+                # Builtins can be replaced by variables of the program.
+                self.emit(indent, f'if {target} is not UNDEFINED and not is_builtin(g{arg}): raise exists({name!r})')
+                self.emit(indent, f'{target} = {pop()}')
+            elif op == BINARY:
+                right = pop()
+                left = pop()
+                name = BINARY_NAMES[arg]
+                error = None if name in UNCHECKED else (left, name, right, self.position(pc))
+                push(self.value(indent, f'{left} {PYTHON_BINARY.get(name, name)} {right}', error))
+            elif op == UNARY:
+                push(self.value(indent, PYTHON_UNARY[UNARY_NAMES[arg]].format(pop())))
+            elif op == INPLACE:
+                right = pop()
+                left = pop()
+                name = ASSIGN_NAMES[arg]
+                value = self.temporary()
+                error = (left, name, right, self.position(pc))
+                self.emit(indent, f'{value} = {left}; {value} {PYTHON_ASSIGN.get(name, name)} {right}', error)
+                push(value)
+            elif op == INDEX:
+                index = pop()
+                push(self.value(indent, f'{self.name(indent, pop())}[{index}]'))
+            elif op == PEEK_INDEX:
+                stack[-2] = self.name(indent, stack[-2])
+                push(self.value(indent, f'{stack[-2]}[{stack[-1]}]'))
+            elif op == STORE_INDEX:
+                value = pop()
+                index = pop()
+                self.emit(indent, f'{self.name(indent, pop())}[{index}] = {value}')
+            elif op == INPLACE_INDEX:
+                value = pop()
+                old = pop()
+                index = pop()
+                target = pop()
+                name = ASSIGN_NAMES[arg]
+                result = self.temporary()
+                self.emit(indent, f'{result} = {old}; {result} {PYTHON_ASSIGN.get(name, name)} {value}')
+                self.emit(indent, f'{target}[{index}] = {result}')
+            elif op == SLICE:
+                stop = pop() if arg & 2 else ''
+                start_ = pop() if arg & 1 else ''
+                if arg:
+                    push(self.value(indent, f'{self.name(indent, pop())}[{start_}:{stop}]'))
+            elif op == BUILD_LIST or op == BUILD_SET:
+                items = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                if op == BUILD_LIST:
+                    push(self.value(indent, f'[{", ".join(items)}]'))
+                elif items:
+                    push(self.value(indent, f'{{{", ".join(items)}}}'))
+                else:
+                    push(self.value(indent, 'set()'))
+            elif op == BUILD_DICT:
+                items = stack[len(stack) - 2 * arg:]
+                del stack[len(stack) - 2 * arg:]
+                pairs = ', '.join(f'{key}: {value}' for key, value in zip(items[::2], items[1::2]))
+                push(self.value(indent, f'{{{pairs}}}'))
+            elif op == BUILD_RANGE:
+                stop = pop()
+                start_ = pop()
+                if pc + 2 < end and instructions[pc + 2] == GET_ITER:
+                    # Loop over the numbers directly, without making a `Range`.
+                    push(f'range({start_}, {stop} + 1)' if arg else f'range({start_}, {stop})')
+                    pc += 2
+                else:
+                    push(self.value(indent, f'Range({start_}, {stop}, {bool(arg)})'))
+            elif op == LOAD_ATTR:
+                push(self.value(indent, f'get_attribute({pop()}, {self.constant(arg)})'))
+            elif op == MAKE_FUNCTION:
+                nested = self.code.constants[arg]
+                self.namespace[f'padding{arg}'] = nested.padding
+                push(self.value(
+                    indent,
+                    f'Closure({nested.arity}, padding{arg}, m{arg}.body, frame) '
+                    f'if m{arg}.body is not None else m{arg}.make(frame)'
+                ))
+            elif op == CALL or op == TAIL_CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                func = self.name(indent, pop())
+                self.call(func, args, op == TAIL_CALL, stack, indent)
+            elif op == RETURN:
+                self.emit(indent, f'return {pop()}')
+            elif op == POP:
+                pop()
+            elif op == IF:
+                self.emit(indent, f'if {pop()}:')
+                otherwise = self.body(pc + 2, arg, stack[:], indent + 1)
+                if otherwise is None:
+                    pc = arg
+                    continue
+                self.emit(indent, 'else:')
+                self.body(arg, otherwise, stack[:], indent + 1)
+                pc = otherwise
+                continue
+            elif op == ELSE:
+                return arg
+            elif op == LOOP:
+                self.emit(indent, 'while True:')
+                self.body(pc + 2, arg, stack[:], indent + 1)
+                pc = arg
+                continue
+            elif op == WHILE:
+                self.emit(indent, f'if not {pop()}: break')
+            elif op == GET_ITER:
+                # Python's `for` gets the iterator.
+                pass
+            elif op == FOR_ITER:
+                sequence = pop()
+                value = self.temporary()
+                self.emit(indent, f'for {value} in {sequence}:')
+                # The iterator stays on the stack, for `BREAK` to pop.
+                self.body(pc + 2, arg, [*stack, sequence, value], indent + 1)
+                pc = arg
+                continue
+            elif op == CONTINUE:
+                # Always the end of the body of its loop
+                pass
+            elif op == BREAK:
+                self.emit(indent, 'break')
+            elif op == AND or op == OR:
+                left = pop()
+                mark = len(self.lines)
+                right = stack[:]
+                self.block(pc + 2, arg, right, indent + 1)
+                result = self.temporary()
+                if len(self.lines) == mark:
+                    self.emit(indent, f'{result} = {left} {"and" if op == AND else "or"} {right[-1]}')
+                else:
+                    self.emit(indent + 1, f'{result} = {right[-1]}')
+                    self.lines[mark:mark] = [
+                        [indent, f'{result} = {left}', None],
+                        [indent, f'if {"" if op == AND else "not "}{result}:', None]
+                    ]
+                push(result)
+                pc = arg
+                continue
+            else:
+                raise ValueError(f'Unknown opcode {op}')
+            pc += 2
+
+        return None
+
+    def body(self, pc, end, stack, indent):
+        """Translate the instructions of a Python block, like `block`."""
+        start = len(self.lines)
+        otherwise = self.block(pc, end, stack, indent)
+        if len(self.lines) == start:
+            self.emit(indent, 'pass')
+        return otherwise
+
+    def call(self, func, args, tail, stack, indent):
+        count = len(args)
+        frame = ', '.join([f'{func}.env', *args, f'*{func}.padding'])
+        self.emit(indent, f'if {func}.__class__ is Closure:')
+        self.emit(indent + 1, f'if {func}.arity != {count}: raise arity_error({func}, {count})')
+        if tail:
+            self.emit(indent + 1, f'return TailCall({func}.body, [{frame}, d])')
+            self.emit(indent, f'if not isinstance({func}, CallableExpr): raise not_callable({func})')
+            self.emit(indent, 'calls.depth = d')
+            self.emit(indent, f'return {func}({", ".join(args)})')
+            return
+
+        result = self.temporary()
+        self.emit(indent + 1, 'if dn > compiler.max_depth: raise too_deep()')
+        self.emit(indent + 1, f'{result} = {func}.body([{frame}, dn])')
+        self.emit(indent + 1, f'while {result}.__class__ is TailCall:')
+        self.emit(indent + 2, f'{result} = {result}.body({result}.frame)')
+        self.emit(indent, f'elif isinstance({func}, CallableExpr):')
+        self.emit(indent + 1, 'calls.depth = d')
+        self.emit(indent + 1, f'{result} = {func}({", ".join(args)})')
+        self.emit(indent, f'else: raise not_callable({func})')
+        stack.append(result)
+
+
+def interpreted(code):
+    """Make the function that links a code object to run on the interpreter loop, see `link`."""
+    def link(symbols):
+        links = [symbols.index(name) for name in code.names]
+        makers = {
+            index: Maker(constant, symbols)
+            for index, constant in enumerate(code.constants) if isinstance(constant, Code)
+        }
+
+        def body(frame):
+            return execute(code, symbols, links, makers, frame)
+        return body
+    return link
+
+
+def execute(code, symbols, links, makers, frame):
+    """Run a code object on the interpreter loop, in a frame."""
+    values = symbols.values
+    instructions = code.instructions
+    constants = code.constants
+    depth = frame[-1]
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+
+    while True:
+        op = instructions[pc]
+        arg = instructions[pc + 1]
+        pc += 2
+
+        if op == LOAD_FAST:
+            value = frame[arg]
+            if value is UNDEFINED:
+                raise not_found(code.varnames[arg])
+            push(value)
+        elif op == LOAD_CONST:
+            push(constants[arg])
+        elif op == LOAD_GLOBAL:
+            value = values[links[arg]]
+            if value is UNDEFINED:
+                raise not_found(code.names[arg])
+            push(value)
+        elif op == BINARY:
+            b = pop()
+            a = pop()
+            name = BINARY_NAMES[arg]
+            if name in UNCHECKED:
+                push(BINARY_FUNCS[arg](a, b))
+                continue
+            try:
+                # Written out, so that its type errors are raised right here
+                push(a in b if name == 'in' else BINARY_FUNCS[arg](a, b))
+            except TypeError as e:
+                raise operand_error(e, a, name, b, code.positions.get(pc - 2))
+        elif op == STORE_FAST:
+            if frame[arg] is UNDEFINED:
+                raise not_found(code.varnames[arg])
+            frame[arg] = pop()
+        elif op == IF or op == WHILE:
+            if not pop():
+                pc = arg
+        elif op == ELSE or op == CONTINUE or op == BREAK:
+            pc = arg
+        elif op == LOOP:
+            pass
+        elif op == CALL or op == TAIL_CALL:
+            if arg:
+                args = stack[-arg:]
+                del stack[-arg:]
+            else:
+                args = []
+            func = pop()
+
+            if func.__class__ is Closure:
+                if func.arity != arg:
+                    raise arity_error(func, arg)
+                if op == TAIL_CALL:
+                    return TailCall(func.body, [func.env, *args, *func.padding, depth])
+                if depth + 1 > compiler.max_depth:
+                    raise too_deep()
+                result = func.body([func.env, *args, *func.padding, depth + 1])
+                while result.__class__ is TailCall:
+                    result = result.body(result.frame)
+            elif isinstance(func, CallableExpr):
+                calls.depth = depth
+                result = func(*args)
+            else:
+                raise not_callable(func)
+
+            if op == TAIL_CALL:
+                return result
+            push(result)
+        elif op == RETURN:
+            return pop()
+        elif op == INPLACE:
+            b = pop()
+            a = pop()
+            try:
+                push(ASSIGN_FUNCS[arg](a, b))
+            except TypeError as e:
+                raise operand_error(e, a, ASSIGN_NAMES[arg], b, code.positions.get(pc - 2))
+        elif op == STORE_GLOBAL:
+            index = links[arg]
+            if values[index] is UNDEFINED:
+                raise not_found(code.names[arg])
+            values[index] = pop()
+        elif op == POP:
+            pop()
+        elif op == FOR_ITER:
+            try:
+                push(next(stack[-1]))
+            except StopIteration:
+                pop()
+                pc = arg
+        elif op == INDEX:
+            index = pop()
+            push(pop()[index])
+        elif op == LOAD_DEREF or op == STORE_DEREF:
+            cell_depth, slot, name = code.cells[arg]
+            env = frame
+            for _ in range(cell_depth):
+                env = env[0]
+            value = env[slot]
+            if value is UNDEFINED:
+                raise not_found(name)
+            if op == LOAD_DEREF:
+                push(value)
+            else:
+                env[slot] = pop()
+        elif op == DECLARE_FAST:
+            if frame[arg] is not UNDEFINED:
+                raise exists(code.varnames[arg])
+            frame[arg] = pop()
+        elif op == DECLARE_GLOBAL:
+            index = links[arg]
+            if values[index] is not UNDEFINED and not symbols.is_builtin(index):
+                raise exists(code.names[arg])
+            values[index] = pop()
+        elif op == AND:
+            if stack[-1]:
+                pop()
+            else:
+                pc = arg
+        elif op == OR:
+            if stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == UNARY:
+            push(UNARY_FUNCS[arg](pop()))
+        elif op == GET_ITER:
+            push(iter(pop()))
+        elif op == STORE_INDEX:
+            value = pop()
+            index = pop()
+            pop()[index] = value
+        elif op == PEEK_INDEX:
+            push(stack[-2][stack[-1]])
+        elif op == INPLACE_INDEX:
+            value = pop()
+            old = pop()
+            index = pop()
+            pop()[index] = ASSIGN_FUNCS[arg](old, value)
+        elif op == BUILD_LIST:
+            if arg:
+                items = stack[-arg:]
+                del stack[-arg:]
+            else:
+                items = []
+            push(items)
+        elif op == BUILD_DICT:
+            if arg:
+                items = stack[-2 * arg:]
+                del stack[-2 * arg:]
+                push(dict(zip(items[::2], items[1::2])))
+            else:
+                push({})
+        elif op == BUILD_SET:
+            if arg:
+                items = set(stack[-arg:])
+                del stack[-arg:]
+            else:
+                items = set()
+            push(items)
+        elif op == LOAD_ATTR:
+            push(get_attribute(pop(), constants[arg]))
+        elif op == BUILD_RANGE:
+            end = pop()
+            start = pop()
+            if instructions[pc] == GET_ITER:
+                # Like the translated code, without making a `Range`
+                push(iter(range(start, end + 1 if arg else end)))
+                pc += 2
+            else:
+                push(Range(start, end, arg))
+        elif op == SLICE:
+            end = pop() if arg & 2 else None
+            start = pop() if arg & 1 else None
+            value = pop()
+            push(value if arg == 0 else value[start:end])
+        elif op == MAKE_FUNCTION:
+            push(makers[arg].make(frame))
+        else:
+            raise ValueError(f'Unknown opcode {op}')
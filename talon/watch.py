@@ -0,0 +1,242 @@
+"""
+Keeps a program parsed while its source code is being edited.
+
+A `Document` splits the source code into its top-level statements (a
+function definition, a variable, a loop...) and keeps the nodes made from
+each one. When the code changes, only the statements whose text changed
+are parsed and transformed again; the nodes of the others are reused, and
+moved to their new lines if needed. Editors can use it directly:
+
+    document = Document()
+    program = document.update(code)     # parses everything
+    program = document.update(edited)   # parses what changed
+
+`tal --watch` uses it to run a file again every time it is saved.
+
+Each statement is optimized on its own, when it is transformed. The nodes
+of a statement are reused as they are, so they go through the resolver
+every time the program is compiled; it only ever makes the same changes to
+the same nodes.
+"""
+import bisect, os, time, tinted
+from lark import UnexpectedInput
+from . import nodes, talon, optimizer
+from .interpreter import Interpreter
+
+
+class Statement:
+    """The nodes made from the text of a top-level statement (or a few on one line)."""
+    __slots__ = ('line', 'children')
+
+    def __init__(self, line, children):
+        # The line the nodes were given, which changes when code above the
+        # statement gets longer or shorter.
+        self.line = line
+        self.children = children
+
+
+def boundaries(code, start=0):
+    """
+    Yield where the top-level statements of `code[start:]` end, but the
+    last one. Statements on the same line stay together.
+    """
+    depth = 0
+    for token in talon.get_parser().lex(code[start:]):
+        if token.type == 'LBRACE':
+            depth += 1
+        elif token.type == 'RBRACE':
+            depth -= 1
+        elif token.type == '_NL' and depth == 0:
+            # The next statement starts on the last line of the newline
+            # token, with its indentation.
+            yield start + token.start_pos + token.value.rfind('\n') + 1
+
+
+def common_prefix(a, b):
+    """The length of the longest common prefix of two strings."""
+    low, high = 0, min(len(a), len(b))
+    # Comparing slices runs in C, so look for the end of the prefix with
+    # a binary search.
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def common_suffix(a, b, limit):
+    """The length of the longest common suffix of two strings, up to `limit`."""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def move(node, lines):
+    """Move the nodes made from a statement down by a number of lines (up if negative)."""
+    if isinstance(node, nodes.BaseExpr):
+        if node.line is not None:
+            node.line += lines
+        children = vars(node).values()
+    elif isinstance(node, (list, nodes.Instructions)):
+        children = node
+    else:
+        return
+    for child in children:
+        move(child, lines)
+
+
+class Document:
+    """Source code that is parsed and transformed a top-level statement at a time."""
+
+    def __init__(self, optimize=True):
+        self.optimize = optimize
+        # The source code, and where its statements end (see `boundaries`)
+        self.code = None
+        self.ends = []
+        # (text, how many times the same text came before) -> Statement
+        self.statements = {}
+        # How many statements the last update parsed, out of how many
+        self.parsed = 0
+        self.total = 0
+
+    def split(self, code):
+        """
+        Find where the statements of the new version of the code end. Only
+        the part that changed is lexed again.
+        """
+        if self.code is None:
+            return list(boundaries(code))
+
+        old, ends = self.code, self.ends
+        prefix = common_prefix(old, code)
+        suffix = common_suffix(old, code, min(len(old), len(code)) - prefix)
+        moved = len(code) - len(old)
+
+        # Where a statement ends depends on the start of the next one (a
+        # newline before an `else` doesn't end it), so the last statement
+        # before the change is lexed again too.
+        kept = bisect.bisect_left(ends, prefix) - 1
+        new = ends[:max(kept, 0)]
+        start = new[-1] if new else 0
+
+        old_ends = set(ends)
+        for end in boundaries(code, start):
+            if end >= len(code) - suffix and end - moved in old_ends:
+                # Back in the part that didn't change, where the statements
+                # are the same as before.
+                rest = bisect.bisect_right(ends, end - moved)
+                new.append(end)
+                new.extend(old_end + moved for old_end in ends[rest:])
+                break
+            new.append(end)
+        return new
+
+    def update(self, code):
+        """
+        Get the nodes of the new version of the source code, ready to be
+        run. Raises the same errors as `talon.load`.
+        """
+        parser = talon.get_parser()
+        try:
+            ends = self.split(code)
+        except UnexpectedInput:
+            # Let the parser report the error.
+            parser.parse(code)
+            raise
+
+        statements = {}
+        seen = {}
+        children = []
+        self.parsed = 0
+        start = 0
+        line = 1
+
+        for end in ends + [len(code)]:
+            text = code[start:end]
+            if not text:
+                # After the newline at the end of the code
+                continue
+            key = (text, seen.get(text, 0))
+            seen[text] = key[1] + 1
+
+            statement = self.statements.get(key)
+            if statement is None:
+                try:
+                    tree = parser.parse(text)
+                except UnexpectedInput:
+                    # The error is reported for the whole code instead,
+                    # where its position and context make sense.
+                    talon.load(code, optimize=False)
+                    raise
+                transformed = talon.transform_tree(tree)
+                if self.optimize:
+                    transformed = optimizer.optimize(transformed)
+                statement = Statement(1, list(transformed))
+                self.parsed += 1
+
+            if statement.line != line:
+                move(statement.children, line - statement.line)
+                statement.line = line
+
+            statements[key] = statement
+            children.extend(statement.children)
+            line += text.count('\n')
+            start = end
+
+        self.code = code
+        self.ends = ends
+        self.statements = statements
+        self.total = len(statements)
+        return nodes.Instructions(children)
+
+
+def watch(path, optimize=True, interval=0.25):
+    """
+    Run a `.tal` file, and run it again whenever it changes, until
+    interrupted. Errors are printed instead of stopping.
+    """
+    document = Document(optimize)
+    modified = None
+
+    while True:
+        try:
+            current = os.stat(path).st_mtime_ns
+        except OSError:
+            current = None
+
+        if current is not None and current != modified:
+            modified = current
+            run(document, path)
+            print(tinted.tint(f'[bold]Watching {path} for changes (Ctrl+C to stop)[/]'))
+
+        time.sleep(interval)
+
+
+def run(document, path):
+    with open(path, 'r') as f:
+        code = f.read()
+
+    start = time.perf_counter()
+    try:
+        program = document.update(code)
+    except (UnexpectedInput, SyntaxError) as e:
+        talon.print_syntax_error(e, code)
+        return
+    loaded = time.perf_counter()
+
+    try:
+        Interpreter(optimize=document.optimize).execute(program, path)
+    except Exception as e:
+        print(tinted.tint(f'[red][bold]{str(e.__class__.__name__)}[/][/]: {str(e)}'))
+
+    print(tinted.tint(
+        f'\n[bold]Parsed {document.parsed} of {document.total} statements in {(loaded - start) * 1000:.1f} ms, '
+        f'ran in {(time.perf_counter() - loaded) * 1000:.1f} ms[/]'
+    ))
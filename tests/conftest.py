@@ -0,0 +1,13 @@
+import io
+import pytest
+from talon.interpreter import Interpreter
+
+
+@pytest.fixture
+def run():
+    """Run Talon source code in a new interpreter, and get what it printed and the value of its `ret`."""
+    def run(code):
+        stdout = io.StringIO()
+        result = Interpreter(stdout=stdout).run(code)
+        return stdout.getvalue(), result
+    return run
@@ -0,0 +1,109 @@
+"""
+`batch.run` runs programs on worker processes and gets a `Result` for each,
+whatever the program does: finishing, failing, running forever or taking
+its worker down with it.
+"""
+import json, multiprocessing, os
+import pytest
+from talon import batch, cache
+
+# Replacing functions of the workers only works if they are forked
+forked = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='workers are not forked')
+
+
+@pytest.fixture(autouse=True)
+def no_cache():
+    cache.configure(enable=False)
+    yield
+    cache.configure()
+
+
+def programs(directory, **sources):
+    for name, source in sources.items():
+        (directory / f'{name}.tal').write_text(source)
+    return [str(directory / f'{name}.tal') for name in sorted(sources)]
+
+
+def test_statuses(tmp_path):
+    paths = programs(
+        tmp_path,
+        ok='print(1 + 1)\n',
+        failing='print(1)\nprint(x)\n',
+        syntax='print(\n',
+    )
+    results = batch.run([str(tmp_path)], jobs=2)
+    assert [result.path for result in results] == paths
+
+    failing, ok, syntax = results
+    assert (ok.status, ok.exit_code, ok.stdout, ok.stderr) == (batch.Result.OK, 0, '2\n', '')
+    # What was printed before the error is kept
+    assert (failing.status, failing.exit_code, failing.stdout) == (batch.Result.ERROR, 1, '1\n')
+    assert failing.stderr == 'SymbolNotFound: Symbol "x" not found\n'
+    assert (syntax.status, syntax.exit_code) == (batch.Result.ERROR, 1)
+    assert syntax.stderr.startswith('Syntax error at line 1')
+
+
+def test_timeout(tmp_path):
+    # With one worker, the one killed is replaced for the next program
+    programs(tmp_path, a='while (true) {\n}\n', b='print(2)\n')
+    forever, after = batch.run([str(tmp_path)], jobs=1, timeout=0.5)
+    assert (forever.status, forever.exit_code) == (batch.Result.TIMEOUT, None)
+    assert forever.stderr == 'Timed out after 0.5 seconds'
+    assert 0.5 <= forever.time < 5
+    assert (after.status, after.stdout) == (batch.Result.OK, '2\n')
+
+
+@forked
+def test_worker_dies(tmp_path, monkeypatch):
+    run_job = batch.run_job
+
+    def dying(path, optimize=True):
+        if path.endswith('a.tal'):
+            os._exit(3)
+        return run_job(path, optimize)
+
+    monkeypatch.setattr(batch, 'run_job', dying)
+    programs(tmp_path, a='print(1)\n', b='print(2)\n')
+    died, after = batch.run([str(tmp_path)], jobs=1)
+    assert (died.status, died.exit_code, died.stderr) == (batch.Result.CRASHED, None, 'The worker process died')
+    assert (after.status, after.stdout) == (batch.Result.OK, '2\n')
+
+
+@forked
+def test_worker_interrupted(tmp_path, monkeypatch):
+    def interrupted(path, optimize=True):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch, 'run_job', interrupted)
+    programs(tmp_path, a='print(1)\n')
+    [result] = batch.run([str(tmp_path)], jobs=1)
+    assert (result.status, result.exit_code) == (batch.Result.CRASHED, None)
+    assert 'KeyboardInterrupt' in result.stderr
+
+
+def test_summary(tmp_path):
+    programs(tmp_path, a='print(1)\n', b='print(x)\n', c='while (true) {\n}\n')
+    results = batch.run([str(tmp_path)], jobs=3, timeout=0.5)
+    summary = json.loads(json.dumps(batch.summary(results)))
+    assert list(summary) == ['total', 'ok', 'error', 'timeout', 'crashed', 'time', 'results']
+    assert {name: summary[name] for name in ('total', 'ok', 'error', 'timeout', 'crashed')} == {
+        'total': 3, 'ok': 1, 'error': 1, 'timeout': 1, 'crashed': 0
+    }
+    assert summary['time'] == pytest.approx(sum(result.time for result in results))
+    assert summary['results'][0] == {
+        'path': str(tmp_path / 'a.tal'), 'status': 'ok', 'exit_code': 0,
+        'stdout': '1\n', 'stderr': '', 'time': results[0].time
+    }
+
+
+def test_find(tmp_path):
+    (tmp_path / 'lib').mkdir()
+    paths = programs(tmp_path, b='', a='')
+    (tmp_path / 'lib' / 'c.talc').write_bytes(b'')
+    (tmp_path / 'notes.txt').write_text('')
+    assert batch.find([str(tmp_path)]) == paths + [str(tmp_path / 'lib' / 'c.talc')]
+
+
+def test_no_jobs(tmp_path):
+    with pytest.raises(ValueError):
+        batch.run([str(tmp_path)], jobs=0)
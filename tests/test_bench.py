@@ -0,0 +1,97 @@
+"""
+`tal bench` times the phases of the benchmarks, saves them as JSON and
+compares them against a baseline.
+"""
+import json
+import pytest
+from talon import bench
+
+
+def results(**benchmarks):
+    """Results with the given fastest times, the same for every statistic."""
+    return {'benchmarks': {
+        name: {phase: {'min': seconds, 'median': seconds, 'mean': seconds} for phase, seconds in phases.items()}
+        for name, phases in benchmarks.items()
+    }}
+
+
+def test_compare():
+    baseline = results(fib={'parse': 0.010, 'execute': 0.100}, gone={'parse': 0.010})
+    new = results(fib={'parse': 0.010, 'execute': 0.150}, added={'parse': 0.010})
+    changes, slower = bench.compare(new, baseline)
+    # Only the benchmarks and phases in both
+    assert changes == [('fib', 'parse', 0.010, 0.010, 0.0), ('fib', 'execute', 0.100, 0.150, pytest.approx(0.5))]
+    assert slower == [changes[1]]
+
+    changes, slower = bench.compare(new, baseline, threshold=0.6)
+    assert slower == []
+
+
+def test_compare_zero_baseline():
+    changes, slower = bench.compare(results(a={'parse': 0.001}), results(a={'parse': 0.0}))
+    assert changes == [('a', 'parse', 0.0, 0.001, 0.0)]
+    assert slower == []
+
+
+@pytest.mark.parametrize('before, after, slower', [
+    (0.100, 0.111, True),
+    (0.100, 0.109, False),
+    # A tenth of a millisecond slower is noise, even if it is 100% slower
+    (0.0001, 0.0002, False),
+    (0.0001, 0.0001 + bench.MIN_DIFFERENCE * 2, True),
+    (0.100, 0.050, False),
+])
+def test_slower_than(before, after, slower):
+    assert bench.slower_than(('fib', 'execute', before, after, after / before - 1), 0.1) == slower
+
+
+@pytest.fixture
+def benchmark(tmp_path):
+    path = tmp_path / 'count.tal'
+    path.write_text('this total = 0\nthis i = 0\nwhile (i < 20000) {\n  total += i\n  i += 1\n}\nprint(total)\n')
+    return str(path)
+
+
+def test_run_all_schema(benchmark):
+    output = bench.run_all([benchmark], warmup=0, repeat=2)
+    output = json.loads(json.dumps(output))
+    assert list(output) == ['version', 'python', 'warmup', 'repeat', 'optimize', 'benchmarks']
+    assert (output['warmup'], output['repeat'], output['optimize']) == (0, 2, True)
+    assert list(output['benchmarks']) == ['count']
+    phases = output['benchmarks']['count']
+    assert list(phases) == list(bench.PHASES)
+    for phase in bench.PHASES:
+        assert list(phases[phase]) == ['min', 'median', 'mean']
+        assert 0 < phases[phase]['min'] <= phases[phase]['median']
+    assert phases['total']['min'] >= phases['parse']['min'] + phases['execute']['min']
+
+
+def test_run_all_progress(benchmark):
+    finished = []
+    output = bench.run_all([benchmark], warmup=0, repeat=1, progress=lambda name, result: finished.append((name, result)))
+    assert finished == [('count', output['benchmarks']['count'])]
+
+
+def test_suite():
+    assert 'fib' in bench.suite()
+    with pytest.raises(FileNotFoundError):
+        bench.find('missing')
+    with pytest.raises(ValueError):
+        bench.run(bench.find('fib'), repeat=0)
+
+
+def test_main_baseline(benchmark, tmp_path, capsys):
+    saved = tmp_path / 'results.json'
+    bench.main([benchmark, '-w', '0', '-r', '1', '-o', str(saved)])
+    with open(saved) as f:
+        baseline = json.load(f)
+    assert list(baseline['benchmarks']) == ['count']
+
+    # Against a baseline running the program ten times faster
+    for phase in ('execute', 'total'):
+        baseline['benchmarks']['count'][phase]['min'] /= 10
+    saved.write_text(json.dumps(baseline))
+    with pytest.raises(SystemExit) as exit:
+        bench.main([benchmark, '-w', '0', '-r', '1', '--baseline', str(saved)])
+    assert exit.value.code == 1
+    assert '2 of 4 timings are more than 10% slower' in capsys.readouterr().out
@@ -0,0 +1,99 @@
+"""
+Programs can declare variables and functions named like builtins, which
+replace the builtins for them.
+"""
+import os
+from collections import OrderedDict
+import pytest
+from talon import cache, modules, talc, talon
+from talon.errors import SymbolExists
+
+
+@pytest.mark.parametrize('name', ['dot', 'sum', 'array', 'print', 'len'])
+def test_function_replaces_builtin(name, run):
+    code = f"""
+    fun {name}(a, b) {{
+      ret a * 10 + b
+    }}
+    ret {name}(1, 2)
+    """
+    assert run(code) == ('', 12)
+
+
+def test_variable_replaces_builtin(run):
+    assert run('this max = 3\nret max + 1') == ('', 4)
+
+
+def test_builtin_used_before_declaration(run):
+    code = """
+    this total = sum([1, 2, 3])
+    fun sum(a, b) {
+      ret a - b
+    }
+    ret [total, sum(5, 1)]
+    """
+    assert run(code) == ('', [6, 4])
+
+
+@pytest.mark.parametrize('name', ['open', 'close', 'lines', 'read', 'write', 'flush'])
+def test_file_builtins(name, run):
+    code = f"""
+    this {name} = []
+    append({name}, 1)
+    ret {name}
+    """
+    assert run(code) == ('', [1])
+
+
+@pytest.mark.parametrize('name', ['dict', 'set', 'keys', 'values', 'get', 'add', 'delete'])
+def test_dict_builtins(name, run):
+    assert run(f'fun {name}(x) {{\n  ret x + 1\n}}\nret {name}(1)') == ('', 2)
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_readme_imports(compiled, tmp_path, monkeypatch, run):
+    # The example of the README, whose b.tal defines `add`
+    monkeypatch.chdir(tmp_path)
+    cache.configure(enable=False)
+    (tmp_path / 'b.tal').write_text('fun add(a, b) {\n  ret a + b\n}\n')
+    if compiled:
+        talc.write(talon.load((tmp_path / 'b.tal').read_text()), tmp_path / 'b.talc')
+    try:
+        assert run("import('b.tal')\nprint(add(1, 2))") == ('3\n', None)
+        assert run("import('b.tal', 'b')\nprint(b.add(1, 2))") == ('3\n', None)
+    finally:
+        cache.configure()
+
+
+def test_imported_programs_are_bounded(tmp_path, monkeypatch, run):
+    # Only the programs of the files imported last are kept in memory.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(modules, 'MAX_PROGRAMS', 2)
+    monkeypatch.setattr(modules, '_programs', OrderedDict())
+    cache.configure(enable=False)
+    try:
+        for name in 'abc':
+            (tmp_path / f'{name}.tal').write_text(f'this {name} = 1\n')
+            run(f"import('{name}.tal')")
+        assert [os.path.basename(path) for path, _ in modules._programs] == ['b.tal', 'c.tal']
+
+        run("import('b.tal')")
+        run("import('a.tal')")
+        assert [os.path.basename(path) for path, _ in modules._programs] == ['b.tal', 'a.tal']
+    finally:
+        cache.configure()
+
+
+def test_declared_twice(run):
+    with pytest.raises(SymbolExists):
+        run('this dot = 1\nthis dot = 2')
+
+
+def test_assigned_builtin_is_a_variable(run):
+    with pytest.raises(SymbolExists):
+        run('min = 1\nthis min = 2')
+
+
+def test_other_interpreters_keep_builtins(run):
+    run('this mean = 0')
+    assert run('ret mean([1, 3])') == ('', 2)
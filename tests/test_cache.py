@@ -0,0 +1,108 @@
+"""
+Programs are kept on disk by `cache.py`, so an unchanged file isn't parsed
+again; anything in the cache that can't be used is a miss.
+"""
+import os
+import pytest
+from talon import bytecode, cache, talc, talon
+
+CODE = 'this a = 1\nprint(a + 1)\n'
+
+
+@pytest.fixture
+def directory(tmp_path):
+    cache.configure(path=str(tmp_path))
+    yield tmp_path
+    cache.configure()
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Count the calls to `talon.load`, which the cache saves."""
+    calls = []
+    load = talon.load
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(talon, 'load', counted)
+    return calls
+
+
+def files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_miss_then_hit(directory, parses):
+    program = cache.load(CODE)
+    assert isinstance(program, bytecode.Code)
+    assert files(directory) == [cache.key(CODE, True)]
+    assert len(parses) == 1
+
+    cached = cache.load(CODE)
+    assert len(parses) == 1
+    assert cached.instructions == program.instructions
+    assert cached.constants == program.constants
+
+
+def test_other_code_or_optimization_misses(directory, parses):
+    cache.load(CODE)
+    cache.load(CODE, optimize=False)
+    cache.load(CODE + 'print(3)\n')
+    assert len(parses) == 3
+    assert len(files(directory)) == 3
+
+
+def test_key_depends_on_format_version(monkeypatch):
+    key = cache.key(CODE, True)
+    monkeypatch.setattr(talc, 'VERSION', talc.VERSION + 1)
+    assert cache.key(CODE, True) != key
+
+
+def test_stale_file_is_a_miss(directory, parses, monkeypatch):
+    # A file of another format version under the name of the current one
+    file = directory / cache.key(CODE, True)
+    version = talc.VERSION
+    monkeypatch.setattr(talc, 'VERSION', version - 1)
+    talc.write(bytecode.compile(talon.load(CODE)), file)
+    monkeypatch.setattr(talc, 'VERSION', version)
+    del parses[:]
+
+    program = cache.load(CODE)
+    assert len(parses) == 1
+    assert isinstance(program, bytecode.Code)
+    # Written again in the current version
+    with open(file, 'rb') as f:
+        assert talc.load(f).instructions == program.instructions
+
+
+def test_damaged_file_is_a_miss(directory, parses):
+    (directory / cache.key(CODE, True)).write_bytes(b'TALC damaged')
+    cache.load(CODE)
+    assert len(parses) == 1
+    cache.load(CODE)
+    assert len(parses) == 1
+
+
+def test_eviction(directory):
+    # Programs of the same size, of which the cache has room for two
+    codes = [CODE + f'print({n})\n' for n in range(3)]
+    cache.load(codes[0])
+    first = directory / cache.key(codes[0], True)
+    cache.configure(path=str(directory), size=os.path.getsize(first) * 2)
+    os.utime(first, (0, 0))
+    cache.load(codes[1])
+    assert len(files(directory)) == 2
+
+    # The file used the longest time ago goes first
+    cache.load(codes[2])
+    assert files(directory) == sorted(cache.key(code, True) for code in codes[1:])
+
+
+def test_disabled(directory, parses):
+    cache.configure(enable=False, path=str(directory))
+    assert isinstance(cache.load(CODE), bytecode.Code)
+    cache.load(CODE)
+    assert len(parses) == 2
+    assert files(directory) == []
@@ -0,0 +1,114 @@
+"""
+Nested calls stop at the maximum call depth with `CallDepthExceeded`,
+whether they are made by Talon code or by builtins, instead of overflowing
+the stack.
+"""
+import io, sys
+import pytest
+from talon import compiler, talc, talon
+from talon.errors import CallDepthExceeded
+from talon.interpreter import Interpreter
+
+DOWN = """
+fun down(n) {
+  if (n == 0) {
+    ret 0
+  }
+  ret 1 + %s
+}
+"""
+
+
+@pytest.fixture
+def max_depth():
+    yield compiler.set_max_depth
+    compiler.set_max_depth(5000)
+
+
+@pytest.mark.parametrize('call', ['down(n - 1)', 'pmap(down, [n - 1], 1)[0]', 'await(spawn(down, n - 1))'])
+def test_nested_calls(call, max_depth, run):
+    max_depth(300)
+    assert run(DOWN % call + 'ret down(299)') == ('', 299)
+    with pytest.raises(CallDepthExceeded):
+        run(DOWN % call + 'ret down(300)')
+
+
+def test_deep_calls_through_builtins(run):
+    # Far deeper than the stack of a thread could take without a limit
+    with pytest.raises(CallDepthExceeded):
+        run(DOWN % 'pmap(down, [n - 1], 1)[0]' + 'down(40000)')
+
+
+MEMO_DOWN = """
+this down = memo((n) -> {
+  if (n == 0) {
+    ret 0
+  }
+  ret 1 + down(n - 1)
+})
+"""
+
+
+def test_memo(max_depth, run):
+    max_depth(300)
+    assert run(MEMO_DOWN + 'ret down(299)') == ('', 299)
+    with pytest.raises(CallDepthExceeded):
+        run(MEMO_DOWN + 'ret down(300)')
+
+
+def test_deep_memo(tmp_path, run):
+    code = MEMO_DOWN + 'print(down(50000))'
+    with pytest.raises(CallDepthExceeded):
+        run(code)
+
+    path = tmp_path / 'down.talc'
+    talc.write(talon.load(code), path)
+    with pytest.raises(CallDepthExceeded):
+        Interpreter(stdout=io.StringIO()).run_file(str(path))
+
+
+def test_deepest_memo(max_depth, run):
+    # Calls through builtins take some of the C stack, which the thread
+    # running the program has enough of up to the highest maximum depth.
+    max_depth(compiler.MAX_DEPTH)
+    assert run(MEMO_DOWN + f'ret down({compiler.MAX_DEPTH - 1})') == ('', compiler.MAX_DEPTH - 1)
+    with pytest.raises(ValueError):
+        max_depth(compiler.MAX_DEPTH + 1)
+
+
+def test_tail_calls(max_depth, run):
+    max_depth(10)
+    code = """
+    fun count(n, total) {
+      if (n == 0) {
+        ret total
+      }
+      ret count(n - 1, total + n)
+    }
+    ret count(100000, 0)
+    """
+    assert run(code) == ('', 5000050000)
+
+
+@pytest.mark.parametrize('compiled', [False, True], ids=['closures', 'bytecode'])
+def test_calls_from_python(compiled, tmp_path):
+    # At the default maximum depth, far deeper than Python's own recursion
+    # limit on the calling thread
+    code = DOWN % 'down(n - 1)'
+    interpreter = Interpreter()
+    if compiled:
+        path = tmp_path / 'down.talc'
+        talc.write(talon.load(code), path)
+        interpreter.run_file(str(path))
+    else:
+        interpreter.run(code)
+    down = interpreter.get('down')
+    assert down(compiler.max_depth - 1) == compiler.max_depth - 1
+    with pytest.raises(CallDepthExceeded):
+        down(compiler.max_depth)
+
+
+def test_recursion_limit_put_back(run):
+    limit = sys.getrecursionlimit()
+    run(DOWN % 'down(n - 1)' + 'down(4000)')
+    assert sys.getrecursionlimit() == limit
@@ -0,0 +1,123 @@
+"""
+The optimizer works out operators on literals, drops the code that can
+never run, and leaves alone what would be too big or fail.
+"""
+import pytest
+from talon import nodes, optimizer, talon
+
+
+def optimized(code):
+    return list(talon.load(code))
+
+
+def value(code):
+    """The optimized expression returned by `code`."""
+    [statement] = optimized(code)
+    assert isinstance(statement, nodes.ReturnInstruction)
+    return statement.expression
+
+
+@pytest.mark.parametrize('code, result', [
+    ('ret 1 + 2 * 3', 7),
+    ("ret 'a' + 'b'", 'ab'),
+    ('ret -(1 + 1)', -2),
+    ('ret 3 > 2', True),
+    ('ret !(1 == 2)', True),
+    ("ret 'ab' * 3", 'ababab'),
+    ('ret 2 ^ 10', 1024),
+    ('ret true && 1 < 2', True),
+    ('ret false || 7', 7),
+])
+def test_folding(code, result):
+    folded = value(code)
+    assert isinstance(folded, nodes.Primitive)
+    assert folded.value == result
+
+
+def test_folding_nested_in_expressions():
+    call = value('ret f([1 + 1, x], 2 * 3)')
+    assert isinstance(call, nodes.FunctionCall)
+    items = call.params[0].values
+    assert isinstance(items[0], nodes.Primitive) and items[0].value == 2
+    assert isinstance(items[1], nodes.Identifier)
+    assert call.params[1].value == 6
+
+
+def test_logical_with_known_left_side():
+    assert isinstance(value('ret true && x'), nodes.Identifier)
+    assert value('ret false && x').value is False
+    assert value('ret 1 || x').value == 1
+
+
+def test_variables_are_not_folded():
+    assert not isinstance(value('ret x + 1'), nodes.Primitive)
+
+
+@pytest.mark.parametrize('code', [
+    f"ret 'a' * {optimizer.MAX_FOLDED_SIZE + 1}",
+    f"ret {optimizer.MAX_FOLDED_SIZE + 1} * [0]",
+    f'ret 2 ^ {optimizer.MAX_FOLDED_SIZE + 1}',
+    'ret 9 ^ 9 ^ 9',
+])
+def test_too_big_to_fold(code):
+    assert not isinstance(value(code), nodes.Primitive)
+
+
+def test_just_small_enough_to_fold():
+    assert value(f"ret 'a' * {optimizer.MAX_FOLDED_SIZE}").value == 'a' * optimizer.MAX_FOLDED_SIZE
+
+
+@pytest.mark.parametrize('code, error', [
+    ('ret 1 / 0', ZeroDivisionError),
+    ("ret 'a' - 1", TypeError),
+    ('ret -[1]', TypeError),
+])
+def test_errors_are_left_to_runtime(code, error, run):
+    assert not isinstance(value(code), nodes.Primitive)
+    with pytest.raises(error):
+        run('print(1)\n' + code)
+
+
+def test_known_if():
+    statements = optimized('if (1 < 2) {\n  print(1)\n} else {\n  print(2)\n}\nprint(3)')
+    assert [type(statement) for statement in statements] == [nodes.FunctionCall, nodes.FunctionCall]
+    assert [statement.params[0].value for statement in statements] == [1, 3]
+
+    [statement] = optimized('if (false) {\n  print(1)\n} else if (true) {\n  print(2)\n}')
+    assert statement.params[0].value == 2
+
+    assert optimized('if (false) {\n  print(1)\n}') == []
+
+
+def test_unknown_if_is_kept():
+    [statement] = optimized('if (x) {\n  print(1 + 1)\n}')
+    assert isinstance(statement, nodes.If)
+    assert list(statement.true_branch)[0].params[0].value == 2
+
+
+def test_while_false():
+    assert optimized('while (1 > 2) {\n  print(1)\n}') == []
+    [statement] = optimized('while (x) {\n  print(1)\n}')
+    assert isinstance(statement, nodes.While)
+
+
+def test_dead_code_after_exit():
+    [function] = optimized('fun f() {\n  ret 1\n  print(2)\n  print(3)\n}')
+    assert [type(statement) for statement in function.value.body] == [nodes.ReturnInstruction]
+
+    [loop] = optimized('while (x) {\n  break\n  print(2)\n}')
+    assert [type(statement) for statement in loop.body] == [nodes.BreakInstruction]
+
+
+def test_dead_declarations_are_kept():
+    # `a` still belongs to `f`, and the `if` still declares `b`.
+    [function] = optimized('fun f() {\n  ret a\n  this a = 1\n}')
+    assert [type(statement) for statement in function.value.body] == [nodes.ReturnInstruction, nodes.Assignment]
+
+    [statement] = optimized('if (true) {\n  print(1)\n} else {\n  this b = 2\n}')
+    assert isinstance(statement, nodes.If)
+
+
+def test_not_optimized():
+    [statement] = list(talon.load('ret 1 + 2', optimize=False))
+    assert not isinstance(statement.expression, nodes.Primitive)
@@ -0,0 +1,119 @@
+"""
+`pmap` and `pfor` run a function on worker processes, a chunk of items at a
+time, and give back the results in order, or the error of the first item
+that failed.
+"""
+import os
+import pytest
+from talon import parallel
+from talon.errors import SymbolNotFound
+
+pytestmark = pytest.mark.skipif(not parallel.can_fork(), reason='processes can\'t be forked')
+
+
+@pytest.fixture
+def chunk_sizes(monkeypatch):
+    """Record the sizes of the chunks the items are split into."""
+    sizes = []
+    chunks = parallel.chunks
+
+    def recorded(items, size):
+        split = chunks(items, size)
+        sizes.append([len(chunk) for chunk in split])
+        return split
+
+    monkeypatch.setattr(parallel, 'chunks', recorded)
+    return sizes
+
+
+def test_results_in_order(run, chunk_sizes):
+    code = """
+    fun slow_square(n) {
+      this i = 0
+      while (i < (20 - n) * 200) {
+        i += 1
+      }
+      ret n * n
+    }
+    ret pmap(slow_square, %s, 4, 1)
+    """ % list(range(20))
+    assert run(code) == ('', [n * n for n in range(20)])
+    assert chunk_sizes == [[1] * 20]
+
+
+def test_several_processes(chunk_sizes):
+    pids = parallel.map_(lambda item: os.getpid(), range(8), 2, 4)
+    assert chunk_sizes == [[4, 4]]
+    assert os.getpid() not in pids
+    # One worker per chunk of 4
+    assert len(set(pids[:4])) == len(set(pids[4:])) == 1
+
+
+def test_default_chunks(chunk_sizes):
+    # A few chunks for each worker
+    assert parallel.map_(lambda item: item + 1, range(100), 5) == list(range(1, 101))
+    assert chunk_sizes == [[5] * 20]
+
+
+def test_more_workers_than_chunks(chunk_sizes):
+    assert parallel.map_(lambda item: item, range(3), 8, 2) == [0, 1, 2]
+    assert chunk_sizes == [[2, 1]]
+
+
+def test_first_error_is_raised(run):
+    code = """
+    fun check(n) {
+      if (n == 7) {
+        ret missing
+      }
+      if (n > 3) {
+        ret n / 0
+      }
+      ret n
+    }
+    ret pmap(check, %s, 3, 2)
+    """ % list(range(12))
+    # Items 4 and 5 fail before item 7
+    with pytest.raises(ZeroDivisionError):
+        run(code)
+
+    with pytest.raises(SymbolNotFound):
+        run(code.replace('n > 3', 'n > 9'))
+
+
+def test_unpicklable_error():
+    class Local(Exception):
+        pass
+
+    def fail(item):
+        raise Local('no')
+
+    with pytest.raises(RuntimeError, match='Local: no'):
+        parallel.map_(fail, range(4), 2, 1)
+
+
+def test_unpicklable_result():
+    with pytest.raises(TypeError, match='Only values that can be sent'):
+        parallel.map_(lambda item: lambda: item, range(4), 2, 1)
+
+
+def test_changes_stay_in_workers(run):
+    code = """
+    this seen = []
+    pfor([0, 1, 2, 3, 4, 5], (n) -> {
+      append(seen, n)
+    }, 2, 1)
+    ret seen
+    """
+    assert run(code) == ('', [])
+
+
+def test_one_worker_runs_here(run):
+    code = """
+    this seen = []
+    pfor([0, 1, 2], (n) -> {
+      append(seen, n)
+    }, 1)
+    ret seen
+    """
+    assert run(code) == ('', [0, 1, 2])
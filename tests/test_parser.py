@@ -0,0 +1,59 @@
+"""
+Newlines end instructions, except where the instruction obviously goes on:
+inside brackets, after a binary operator, and before a `{`, an `else` or a
+binary operator.
+"""
+import pytest
+from talon import talon, watch
+
+
+@pytest.mark.parametrize('code', [
+    'if (true)\n{\n  ret 1\n}',
+    'if (false)\n{\n  ret 0\n}\nelse\n{\n  ret 1\n}',
+    'if (false) {\n  ret 0\n}\nelse if (true)\n{\n  ret 1\n}',
+    'this i = 0\nwhile (i < 1)\n{\n  i += 1\n}\nret i',
+    'this i\nthis n = 0\nfor (i in [1])\n{\n  n += i\n}\nret n',
+    'fun f()\n{\n  ret 1\n}\nret f()',
+    'this f = ()\n  ->\n{\n  ret 1\n}\nret f()',
+])
+def test_braces_on_their_own_line(code, run):
+    assert run(code) == ('', 1)
+
+
+@pytest.mark.parametrize('code, value', [
+    ('this x = 1\n  + 2\nret x', 3),
+    ('this x = 10\n  - 1\n  * 2\nret x', 8),
+    ('ret 7\n  % 4', 3),
+    ('ret 8\n  / 2', 4),
+    ('ret 2\n  ^ 3', 8),
+    ('ret 1\n  == 1', True),
+    ('ret 1\n  != 1', False),
+    ('ret 1\n  < 2\n  && 2 > 3\n  || true', True),
+    ('ret 2\n  in [1, 2]', True),
+    ('ret len(1\n  to 3)', 3),
+    ('ret len(1\n  upto 3)', 2),
+])
+def test_leading_operators(code, value, run):
+    assert run(code) == ('', value)
+
+
+def test_separate_instructions(run):
+    code = """
+    this x = 1
+    this y = -x
+    this to_do = [x]
+    // a comment
+    /* another one */
+    ret [x, y, to_do]
+    """
+    assert run(code) == ('', [1, -1, [1]])
+
+
+def test_dict_after_newline(run):
+    assert run('this d = \n{\n  "a": 1\n}\nret d') == ('', {'a': 1})
+
+
+def test_boundaries():
+    code = 'this x = 1\n  + 2\nif (x)\n{\n  print(x)\n}\nprint(x)'
+    assert list(watch.boundaries(code)) == [code.index('if'), code.index('print(x)\n}') + len('print(x)\n}\n')]
+    talon.load(code)
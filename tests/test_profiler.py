@@ -0,0 +1,121 @@
+"""
+The profiler times the phases of running a file, and puts the time spent
+executing it down to lines, functions and stacks of calls.
+"""
+import io
+import pytest
+from talon.profiler import Profiler
+
+CODE = """\
+fun wait(n) {
+  sleep(n)
+}
+this i = 0
+while (i < 2) {
+  wait(0.05)
+  i += 1
+}
+sleep(0.02)
+"""
+
+
+@pytest.fixture
+def profile(tmp_path):
+    def profile(code):
+        path = tmp_path / 'program.tal'
+        path.write_text(code)
+        profiler = Profiler('main')
+        profiler.run_file(str(path))
+        return profiler
+    return profile
+
+
+def test_phases(profile):
+    profiler = profile(CODE)
+    assert list(profiler.phases) == ['load parser', 'parse', 'transform', 'optimize', 'compile', 'execute']
+    assert all(seconds >= 0 for seconds in profiler.phases.values())
+    assert profiler.phases['execute'] >= 0.12
+
+
+def test_lines(profile):
+    lines = profile(CODE).lines
+    hits, own = lines[2]
+    assert hits == 2 and own >= 0.1
+    # Without the time of the call
+    hits, own = lines[6]
+    assert hits == 2 and own < 0.05
+    hits, own = lines[9]
+    assert hits == 1 and 0.02 <= own < 0.05
+    # Without the time of its body
+    hits, own = lines[5]
+    assert hits == 1 and own < 0.05
+
+
+def test_functions(profile):
+    profiler = profile(CODE)
+    assert list(profiler.functions) == [('wait', 1)]
+    calls, total, own, running = profiler.functions['wait', 1]
+    assert (calls, running) == (2, 0)
+    assert total >= 0.1
+    # The time is in the line of its body
+    assert own < 0.05
+
+
+def test_self_times_add_up(profile):
+    profiler = profile(CODE)
+    lines = sum(own for _, own in profiler.lines.values())
+    functions = sum(own for _, _, own, _ in profiler.functions.values())
+    stacks = sum(profiler.stacks.values())
+    assert stacks == pytest.approx(profiler.phases['execute'], rel=0.05)
+    assert lines + functions <= stacks
+
+
+def test_recursion_counted_once(profile):
+    profiler = profile("""\
+fun down(n) {
+  if (n > 0) {
+    down(n - 1)
+  }
+  sleep(0.02)
+}
+down(3)
+""")
+    calls, total, _, _ = profiler.functions['down', 1]
+    assert calls == 4
+    assert 0.08 <= total < 0.15
+    assert ('main', 'down:1', 'down:1', 'down:1', 'down:1') in profiler.stacks
+
+
+def test_write_collapsed(profile):
+    profiler = profile(CODE)
+    output = io.StringIO()
+    profiler.write_collapsed(output)
+    stacks = {}
+    for line in output.getvalue().splitlines():
+        path, microseconds = line.rsplit(' ', 1)
+        stacks[path] = int(microseconds)
+
+    assert set(stacks) == {'main', 'main;wait:1'}
+    assert stacks['main;wait:1'] >= 100000
+    assert 20000 <= stacks['main'] < 50000
+    assert sum(stacks.values()) == pytest.approx(profiler.phases['execute'] * 1e6, rel=0.05)
+
+
+def test_report(profile):
+    output = io.StringIO()
+    profile(CODE).report(output)
+    report = output.getvalue()
+    assert report.startswith('Profile of main\n')
+    assert 'wait (line 1)' in report
+    assert '  sleep(n)\n' in report
+
+
+def test_error_keeps_profile(tmp_path):
+    path = tmp_path / 'program.tal'
+    path.write_text('this a = 1\nsleep(0.01)\nprint(a / 0)\n')
+    profiler = Profiler('main')
+    with pytest.raises(ZeroDivisionError):
+        profiler.run_file(str(path))
+    assert profiler.phases['execute'] >= 0.01
+    assert profiler.lines[2][0] == 1
+    assert profiler.lines[3][0] == 1
@@ -0,0 +1,240 @@
+"""
+Runs the same programs every way Talon can run them: compiled to closures
+with and without the optimizer, and compiled to bytecode, loaded from a
+`.talc` file and run by the VM, translated to Python or on its interpreter
+loop. They must all print the same thing.
+"""
+import io, pathlib, re, time
+import pytest
+from talon import bytecode, cache, talc, talon, vm
+from talon.interpreter import Interpreter
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FILES = sorted(ROOT.glob('examples/*.tal')) + sorted(ROOT.glob('talon/benchmarks/*.tal'))
+
+SNIPPETS = {
+    'arithmetic': """
+        this x = 7
+        x += 3
+        x ^= 2
+        print(x, x % 7, x / 8, -x, +(-x), 2 + 3 * 4 - 1)
+    """,
+    'closures': """
+        fun counter() {
+          this n = 0
+          ret () -> {
+            n += 1
+            ret n
+          }
+        }
+        this c = counter()
+        c()
+        c()
+        print(c(), counter()())
+        fun outer(a) {
+          fun inner(b) {
+            ret (x) -> (a + b + x)
+          }
+          ret inner(2)
+        }
+        print(outer(1)(3))
+    """,
+    'recursion': """
+        fun fib(n) {
+          if (n < 2) {
+            ret n
+          }
+          ret fib(n - 1) + fib(n - 2)
+        }
+        fun count(n, total) {
+          if (n == 0) {
+            ret total
+          }
+          ret count(n - 1, total + n)
+        }
+        print(fib(15), count(100000, 0))
+    """,
+    'empty lambdas': """
+        this f = () -> ()
+        this g = (a) -> ()
+        print(f(), g(1))
+    """,
+    'loops': """
+        this total = 0
+        this i
+        for (i in 1 to 100) {
+          if (i % 10 == 0) {
+            break
+          } else if (i % 2 == 0) {
+            total += i
+          } else {
+            total -= 1
+          }
+        }
+        while (total < 100) {
+          total *= 2
+        }
+        print(total, i)
+    """,
+    'lists': """
+        this l = [3, 1, 2]
+        append(l, 5)
+        l[0] = 4
+        l[1] += 10
+        print(l, l[1:], l[:-1], len(l), 1 upto 4, 2 to 4)
+    """,
+    'strings': """
+        this b = builder()
+        append(b, 'a')
+        append(b, 1)
+        print(str(b), join(['x', 2, 'y'], '-'), format('%0 of %1, %%0', [3, 10]))
+    """,
+    'dicts and sets': """
+        this ages = {'bob': 30, 'alice': 25}
+        ages['carol'] = 41
+        ages['bob'] += 1
+        this s = {1, 2}
+        add(s, 3)
+        delete(s, 1)
+        print(ages, get(ages, 'dave', 0), 'bob' in ages, s, 2 in s)
+    """,
+    'arrays': """
+        this a = array([1, 2, 3])
+        print(a * 2, sum(a), dot(a, [1, 1, 1]), mean(zeros(4)))
+    """,
+    'memo': """
+        this fib = memo((n) -> {
+          if (n < 2) {
+            ret n
+          }
+          ret fib(n - 1) + fib(n - 2)
+        })
+        print(fib(80))
+    """,
+}
+
+
+@pytest.fixture(autouse=True)
+def no_cache():
+    cache.configure(enable=False)
+    yield
+    cache.configure()
+
+
+def run(program, path=None, optimize=True):
+    stdout = io.StringIO()
+    result = Interpreter(optimize=optimize, stdout=stdout, stdin=io.StringIO('Bob\n')).execute(program, path)
+    return stdout.getvalue(), result
+
+
+def run_all(code, tmp_path, path=None):
+    """Run some code every way, and check that they all give the same results."""
+    optimized = run(talon.load(code, True), path)
+    assert run(talon.load(code, False), path, optimize=False) == optimized
+
+    compiled = tmp_path / 'program.talc'
+    talc.write(talon.load(code, True), compiled)
+    with open(compiled, 'rb') as f:
+        assert run(talc.load(f), path) == optimized
+    with pytest.MonkeyPatch.context() as patch, open(compiled, 'rb') as f:
+        patch.setattr(vm, 'translating', False)
+        assert run(talc.load(f), path) == optimized
+    return optimized
+
+
+@pytest.mark.parametrize('path', FILES, ids=lambda path: path.name)
+def test_files(path, tmp_path, monkeypatch):
+    # Imports are relative to the working directory.
+    monkeypatch.chdir(path.parent)
+    output, _ = run_all(path.read_text(), tmp_path, str(path))
+    assert output
+
+
+@pytest.mark.parametrize('code', SNIPPETS.values(), ids=SNIPPETS.keys())
+def test_snippets(code, tmp_path):
+    output, _ = run_all(code, tmp_path)
+    assert output
+
+
+def test_return_value(tmp_path):
+    assert run_all('ret 1 + 2', tmp_path) == ('', 3)
+
+
+def test_recompiled_talc(tmp_path):
+    # Compiling a loaded `.talc` file again decodes all of its functions.
+    code = SNIPPETS['closures']
+    first, second = tmp_path / 'first.talc', tmp_path / 'second.talc'
+    talc.write(talon.load(code), first)
+    with open(first, 'rb') as f:
+        talc.write(talc.load(f), second)
+    with open(second, 'rb') as f:
+        assert run(talc.load(f)) == run(talon.load(code))
+
+
+def test_damaged_talc(tmp_path):
+    path = tmp_path / 'damaged.talc'
+    path.write_bytes(talc.MAGIC + b'\x00' * 20)
+    with open(path, 'rb') as f, pytest.raises(ValueError):
+        talc.load(f)
+
+
+ERRORS = {
+    'operator': "this x = 1 + 'a'",
+    'operator in a function': "fun f(a) {\n  ret a * [1] - 2\n}\nf(3)",
+    'comparison': "this a = [1] < 2",
+    'in': "print(1 in 2)",
+    'compound assignment': "this x = 'a'\nx -= 1",
+    'global not found': "print(y)",
+    'local not found': "fun f() {\n  this a = b\n}\nf()",
+    'existing variable': "this x = 1\nthis x = 2",
+    'call depth': "fun f(n) {\n  ret 1 + f(n)\n}\nf(1)",
+}
+
+
+@pytest.mark.parametrize('code', ERRORS.values(), ids=ERRORS.keys())
+def test_errors(code, tmp_path):
+    with pytest.raises(Exception) as expected:
+        run(talon.load(code))
+
+    compiled = tmp_path / 'program.talc'
+    talc.write(talon.load(code), compiled)
+    for translating in (True, False):
+        with pytest.MonkeyPatch.context() as patch, open(compiled, 'rb') as f:
+            patch.setattr(vm, 'translating', translating)
+            with pytest.raises(expected.type, match=f'^{re.escape(str(expected.value))}$'):
+                run(talc.load(f))
+
+
+def test_deeply_nested_code(tmp_path):
+    # Too many nested loops for Python to compile the translated code, so it
+    # runs on the interpreter loop.
+    depth = 30
+    code = '\n'.join(f'this i{n} = 0' for n in range(depth)) + '\n'
+    for n in range(depth):
+        code += f'while (i{n} < 2) {{\n  i{n} += 1\n'
+    code += 'print(i0)\n' + '}\n' * depth
+    with pytest.raises(SyntaxError):
+        vm.Translator(bytecode.compile(talon.load(code))).factory()
+    output, _ = run_all(code, tmp_path)
+    assert output == '1\n1\n'
+
+
+def test_bytecode_faster(tmp_path):
+    code = SNIPPETS['recursion']
+    compiled = tmp_path / 'program.talc'
+    talc.write(talon.load(code), compiled)
+
+    def best(load):
+        times = []
+        for _ in range(3):
+            program = load()
+            start = time.perf_counter()
+            run(program)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def load_compiled():
+        with open(compiled, 'rb') as f:
+            return talc.load(f)
+
+    assert best(load_compiled) < best(lambda: talon.load(code))
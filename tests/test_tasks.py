@@ -0,0 +1,129 @@
+"""
+Tasks started with `spawn` and async builtins wait at the same time as the
+rest of the program, on the event loop of `tasks.py` or the one running
+`Interpreter.execute_async`.
+"""
+import asyncio, io, time
+import pytest
+from talon import tasks
+from talon.interpreter import Interpreter
+from talon.nodes import BuiltinFunc
+
+
+def test_sleep(run):
+    start = time.perf_counter()
+    assert run('sleep(0.2)\nret 1') == ('', 1)
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_tasks_wait_together(run):
+    code = """
+    fun later(value) {
+      sleep(0.3)
+      ret value
+    }
+    this started = [spawn(later, 1), spawn(later, 2), spawn(later, 3)]
+    ret await(started)
+    """
+    start = time.perf_counter()
+    assert run(code) == ('', [1, 2, 3])
+    assert time.perf_counter() - start < 0.6
+
+
+def test_task_error(run):
+    code = """
+    fun fail(n) {
+      ret n / 0
+    }
+    this task = spawn(fail, 1)
+    await(task)
+    """
+    with pytest.raises(ZeroDivisionError):
+        run(code)
+
+
+def async_builtins(interpreter, loops=None):
+    async def double(n):
+        if loops is not None:
+            loops.append(asyncio.get_running_loop())
+        await asyncio.sleep(0.2)
+        return n * 2
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError('failed')
+
+    interpreter.set('double', BuiltinFunc(double))
+    interpreter.set('fail', BuiltinFunc(fail))
+    return interpreter
+
+
+def test_async_builtin():
+    interpreter = async_builtins(Interpreter(stdout=io.StringIO()))
+    assert interpreter.run('ret double(21)') == 42
+    with pytest.raises(ValueError, match='failed'):
+        interpreter.run('fail()')
+
+
+def test_async_builtins_in_tasks():
+    interpreter = async_builtins(Interpreter(stdout=io.StringIO()))
+    start = time.perf_counter()
+    assert interpreter.run('ret await([spawn(double, 1), spawn(double, 2), spawn(double, 3)])') == [2, 4, 6]
+    assert time.perf_counter() - start < 0.4
+
+
+def test_background_loop():
+    loops = []
+    interpreter = async_builtins(Interpreter(stdout=io.StringIO()), loops)
+    interpreter.run('double(1)')
+    assert loops == [tasks.background_loop()]
+
+
+def test_execute_async():
+    loops = []
+
+    async def main():
+        interpreter = async_builtins(Interpreter(stdout=io.StringIO()), loops)
+        result = await interpreter.execute_async(interpreter.load('ret double(2)'))
+        return result, asyncio.get_running_loop()
+
+    result, loop = asyncio.run(main())
+    assert result == 4
+    # The async builtin ran on the loop of the caller
+    assert loops == [loop]
+
+
+def test_run_async_overlaps():
+    # Programs run from asyncio code don't block the loop, nor each other
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        interpreters = [async_builtins(Interpreter(stdout=io.StringIO())) for _ in range(3)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            interpreter.run_async(f'sleep(0.3)\nret double({n})') for n, interpreter in enumerate(interpreters)
+        ))
+        elapsed = time.perf_counter() - start
+        ticker.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(main())
+    assert results == [0, 2, 4]
+    assert elapsed < 0.9
+    assert ticks >= 5
+
+
+def test_run_file_async(tmp_path):
+    path = tmp_path / 'a.tal'
+    path.write_text('print(double(5))\n')
+    stdout = io.StringIO()
+    interpreter = async_builtins(Interpreter(stdout=stdout))
+    asyncio.run(interpreter.run_file_async(str(path)))
+    assert stdout.getvalue() == '10\n'
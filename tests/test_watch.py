@@ -0,0 +1,110 @@
+"""
+`watch.Document` parses only the top-level statements that changed, and
+gets the same nodes as parsing the whole code again.
+"""
+import pytest
+from lark import UnexpectedInput
+from talon import nodes, talon, watch
+
+CODE = """\
+this a = 1
+fun add(x, y) {
+  ret x + y
+}
+if (a == 1) {
+  print(add(a, 2))
+}
+print(a)
+"""
+
+
+def dump(node):
+    """The contents of nodes, which can be compared."""
+    if isinstance(node, nodes.BaseExpr):
+        return (node.__class__.__name__, {name: dump(value) for name, value in vars(node).items()})
+    if isinstance(node, (list, tuple, nodes.Instructions)):
+        return [dump(child) for child in node]
+    return node
+
+
+def update(document, code):
+    program = document.update(code)
+    assert dump(program) == dump(talon.load(code, document.optimize))
+    return program
+
+
+@pytest.fixture
+def document():
+    document = watch.Document()
+    update(document, CODE)
+    assert (document.parsed, document.total) == (4, 4)
+    return document
+
+
+def test_unchanged(document):
+    update(document, CODE)
+    assert (document.parsed, document.total) == (0, 4)
+
+
+def test_edit_before(document):
+    # The statements after the new one move down
+    update(document, 'this b = 2\n\n' + CODE)
+    assert (document.parsed, document.total) == (1, 5)
+    update(document, CODE)
+    assert (document.parsed, document.total) == (0, 4)
+
+
+def test_edit_inside(document):
+    update(document, CODE.replace('x + y', 'x * y'))
+    assert (document.parsed, document.total) == (1, 4)
+
+
+def test_edit_lines_inside(document):
+    update(document, CODE.replace('  ret x + y\n', '  this z = x + y\n\n  ret z\n'))
+    assert (document.parsed, document.total) == (1, 4)
+
+
+def test_edit_after(document):
+    update(document, CODE + 'print(add(3, 4))\n')
+    assert (document.parsed, document.total) == (1, 5)
+    update(document, CODE.replace('print(a)\n', 'print(a + 1)\n'))
+    assert (document.parsed, document.total) == (1, 4)
+
+
+def test_else_on_a_new_line(document):
+    # A newline before `else` doesn't end the `if`.
+    code = CODE.replace('}\nprint(a)', '}\nelse {\n  print(0)\n}\nprint(a)')
+    program = update(document, code)
+    assert (document.parsed, document.total) == (1, 4)
+    assert list(program)[2].false_branch is not None
+
+    update(document, CODE)
+    assert (document.parsed, document.total) == (1, 4)
+
+
+def test_same_statement_twice(document):
+    update(document, CODE + 'print(a)\n')
+    assert (document.parsed, document.total) == (1, 5)
+
+
+@pytest.mark.parametrize('broken', [
+    CODE.replace('ret x + y', 'ret x +'),
+    CODE.replace('print(a)\n', 'print(a\n'),
+    CODE.replace('}\nif', 'if'),
+])
+def test_syntax_error(document, broken):
+    with pytest.raises(UnexpectedInput) as error:
+        document.update(broken)
+    with pytest.raises(UnexpectedInput) as expected:
+        talon.load(broken)
+    assert (error.value.line, error.value.column) == (expected.value.line, expected.value.column)
+
+    # Fixing it only parses what changed since the last good version.
+    update(document, CODE.replace('this a = 1', 'this a = 2'))
+    assert (document.parsed, document.total) == (1, 4)
+
+
+def test_not_optimized():
+    document = watch.Document(optimize=False)
+    update(document, 'print(1 + 2)\n' + CODE)
+    assert (document.parsed, document.total) == (5, 5)